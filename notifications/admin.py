@@ -9,7 +9,7 @@ Notification = load_model('notifications', 'Notification')
 
 
 def mark_unread(modeladmin, request, queryset):
-    queryset.update(unread=True)
+    queryset.mark_all_as_unread()
 mark_unread.short_description = gettext_lazy('Mark selected notifications as unread')
 
 
@@ -23,7 +23,7 @@ class NotificationAdmin(AbstractNotificationAdmin):
 
     def get_queryset(self, request):
         qs = super(NotificationAdmin, self).get_queryset(request)
-        return qs.prefetch_related('actor')
+        return qs.with_related_objects('actor', 'target')
 
 
 admin.site.register(Notification, NotificationAdmin)
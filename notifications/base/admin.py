@@ -9,4 +9,4 @@ class AbstractNotificationAdmin(admin.ModelAdmin):
 
     def get_queryset(self, request):
         qs = super(AbstractNotificationAdmin, self).get_queryset(request)
-        return qs.prefetch_related('actor')
+        return qs.with_related_objects('actor', 'target')
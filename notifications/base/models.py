@@ -1,24 +1,34 @@
 # -*- coding: utf-8 -*-
 # pylint: disable=too-many-lines
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
 from django import get_version
+from django.apps import apps
 from django.conf import settings
 from django.contrib.auth.models import Group
 from django.contrib.contenttypes.models import ContentType
 from django.core.exceptions import ImproperlyConfigured
-from django.db import models
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections, models, router, transaction
+from django.db.models.fields.json import KeyTransform, compile_json_path
+from django.db.models.functions import Cast
 from django.db.models.query import QuerySet
 from django.utils import timezone
 from django.utils.html import format_html
 from django.utils.translation import gettext_lazy as _
-from jsonfield.fields import JSONField
 from model_utils import Choices
 from packaging.version import (
     parse as parse_version,  # pylint: disable=no-name-in-module,import-error
 )
-from swapper import load_model
+from swapper import get_model_name, load_model
 
 from notifications import settings as notifications_settings
-from notifications.signals import notify
+from notifications.dispatch import get_current_batch, get_dispatch_backend
+from notifications.helpers import invalidate_unread_count
+from notifications.routers import pin_to_primary
+from notifications.signals import notifications_changed, notify
+from notifications.streaming import publish_notification_changes
 from notifications.utils import id2slug
 
 if parse_version(get_version()) >= parse_version('1.8.0'):
@@ -43,6 +53,34 @@ def is_soft_delete():
     return notifications_settings.get_config()['SOFT_DELETE']
 
 
+def assert_broadcasts():
+    if not notifications_settings.get_config()['USE_BROADCASTS']:
+        msg = "To send broadcasts, please set 'USE_BROADCASTS'=True in DJANGO_NOTIFICATIONS_CONFIG."
+        raise ImproperlyConfigured(msg)
+
+
+def deliver_broadcasts(user):
+    """
+    Create the notifications of ``user`` for the broadcasts sent since they
+    last loaded their notifications. The views call it; call it before
+    querying ``user.notifications`` in your own code, the queryset methods
+    do not include the undelivered broadcasts.
+    """
+    if not notifications_settings.get_config()['USE_BROADCASTS']:
+        return 0
+    return apps.get_model('notifications', 'Broadcast').objects.deliver(user)
+
+
+def pending_broadcasts(user):
+    """
+    Return the broadcasts of ``user`` not delivered yet, for the read-only
+    callers such as the template tags, or ``None`` without ``USE_BROADCASTS``.
+    """
+    if not notifications_settings.get_config()['USE_BROADCASTS']:
+        return None
+    return apps.get_model('notifications', 'Broadcast').objects.pending(user)
+
+
 def assert_soft_delete():
     if not is_soft_delete():
         # msg = """To use 'deleted' field, please set 'SOFT_DELETE'=True in settings.
@@ -52,8 +90,96 @@ def assert_soft_delete():
         raise ImproperlyConfigured(msg)
 
 
+def _list_changed_notifications():
+    """
+    Whether the queryset changes send the ids of the changed notifications
+    with ``notifications_changed``, which locks the rows while they are
+    listed: only for the change log and the streams.
+    """
+    config = notifications_settings.get_config()
+    return bool(config['USE_CHANGE_LOG'] or config['STREAM_BACKEND'] or config['CHANNEL_LAYER'])
+
+
+RELATED_OBJECTS = ('actor', 'target', 'action_object')
+
+
+def _load_objects(object_ids, using=None):
+    """
+    Load the objects of ``object_ids``, a dict of sets of object ids by
+    content type id, with one query per content type. Return them in a
+    dict by ``(content type id, str(pk))``.
+    """
+    objects = {}
+    for content_type_id, ids in object_ids.items():
+        model = ContentType.objects.db_manager(using).get_for_id(content_type_id).model_class()
+        if model is None:  # Stale content type
+            continue
+        pk_field = model._meta.pk  # pylint: disable=protected-access
+        queryset = model._base_manager.using(using or router.db_for_read(model))  # pylint: disable=protected-access
+        for obj in queryset.filter(pk__in={pk_field.to_python(pk) for pk in ids}):
+            objects[content_type_id, str(obj.pk)] = obj
+    return objects
+
+
+class DataKey(KeyTransform):
+    """
+    The value of the ``key`` key of the ``data`` of the notifications, for
+    ``filter_data()`` and the indexes of ``data_index()``. The JSON path is
+    written in the SQL on SQLite, which only matches the queries with the
+    expression indexes when they are the same.
+    """
+    def __init__(self, key, field='data'):
+        super().__init__(key, field)
+
+    def as_sqlite(self, compiler, connection):
+        lhs, params, key_transforms = self.preprocess_lhs(compiler, connection)
+        if params:
+            return super().as_sqlite(compiler, connection)
+        path = "'%s'" % compile_json_path(key_transforms).replace("'", "''").replace('%', '%%')
+        datatype_values = getattr(connection.ops, 'jsonfield_datatype_values', None)
+        if datatype_values is None:  # Django < 4.0
+            return 'JSON_EXTRACT(%s, %s)' % (lhs, path), ()
+        # The SQL of KeyTransform, with the values sorted to always be the same
+        datatype_values = ','.join(repr(value) for value in sorted(datatype_values))
+        return (
+            '(CASE WHEN JSON_TYPE(%s, %s) IN (%s) THEN JSON_TYPE(%s, %s) ELSE JSON_EXTRACT(%s, %s) END)'
+            % (lhs, path, datatype_values, lhs, path, lhs, path)
+        ), ()
+
+
+def data_index(key, name):
+    """
+    Return an expression index on the ``key`` key of ``data``, for the
+    ``Meta.indexes`` of a notification model or an ``AddIndex`` migration.
+    """
+    return models.Index(DataKey(key), name=name)
+
+
 class NotificationQuerySet(models.query.QuerySet):
     ''' Notification QuerySet '''
+
+    def with_related_objects(self, *names):
+        """
+        Load the actor, target and action object of the notifications, or
+        only the ones of ``names``, along with them, with one query per
+        content type of each of them instead of one per row.
+        """
+        return self.prefetch_related(*(names or RELATED_OBJECTS))
+
+    def filter_data(self, **lookups):
+        """
+        Filter on keys of ``data``, eg ``filter_data(thread_id=42)`` or
+        ``filter_data(thread_id__in=[42, 43])``, with the expressions of the
+        ``data_index()`` indexes.
+        """
+        aliases, filters = {}, {}
+        for lookup, value in lookups.items():
+            key, _, suffix = lookup.partition('__')
+            alias = 'data_key_%s' % key
+            aliases[alias] = DataKey(key)
+            filters['%s__%s' % (alias, suffix) if suffix else alias] = value
+        return self.alias(**aliases).filter(**filters)
+
     def unsent(self):
         return self.filter(emailed=False)
 
@@ -61,7 +187,10 @@ class NotificationQuerySet(models.query.QuerySet):
         return self.filter(emailed=True)
 
     def unread(self, include_deleted=False):
-        """Return only unread items in the current queryset"""
+        """
+        Return only unread items in the current queryset. The broadcasts are
+        only included once delivered: call ``deliver_broadcasts(user)`` first.
+        """
         if is_soft_delete() and not include_deleted:
             return self.filter(unread=True, deleted=False)
 
@@ -89,7 +218,7 @@ class NotificationQuerySet(models.query.QuerySet):
         if recipient:
             qset = qset.filter(recipient=recipient)
 
-        return qset.update(unread=False)
+        return qset._change_state('read', unread=False)  # pylint: disable=protected-access
 
     def mark_all_as_unread(self, recipient=None):
         """Mark as unread any read messages in the current queryset.
@@ -101,7 +230,7 @@ class NotificationQuerySet(models.query.QuerySet):
         if recipient:
             qset = qset.filter(recipient=recipient)
 
-        return qset.update(unread=True)
+        return qset._change_state('unread', unread=True)  # pylint: disable=protected-access
 
     def deleted(self):
         """Return only deleted items in the current queryset"""
@@ -122,7 +251,7 @@ class NotificationQuerySet(models.query.QuerySet):
         if recipient:
             qset = qset.filter(recipient=recipient)
 
-        return qset.update(deleted=True)
+        return qset._change_state('deleted', deleted=True)  # pylint: disable=protected-access
 
     def mark_all_as_active(self, recipient=None):
         """Mark current queryset as active(un-deleted).
@@ -133,7 +262,45 @@ class NotificationQuerySet(models.query.QuerySet):
         if recipient:
             qset = qset.filter(recipient=recipient)
 
-        return qset.update(deleted=False)
+        return qset._change_state('active', deleted=False)  # pylint: disable=protected-access
+
+    def _changed_rows(self, db):
+        """
+        Return the recipients and the ids of the notifications about to
+        change, for ``notifications_changed``. The rows are only locked and
+        listed when the ids are needed, see ``_list_changed_notifications()``;
+        otherwise the ids are ``None`` and each recipient is listed once.
+        """
+        queryset = self.using(db).order_by()
+        if not _list_changed_notifications():
+            return list(queryset.values_list('recipient_id', flat=True).distinct()), None
+        rows = list(queryset.select_for_update().values_list('recipient_id', 'pk'))
+        return [row[0] for row in rows], [row[1] for row in rows]
+
+    def _change_state(self, action, **values):
+        """
+        Update ``values`` on the current queryset and send
+        ``notifications_changed`` with the rows that changed.
+        """
+        db = router.db_for_write(self.model, **self._hints)  # pylint: disable=protected-access
+        with transaction.atomic(using=db, savepoint=_list_changed_notifications()):
+            recipients, notifications = self._changed_rows(db)
+            count = self.using(db).update(**values)
+            if recipients:
+                _send_changed(self.model, action, recipients, notifications)
+        return count
+
+    def delete(self):
+        db = router.db_for_write(self.model, **self._hints)  # pylint: disable=protected-access
+        with transaction.atomic(using=db, savepoint=_list_changed_notifications()):
+            recipients, notifications = self._changed_rows(db)
+            result = super().delete()
+            if recipients:
+                _send_changed(self.model, 'deleted', recipients, notifications)
+        return result
+
+    delete.alters_data = True
+    delete.queryset_only = True
 
     def mark_as_unsent(self, recipient=None):
         qset = self.sent()
@@ -147,6 +314,42 @@ class NotificationQuerySet(models.query.QuerySet):
             qset = qset.filter(recipient=recipient)
         return qset.update(emailed=True)
 
+    def summary(self):
+        """
+        Return the number of notifications in the current queryset in total,
+        per level and per verb, computed with a single ``GROUP BY``::
+
+            {'total': 3, 'levels': {'info': 2, 'warning': 1, ...}, 'verbs': {'commented': 3}}
+        """
+        summary = {'total': 0, 'levels': {level: 0 for level, _ in self.model.LEVELS}, 'verbs': {}}
+        for level, verb, count in self.order_by().values_list('level', 'verb').annotate(count=models.Count('pk')):
+            summary['total'] += count
+            summary['levels'][level] = summary['levels'].get(level, 0) + count
+            summary['verbs'][verb] = summary['verbs'].get(verb, 0) + count
+        return summary
+
+    def unread_summary(self):
+        """Return the ``summary()`` of the unread notifications of the current queryset."""
+        return self.unread().summary()
+
+    def counts_for_users(self, users):
+        """
+        Return a dict of the number of notifications in the current queryset
+        of each user of ``users``, by primary key, computed with a single
+        ``GROUP BY``. ``users`` is a list of users or primary keys, or a
+        queryset of users, in which case the users without notifications
+        are left out rather than listed first.
+        """
+        if isinstance(users, QuerySet):
+            counts = {}
+            queryset = self.filter(recipient__in=users)
+        else:
+            user_pks = [getattr(user, 'pk', user) for user in users]
+            counts = dict.fromkeys(user_pks, 0)
+            queryset = self.filter(recipient__in=user_pks)
+        counts.update(queryset.order_by().values_list('recipient').annotate(count=models.Count('pk')))
+        return counts
+
 
 class AbstractNotification(models.Model):
     """
@@ -186,8 +389,9 @@ class AbstractNotification(models.Model):
         related_name='notifications',
         verbose_name=_('recipient'),
         blank=False,
+        db_index=False,  # Prefix of the recipient indexes below
     )
-    unread = models.BooleanField(_('unread'), default=True, blank=False, db_index=True)
+    unread = models.BooleanField(_('unread'), default=True, blank=False)
 
     actor_content_type = models.ForeignKey(
         ContentType,
@@ -228,19 +432,25 @@ class AbstractNotification(models.Model):
 
     timestamp = models.DateTimeField(_('timestamp'), default=timezone.now, db_index=True)
 
-    public = models.BooleanField(_('public'), default=True, db_index=True)
-    deleted = models.BooleanField(_('deleted'), default=False, db_index=True)
-    emailed = models.BooleanField(_('emailed'), default=False, db_index=True)
+    public = models.BooleanField(_('public'), default=True)
+    deleted = models.BooleanField(_('deleted'), default=False)
+    emailed = models.BooleanField(_('emailed'), default=False)
 
-    data = JSONField(_('data'), blank=True, null=True)
+    data = models.JSONField(_('data'), blank=True, null=True, encoder=DjangoJSONEncoder)
 
     objects = NotificationQuerySet.as_manager()
 
     class Meta:
         abstract = True
         ordering = ('-timestamp',)
-        # speed up notifications count query
-        index_together = ('recipient', 'unread')
+        # Named after each subclass, cut to fit the 30 characters of an index name
+        indexes = [
+            # The lists of a recipient, newest first
+            models.Index(fields=['recipient', '-timestamp'], name='%(app_label).10s_%(class).10s_recip'),
+            # The unread lists and counts, from the few unread rows only
+            models.Index(fields=['recipient', '-timestamp'], condition=models.Q(unread=True),
+                         name='%(app_label).10s_%(class).10s_unread'),
+        ]
         verbose_name = _('Notification')
         verbose_name_plural = _('Notifications')
 
@@ -275,12 +485,23 @@ class AbstractNotification(models.Model):
     def mark_as_read(self):
         if self.unread:
             self.unread = False
-            self.save()
+            with transaction.atomic(using=router.db_for_write(type(self), instance=self)):
+                self.save(update_fields=['unread'])
+                _send_changed(type(self), 'read', [self.recipient_id], [self.pk])
 
     def mark_as_unread(self):
         if not self.unread:
             self.unread = True
-            self.save()
+            with transaction.atomic(using=router.db_for_write(type(self), instance=self)):
+                self.save(update_fields=['unread'])
+                _send_changed(type(self), 'unread', [self.recipient_id], [self.pk])
+
+    def delete(self, *args, **kwargs):  # pylint: disable=arguments-differ
+        recipient_id, pk = self.recipient_id, self.pk
+        with transaction.atomic(using=router.db_for_write(type(self), instance=self)):
+            result = super().delete(*args, **kwargs)
+            _send_changed(type(self), 'deleted', [recipient_id], [pk])
+        return result
 
     def actor_object_url(self):
         try:
@@ -310,67 +531,390 @@ class AbstractNotification(models.Model):
             return self.target_object_id
 
 
-def notify_handler(verb, **kwargs):
+class AbstractBigIntegerIdNotification(AbstractNotification):
     """
-    Handler function to create Notification instance upon action signal call.
+    A notification storing the object ids of its actor, target and action
+    object in ``BigIntegerField`` columns instead of text, for projects
+    whose notifications only refer to models with integer primary keys.
+    Subclass it in a custom notification model.
+    """
+    actor_object_id = models.BigIntegerField(_('actor object id'))
+    target_object_id = models.BigIntegerField(_('target object id'), blank=True, null=True)
+    action_object_object_id = models.BigIntegerField(_('action object object id'), blank=True, null=True)
+
+    class Meta(AbstractNotification.Meta):
+        abstract = True
+
+
+def _send_changed(Notification, action, recipients, notifications=None):
+    notifications_changed.send(
+        sender=Notification, action=action, recipients=recipients, notifications=notifications)
+
+
+def _send_created(Notification, new_notifications):
+    pks = [notification.pk for notification in new_notifications]
+    _send_changed(
+        Notification, 'created',
+        [notification.recipient_id for notification in new_notifications],
+        None if None in pks else pks,
+    )
+
+
+def _pop_notification_fields(Notification, verb, kwargs):
+    """
+    Pull the notification options out of ``kwargs``.
+
+    Return a dict of field values shared by every recipient, the
+    ``(prefix, obj, for_concrete_model)`` triples whose content types still
+    have to be resolved, and the extra attributes to set on each instance.
+    Whatever remains in ``kwargs`` is the extra data.
     """
-    # Pull the options out of kwargs
-    kwargs.pop('signal', None)
-    recipient = kwargs.pop('recipient')
     actor = kwargs.pop('sender')
-    optional_objs = [
-        (kwargs.pop(opt, None), opt)
-        for opt in ('target', 'action_object')
+    content_objects = [('actor', actor, kwargs.pop('actor_for_concrete_model', True))]
+    for opt in ('target', 'action_object'):
+        obj = kwargs.pop(opt, None)
+        for_concrete_model = kwargs.pop(f'{opt}_for_concrete_model', True)
+        if obj is not None:
+            content_objects.append((opt, obj, for_concrete_model))
+
+    fields = {
+        'verb': str(verb),
+        'public': bool(kwargs.pop('public', True)),
+        'description': kwargs.pop('description', None),
+        'timestamp': kwargs.pop('timestamp', timezone.now()),
+        'level': kwargs.pop('level', Notification.LEVELS.info),
+    }
+    for prefix, obj, _ in content_objects:
+        fields['%s_object_id' % prefix] = obj.pk
+
+    extra_attrs = {}
+    if kwargs and EXTRA_DATA:
+        # set kwargs as model column if available
+        for key in list(kwargs.keys()):
+            if hasattr(Notification, key):
+                extra_attrs[key] = kwargs.pop(key)
+        extra_attrs['data'] = kwargs
+
+    return fields, content_objects, extra_attrs
+
+
+def _get_recipients(recipient):
+    """Turn the ``recipient`` argument into an iterable of users."""
+    if isinstance(recipient, Group):
+        return recipient.user_set.all()
+    if isinstance(recipient, (QuerySet, list)):
+        return recipient
+    return [recipient]
+
+
+def _new_notification(Notification, recipient, fields, extra_attrs):
+    newnotify = Notification(recipient=recipient, **fields)
+    for key, value in extra_attrs.items():
+        setattr(newnotify, key, value)
+    return newnotify
+
+
+def _insert_select(Notification, queryset, copied, prototype):
+    """
+    Create one notification per row of ``queryset`` with a single
+    ``INSERT ... SELECT`` statement, without loading the rows into Python.
+
+    ``copied`` maps Notification field names to the ``queryset`` fields they
+    are copied from; the other fields take their value from ``prototype``,
+    an unsaved notification. Return the number of notifications created.
+    """
+    connection = connections[router.db_for_write(Notification)]
+    opts = queryset.model._meta
+    copied = dict(copied)
+    for name, source in copied.items():
+        field = Notification._meta.get_field(name)
+        if source != 'pk' and field.db_type(connection) != opts.get_field(source).db_type(connection):
+            # Eg text object ids copied to integer ones
+            queryset = queryset.annotate(**{'cast_' + name: Cast(source, field.clone())})
+            copied[name] = 'cast_' + name
+    copied_fields = [Notification._meta.get_field(name) for name in copied]
+    source_columns = [
+        opts.pk.column if name == 'pk' else name if name.startswith('cast_') else opts.get_field(name).column
+        for name in copied.values()
     ]
-    public = bool(kwargs.pop('public', True))
-    description = kwargs.pop('description', None)
-    timestamp = kwargs.pop('timestamp', timezone.now())
+    constant_fields = [
+        field for field in Notification._meta.local_concrete_fields
+        if field not in copied_fields and field is not Notification._meta.auto_field
+    ]
+    params = [
+        field.get_db_prep_save(field.pre_save(prototype, True), connection=connection)
+        for field in constant_fields
+    ]
+    source_sql, source_params = queryset.order_by().values(*copied.values()).query.get_compiler(
+        connection=connection).as_sql()
+
+    qn = connection.ops.quote_name
+    sql = 'INSERT INTO %s (%s) SELECT %s FROM (%s) %s' % (
+        qn(Notification._meta.db_table),
+        ', '.join(qn(field.column) for field in copied_fields + constant_fields),
+        ', '.join(
+            ['%s.%s' % (qn('source'), qn(column)) for column in source_columns] + ['%s'] * len(constant_fields)
+        ),
+        source_sql,
+        qn('source'),
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params + list(source_params))
+        return cursor.rowcount
+
+
+def _resolve_notification_fields(Notification, verb, kwargs):
+    """
+    Same as ``_pop_notification_fields`` with the content types resolved,
+    once for all recipients.
+    """
+    fields, content_objects, extra_attrs = _pop_notification_fields(Notification, verb, kwargs)
+    for prefix, obj, for_concrete_model in content_objects:
+        fields['%s_content_type' % prefix] = ContentType.objects.get_for_model(
+            obj, for_concrete_model=for_concrete_model)
+    return fields, extra_attrs
+
+
+def _create_broadcast(verb, kwargs):
+    assert_broadcasts()
+    recipient = kwargs.pop('recipient', None)
+    if recipient is not None and not isinstance(recipient, Group):
+        raise ValueError('A broadcast recipient must be a Group, or None for all users.')
+    Notification = load_model('notifications', 'Notification')
+    Broadcast = apps.get_model('notifications', 'Broadcast')
+    fields, extra_attrs = _resolve_notification_fields(Notification, verb, kwargs)
+    broadcast = Broadcast(group=recipient, data=extra_attrs.get('data'), **fields)
+    broadcast.save()
+    # Not delivered yet, but the live API must not answer 304 any more
+    invalidate_unread_count(None)
+    return broadcast
+
+
+def _coalesce_notifications(verb, kwargs):
+    """
+    Update the recipient's unread notification with the same verb and target
+    sent within ``COALESCE_WINDOW`` seconds, if any, instead of creating a
+    new one. Its ``data`` keeps the number of distinct actors, their keys
+    and the latest ones.
+    """
+    Notification = load_model('notifications', 'Notification')
+    recipient = kwargs.pop('recipient')
+    kwargs.pop('insert_select', None)
+    fields, extra_attrs = _resolve_notification_fields(Notification, verb, kwargs)
+    config = notifications_settings.get_config()
+    since = fields['timestamp'] - timedelta(seconds=config['COALESCE_WINDOW'])
+    actor = [fields['actor_content_type'].pk, str(fields['actor_object_id'])]
+    actor_key = '%s:%s' % tuple(actor)
+
+    db = router.db_for_write(Notification)
+    notifications = []
+    for user in _get_recipients(recipient):
+        with transaction.atomic(using=db):
+            # Lock the recipient, a row which always exists, so that
+            # concurrent senders wait for each other instead of both
+            # creating the notification when there is none yet
+            list(type(user)._base_manager.using(db).select_for_update().filter(  # pylint: disable=protected-access
+                pk=user.pk).values_list('pk', flat=True))
+            # And the notification, not to lose the changes of other writers
+            notification = Notification.objects.using(db).unread().select_for_update().filter(
+                recipient=user,
+                verb=fields['verb'],
+                target_content_type=fields.get('target_content_type'),
+                target_object_id=fields.get('target_object_id'),
+                timestamp__gte=since,
+            ).order_by('-timestamp').first()
+
+            if notification is None:
+                action = 'created'
+                notification = _new_notification(Notification, user, fields, extra_attrs)
+                data = dict(notification.data or {}, actor_count=1, actor_keys=[actor_key], actors=[actor])
+            else:
+                action = 'updated'
+                data = dict(notification.data or {}, **extra_attrs.get('data', {}))
+                actors = data.get('actors', [])
+                # All the keys, the actors beyond COALESCE_MAX_ACTORS must
+                # not be counted again
+                if actor_key not in data.get('actor_keys', []):
+                    data['actor_keys'] = data.get('actor_keys', []) + [actor_key]
+                    data['actor_count'] = len(data['actor_keys'])
+                data['actors'] = ([actor] + [other for other in actors if other != actor])[
+                    :config['COALESCE_MAX_ACTORS']]
+                for name, value in fields.items():
+                    setattr(notification, name, value)
+                for name, value in extra_attrs.items():
+                    setattr(notification, name, value)
+            notification.data = data
+            notification.save()
+            _send_changed(Notification, action, [notification.recipient_id], [notification.pk])
+        notifications.append(notification)
+    return notifications
+
+
+def build_notifications(verb, **kwargs):
+    """
+    Return the unsaved notifications described by the arguments of
+    ``notify.send``, one per recipient.
+    """
+    recipient = kwargs.pop('recipient')
+    kwargs.pop('insert_select', None)
     Notification = load_model('notifications', 'Notification')
-    level = kwargs.pop('level', Notification.LEVELS.info)
-    actor_for_concrete_model = kwargs.pop('actor_for_concrete_model', True)
+    fields, extra_attrs = _resolve_notification_fields(Notification, verb, kwargs)
+    return [
+        _new_notification(Notification, recipient, fields, extra_attrs)
+        for recipient in _get_recipients(recipient)
+    ]
+
+
+def create_notifications(verb, **kwargs):
+    """
+    Create the notifications described by the arguments of ``notify.send``.
+
+    This is what the dispatch backends eventually call.
+    """
+    if kwargs.pop('broadcast', False):
+        return _create_broadcast(verb, kwargs)
+    if kwargs.pop('coalesce', False):
+        return _coalesce_notifications(verb, kwargs)
+
+    Notification = load_model('notifications', 'Notification')
+    recipient = kwargs['recipient']
+    insert_select = kwargs.pop('insert_select', False)
+
+    if insert_select and isinstance(recipient, (Group, QuerySet)):
+        del kwargs['recipient']
+        fields, extra_attrs = _resolve_notification_fields(Notification, verb, kwargs)
+        users = recipient.user_set.all() if isinstance(recipient, Group) else recipient
+        prototype = _new_notification(Notification, None, fields, extra_attrs)
+        count = _insert_select(Notification, users, {'recipient': 'pk'}, prototype)
+        _send_changed(Notification, 'created', users.order_by().values_list('pk', flat=True))
+        return count
+
+    new_notifications = build_notifications(verb, **kwargs)
+
+    config = notifications_settings.get_config()
+    if config['BULK_CREATE']:
+        # One INSERT per batch instead of one per recipient. Note that
+        # bulk_create() does not call save() nor send pre/post_save signals.
+        new_notifications = Notification.objects.bulk_create(
+            new_notifications, batch_size=config['BULK_CREATE_BATCH_SIZE'])
+    else:
+        for newnotify in new_notifications:
+            newnotify.save()
+    _send_created(Notification, new_notifications)
+
+    if insert_select:
+        # Callers who opted in get a count back whatever the recipient type
+        return len(new_notifications)
+    return new_notifications
+
+
+async def _aget_content_type(obj, for_concrete_model):
+    """
+    Async counterpart of ``ContentType.objects.get_for_model``, sharing its
+    cache.
+    """
+    manager = ContentType.objects
+    opts = manager._get_opts(obj, for_concrete_model)  # pylint: disable=protected-access
+    try:
+        return manager._get_from_cache(opts)  # pylint: disable=protected-access
+    except KeyError:
+        pass
+    content_type, _ = await manager.aget_or_create(app_label=opts.app_label, model=opts.model_name)
+    manager._add_to_cache(manager.db, content_type)  # pylint: disable=protected-access
+    return content_type
+
+
+async def anotify(sender, **kwargs):
+    """
+    Create notifications from async code.
+
+    Takes the same arguments as ``notify.send(sender, **kwargs)`` and returns
+    what ``create_notifications`` returns. The notifications are always
+    created immediately, whatever the dispatch backend, and other receivers
+    of the ``notify`` signal are not called.
+    """
+    if parse_version(get_version()) < parse_version('4.1') or kwargs.get('broadcast') or kwargs.get('coalesce'):
+        # No async ORM before Django 4.1, nor async select_for_update()
+        return await sync_to_async(create_notifications)(sender=sender, **kwargs)
+
+    verb = kwargs.pop('verb')
+    recipient = kwargs.pop('recipient')
+    insert_select = kwargs.pop('insert_select', False)
+    kwargs['sender'] = sender
+    Notification = load_model('notifications', 'Notification')
+    fields, content_objects, extra_attrs = _pop_notification_fields(Notification, verb, kwargs)
+
+    for prefix, obj, for_concrete_model in content_objects:
+        fields['%s_content_type' % prefix] = await _aget_content_type(obj, for_concrete_model)
 
-    # Check if User or Group
     if isinstance(recipient, Group):
-        recipients = recipient.user_set.all()
-    elif isinstance(recipient, (QuerySet, list)):
-        recipients = recipient
+        recipient = recipient.user_set.all()
+    if isinstance(recipient, QuerySet):
+        if insert_select:
+            prototype = _new_notification(Notification, None, fields, extra_attrs)
+            count = await sync_to_async(_insert_select)(Notification, recipient, {'recipient': 'pk'}, prototype)
+            await sync_to_async(_send_changed)(
+                Notification, 'created', recipient.order_by().values_list('pk', flat=True))
+            return count
+        recipients = [user async for user in recipient]
     else:
-        recipients = [recipient]
-
-    new_notifications = []
-
-    for recipient in recipients:
-        newnotify = Notification(
-            recipient=recipient,
-            actor_content_type=ContentType.objects.get_for_model(actor, for_concrete_model=actor_for_concrete_model),
-            actor_object_id=actor.pk,
-            verb=str(verb),
-            public=public,
-            description=description,
-            timestamp=timestamp,
-            level=level,
-        )
-
-        # Set optional objects
-        for obj, opt in optional_objs:
-            if obj is not None:
-                for_concrete_model = kwargs.pop(f'{opt}_for_concrete_model', True)
-                setattr(newnotify, '%s_object_id' % opt, obj.pk)
-                setattr(newnotify, '%s_content_type' % opt,
-                        ContentType.objects.get_for_model(obj, for_concrete_model=for_concrete_model))
-
-        if kwargs and EXTRA_DATA:
-            # set kwargs as model column if available
-            for key in list(kwargs.keys()):
-                if hasattr(newnotify, key):
-                    setattr(newnotify, key, kwargs.pop(key))
-            newnotify.data = kwargs
-
-        newnotify.save()
-        new_notifications.append(newnotify)
+        recipients = _get_recipients(recipient)
 
+    new_notifications = [
+        _new_notification(Notification, recipient, fields, extra_attrs)
+        for recipient in recipients
+    ]
+
+    config = notifications_settings.get_config()
+    if config['BULK_CREATE']:
+        new_notifications = await Notification.objects.abulk_create(
+            new_notifications, batch_size=config['BULK_CREATE_BATCH_SIZE'])
+    else:
+        for newnotify in new_notifications:
+            if hasattr(newnotify, 'asave'):  # Django >= 4.2
+                await newnotify.asave()
+            else:
+                await sync_to_async(newnotify.save)()
+    if notifications_changed.has_listeners(Notification):
+        await sync_to_async(_send_created)(Notification, new_notifications)
+
+    if insert_select:
+        return len(new_notifications)
     return new_notifications
 
 
+def notify_handler(verb, **kwargs):
+    """
+    Handler function to create Notification instance upon action signal call.
+    """
+    kwargs.pop('signal', None)
+    batch = get_current_batch()
+    if batch is not None:
+        return batch.add(verb, kwargs)
+    return get_dispatch_backend().dispatch(verb, **kwargs)
+
+
+def invalidate_cached_unread_counts(sender, recipients, **kwargs):  # pylint: disable=unused-argument
+    invalidate_unread_count(recipients)
+
+
+def invalidate_saved_unread_count(sender, instance, using, raw=False, **kwargs):  # pylint: disable=unused-argument
+    # save() outside of the helpers, e.g. from the admin, sends no notifications_changed
+    if not raw:
+        invalidate_unread_count([instance.recipient_id], using=using)
+
+
+def pin_recipients_to_primary(sender, recipients, **kwargs):  # pylint: disable=unused-argument
+    # Also keeps the replica from caching a stale unread count
+    pin_to_primary(recipients)
+
+
 # connect the signal
 notify.connect(notify_handler, dispatch_uid='notifications.models.notification')
+notifications_changed.connect(
+    invalidate_cached_unread_counts, dispatch_uid='notifications.models.unread_count_cache')
+models.signals.post_save.connect(
+    invalidate_saved_unread_count, sender=get_model_name('notifications', 'Notification'),
+    dispatch_uid='notifications.models.saved_unread_count')
+notifications_changed.connect(publish_notification_changes, dispatch_uid='notifications.models.stream')
+notifications_changed.connect(pin_recipients_to_primary, dispatch_uid='notifications.models.read_your_writes')
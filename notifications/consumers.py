@@ -0,0 +1,85 @@
+''' Django notifications Channels consumers '''
+# -*- coding: utf-8 -*-
+import json
+
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from channels.layers import get_channel_layer
+from django.core.serializers.json import DjangoJSONEncoder
+
+from notifications.base.models import deliver_broadcasts
+from notifications.helpers import get_notification_dict, get_unread_count
+from notifications.settings import get_config
+
+
+def get_group_name(user_id):
+    """Return the group of the consumers of ``user_id``, or of every consumer if ``None``."""
+    return 'notifications_%s' % ('all' if user_id is None else user_id)
+
+
+def send_to_group(user_id, event):
+    """Send a change event to the consumers of ``user_id`` through ``CHANNEL_LAYER``."""
+    channel_layer = get_channel_layer(get_config()['CHANNEL_LAYER'])
+    async_to_sync(channel_layer.group_send)(
+        get_group_name(user_id), {'type': 'notifications.changed', 'event': event})
+
+
+class NotificationConsumer(AsyncJsonWebsocketConsumer):
+    """
+    Push the unread count of the user, and their new notifications, as JSON
+    messages::
+
+        {"type": "unread_count", "unread_count": 2}
+        {"type": "notification", "notification": {...}}
+
+    The unread count is sent on connection and after every change. Requires
+    ``AuthMiddlewareStack`` and ``CHANNEL_LAYER``; anonymous users are
+    rejected.
+    """
+    @property
+    def channel_layer_alias(self):
+        return get_config()['CHANNEL_LAYER']
+
+    @classmethod
+    async def encode_json(cls, content):
+        # Like the JsonResponse of the views, for the timestamps
+        return json.dumps(content, cls=DjangoJSONEncoder)
+
+    async def connect(self):
+        self.user = await database_sync_to_async(self.get_user)()
+        if self.user is None:
+            await self.close()
+            return
+        self.notification_groups = [get_group_name(self.user.pk), get_group_name(None)]
+        for group in self.notification_groups:
+            await self.channel_layer.group_add(group, self.channel_name)
+        await self.accept()
+        await self.send_json(await database_sync_to_async(self.get_snapshot)())
+
+    async def disconnect(self, code):
+        for group in getattr(self, 'notification_groups', ()):
+            await self.channel_layer.group_discard(group, self.channel_name)
+
+    async def notifications_changed(self, message):
+        for content in await database_sync_to_async(self.get_changes)(message['event']):
+            await self.send_json(content)
+
+    def get_user(self):
+        user = self.scope.get('user')
+        if user is None or not user.is_authenticated:
+            return None
+        return user
+
+    def get_snapshot(self):
+        deliver_broadcasts(self.user)
+        return {'type': 'unread_count', 'unread_count': get_unread_count(self.user)}
+
+    def get_changes(self, event):
+        contents = []
+        if event['action'] in ('created', 'updated') and event['notifications']:
+            notifications = self.user.notifications.filter(pk__in=event['notifications']).with_related_objects()
+            for notification in notifications:
+                contents.append({'type': 'notification', 'notification': get_notification_dict(notification, None)})
+        contents.append({'type': 'unread_count', 'unread_count': get_unread_count(self.user)})
+        return contents
@@ -0,0 +1,269 @@
+''' Django notifications dispatch backends '''
+# -*- coding: utf-8 -*-
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ContextDecorator
+from contextvars import ContextVar
+from functools import lru_cache
+
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.contrib.contenttypes.models import ContentType
+from django.db import close_old_connections, connections, router, transaction
+from django.db.models import F
+from django.db.models.query import QuerySet
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from swapper import load_model
+
+from notifications import settings as notifications_settings
+
+logger = logging.getLogger(__name__)
+
+CONTENT_OBJECTS = ('sender', 'target', 'action_object')
+
+_current_batch = ContextVar('notifications_batch', default=None)
+
+
+def get_dispatch_backend():
+    """Return the dispatch backend configured by ``DISPATCH_BACKEND``."""
+    return _load_backend(notifications_settings.get_config()['DISPATCH_BACKEND'])
+
+
+@lru_cache(maxsize=None)
+def _load_backend(path):
+    return import_string(path)()
+
+
+class BaseDispatchBackend:
+    """
+    Base class for dispatch backends.
+
+    ``notify_handler`` hands every ``notify.send`` call over to
+    ``dispatch()``, which must eventually call
+    ``notifications.base.models.create_notifications`` with the same
+    arguments. Its return value is what ``notify.send`` returns for the
+    handler.
+    """
+    def dispatch(self, verb, **kwargs):
+        raise NotImplementedError('subclasses of BaseDispatchBackend must provide a dispatch() method')
+
+
+class ImmediateBackend(BaseDispatchBackend):
+    """Create the notifications right away in the caller's thread (default)."""
+    def dispatch(self, verb, **kwargs):
+        from notifications.base.models import create_notifications
+        return create_notifications(verb, **kwargs)
+
+
+class ThreadPoolBackend(BaseDispatchBackend):
+    """
+    Create the notifications in a pool of ``DISPATCH_MAX_WORKERS`` threads,
+    once the current transaction is committed. Returns ``None``.
+    """
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(
+            max_workers=notifications_settings.get_config()['DISPATCH_MAX_WORKERS'],
+            thread_name_prefix='notifications',
+        )
+
+    def dispatch(self, verb, **kwargs):
+        Notification = load_model('notifications', 'Notification')
+        transaction.on_commit(
+            lambda: self.executor.submit(self.run, verb, kwargs),
+            using=router.db_for_write(Notification),
+        )
+
+    @staticmethod
+    def run(verb, kwargs):
+        from notifications.base.models import create_notifications
+        try:
+            return create_notifications(verb, **kwargs)
+        except Exception:  # pylint: disable=broad-except
+            logger.exception('Could not create the %r notifications', verb)
+            return None
+        finally:
+            close_old_connections()
+
+
+class OutboxBackend(BaseDispatchBackend):
+    """
+    Write every ``notify.send`` call as a single ``OutboxEvent`` row, in the
+    caller's transaction, and let ``manage.py notifications_worker`` expand
+    it into one notification per recipient. Returns the ``OutboxEvent``.
+
+    Requires ``notifications`` in ``INSTALLED_APPS``. The objects are stored
+    as content type and primary key, so they must be saved; the extra data
+    must be JSON serializable.
+    """
+    def dispatch(self, verb, **kwargs):
+        OutboxEvent = apps.get_model('notifications', 'OutboxEvent')
+        timestamp = kwargs.pop('timestamp', None)
+        event = OutboxEvent(verb=str(verb), payload=serialize_notify_kwargs(kwargs))
+        if timestamp is not None:
+            event.timestamp = timestamp
+        event.save()
+        return event
+
+    @staticmethod
+    def process(limit=100):
+        """
+        Expand up to ``limit`` pending outbox events, oldest first. Each event
+        is expanded and deleted in one transaction; failed events are kept
+        and retried after the others, until they failed
+        ``OUTBOX_MAX_ATTEMPTS`` times. Return the number of expanded events.
+        """
+        from notifications.base.models import create_notifications
+
+        OutboxEvent = apps.get_model('notifications', 'OutboxEvent')
+        connection = connections[router.db_for_write(OutboxEvent)]
+        max_attempts = notifications_settings.get_config()['OUTBOX_MAX_ATTEMPTS']
+        processed = 0
+        events = OutboxEvent.objects.pending(max_attempts).order_by('attempts', 'pk')
+        for event_id in events.values_list('pk', flat=True)[:limit]:
+            try:
+                with transaction.atomic(using=connection.alias):
+                    events = OutboxEvent.objects.filter(pk=event_id)
+                    if connection.features.has_select_for_update_skip_locked:
+                        events = events.select_for_update(skip_locked=True)
+                    event = events.first()
+                    if event is None:
+                        # Expanded by another worker in the meantime
+                        continue
+                    kwargs = deserialize_notify_kwargs(event.payload)
+                    create_notifications(event.verb, timestamp=event.timestamp, **kwargs)
+                    event.delete()
+            except Exception:  # pylint: disable=broad-except
+                logger.exception('Could not expand outbox event %s', event_id)
+                OutboxEvent.objects.filter(pk=event_id).update(attempts=F('attempts') + 1)
+                if max_attempts and OutboxEvent.objects.filter(pk=event_id, attempts__gte=max_attempts).exists():
+                    logger.error('Giving up outbox event %s after %d attempts', event_id, max_attempts)
+                continue
+            processed += 1
+        return processed
+
+
+def get_current_batch():
+    """Return the batch of the active ``batch_notifications`` block, if any."""
+    return _current_batch.get()
+
+
+class NotificationBatch:
+    """The ``notify.send`` calls collected by a ``batch_notifications`` block."""
+    def __init__(self, using):
+        self.using = using
+        self.calls = []
+
+    def add(self, verb, kwargs):
+        # Keep the time of the call rather than the time of the flush
+        kwargs.setdefault('timestamp', timezone.now())
+        call = (verb, kwargs)
+        # Only keep the calls whose transaction (or savepoint) is committed
+        transaction.on_commit(lambda: self.calls.append(call), using=self.using)
+
+    def flush(self):
+        from notifications.base.models import _send_created, build_notifications, create_notifications
+
+        Notification = load_model('notifications', 'Notification')
+        calls, self.calls = self.calls, []
+        new_notifications = []
+        for verb, kwargs in calls:
+            if kwargs.get('insert_select') or kwargs.get('broadcast') or kwargs.get('coalesce'):
+                create_notifications(verb, **kwargs)
+            else:
+                new_notifications.extend(build_notifications(verb, **kwargs))
+        new_notifications = Notification.objects.bulk_create(
+            new_notifications, batch_size=notifications_settings.get_config()['BULK_CREATE_BATCH_SIZE'])
+        _send_created(Notification, new_notifications)
+        return new_notifications
+
+
+class batch_notifications(ContextDecorator):  # pylint: disable=invalid-name
+    """
+    Context manager and decorator collecting the ``notify.send`` calls made
+    inside it, to create all their notifications with a single
+    ``bulk_create`` once the transaction is committed::
+
+        with transaction.atomic(), batch_notifications():
+            for comment in comments:
+                notify.send(comment.user, recipient=comment.post.author, verb='commented')
+
+    Calls made in a transaction or savepoint that is rolled back are dropped.
+    Inside the block the dispatch backend is not used and ``notify.send``
+    returns ``None`` for the handler. Nested blocks join the outermost one.
+    """
+    def __init__(self, using=None):
+        self.using = using
+        self._tokens = []
+
+    def __enter__(self):
+        if _current_batch.get() is not None:
+            token = None
+        else:
+            using = self.using or router.db_for_write(load_model('notifications', 'Notification'))
+            token = _current_batch.set(NotificationBatch(using))
+        self._tokens.append(token)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        token = self._tokens.pop()
+        if token is None:
+            return
+        batch = _current_batch.get()
+        _current_batch.reset(token)
+        # Runs after the calls collected so far have been committed, or right
+        # away in autocommit mode; dropped if the transaction is rolled back.
+        transaction.on_commit(batch.flush, using=batch.using)
+
+
+def serialize_notify_kwargs(kwargs):
+    """Turn the arguments of ``notify.send`` into a JSON serializable dict."""
+    payload = dict(kwargs)
+    for name in CONTENT_OBJECTS:
+        obj = payload.pop(name, None)
+        if obj is not None:
+            for_concrete_model = kwargs.get(
+                'actor_for_concrete_model' if name == 'sender' else f'{name}_for_concrete_model', True)
+            content_type = ContentType.objects.get_for_model(obj, for_concrete_model=for_concrete_model)
+            payload[name] = [content_type.pk, obj.pk]
+
+    recipient = payload.pop('recipient', None)
+    if recipient is None:
+        payload['recipient'] = None
+    elif isinstance(recipient, Group):
+        payload['recipient'] = {'group': recipient.pk}
+    elif isinstance(recipient, QuerySet):
+        # Resolved now: the rows are not trusted with code to run by the worker
+        payload['recipient'] = {'users': list(recipient.values_list('pk', flat=True))}
+    elif isinstance(recipient, list):
+        payload['recipient'] = {'users': [user.pk for user in recipient]}
+    else:
+        payload['recipient'] = {'user': recipient.pk}
+    return payload
+
+
+def deserialize_notify_kwargs(payload):
+    """Rebuild the arguments of ``notify.send`` from ``serialize_notify_kwargs``."""
+    User = get_user_model()
+    kwargs = dict(payload)
+    for name in CONTENT_OBJECTS:
+        if name in kwargs:
+            content_type_id, object_id = kwargs[name]
+            content_type = ContentType.objects.get_for_id(content_type_id)
+            kwargs[name] = content_type.get_object_for_this_type(pk=object_id)
+
+    recipient = kwargs['recipient']
+    if recipient is None:
+        pass
+    elif 'group' in recipient:
+        kwargs['recipient'] = Group.objects.get(pk=recipient['group'])
+    elif 'users' in recipient:
+        kwargs['recipient'] = User.objects.filter(pk__in=recipient['users'])
+        if not kwargs.get('insert_select'):
+            kwargs['recipient'] = list(kwargs['recipient'])
+    elif 'user' in recipient:
+        kwargs['recipient'] = User.objects.get(pk=recipient['user'])
+    else:
+        raise ValueError('Unsupported outbox recipient %r.' % recipient)
+    return kwargs
@@ -1,5 +1,13 @@
+import time
+
+from django.apps import apps
+from django.core.cache import cache
+from django.db import router, transaction
+from django.db.models import BooleanField, Q, Value
+from django.db.models.query import QuerySet
 from django.forms import model_to_dict
-from notifications.utils import id2slug
+from swapper import load_model
+from notifications.utils import decode_cursor, encode_cursor, id2slug
 from notifications.settings import get_config
 
 def get_object_url(instance, notification, request):
@@ -15,6 +23,79 @@ def get_object_url(instance, notification, request):
         return instance.get_absolute_url()
     return None
 
+def get_unread_count(user):
+    """
+    Return the number of unread notifications of ``user``, from its
+    ``UnreadCounter`` row when ``USE_UNREAD_COUNTER`` is enabled.
+    """
+    if get_config()['USE_UNREAD_COUNTER'] and apps.is_installed('notifications'):
+        return apps.get_model('notifications', 'UnreadCounter').objects.unread_count(user)
+    return user.notifications.unread().count()
+
+UNREAD_COUNT_VERSION_KEY = 'notifications:unread_count_version:%s'
+UNREAD_COUNT_VERSION_TIMEOUT = 24 * 60 * 60
+
+def _get_versions(user_pk):
+    version_keys = [UNREAD_COUNT_VERSION_KEY % 'all', UNREAD_COUNT_VERSION_KEY % user_pk]
+    versions = cache.get_many(version_keys)
+    timeout = max(UNREAD_COUNT_VERSION_TIMEOUT, get_config()['CACHE_TIMEOUT'])
+    for key in version_keys:
+        if key not in versions:
+            # Start from the current time so that a version expired or
+            # evicted from the cache never brings back a count cached under
+            # an older one.
+            cache.add(key, int(time.time() * 1000), timeout)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in version_keys]
+
+def _unread_count_cache_key(user_pk):
+    return 'notifications:unread_count:%s:%s:%s' % ((user_pk,) + tuple(_get_versions(user_pk)))
+
+def get_notifications_version(user):
+    """
+    Return a string which changes whenever the notifications of ``user``
+    change, or ``None`` when the cache cannot store it.
+    """
+    versions = _get_versions(user.pk)
+    if None in versions:  # e.g. DummyCache
+        return None
+    return '%s-%s-%s' % (user.pk, versions[0], versions[1])
+
+def get_cached_unread_count(user, count=None):
+    """
+    Return the unread count of ``user`` from the cache, for up to
+    ``CACHE_TIMEOUT`` seconds. ``count`` is the callable computing it on a
+    miss, ``get_unread_count(user)`` by default.
+    """
+    return cache.get_or_set(
+        _unread_count_cache_key(user.pk),
+        count or (lambda: get_unread_count(user)),
+        get_config()['CACHE_TIMEOUT'],
+    )
+
+def invalidate_unread_count(user_pks, using=None):
+    """
+    Drop the cached unread counts of the users with these primary keys, or
+    of every user when ``user_pks`` is ``None`` or a queryset, not to run it,
+    once the current transaction on the ``using`` database, the one of the
+    notifications by default, is committed: before, the readers would cache
+    the count of the rows they still see under the new version.
+    """
+    if user_pks is None or isinstance(user_pks, QuerySet):
+        user_pks = ['all']
+    user_pks = set(user_pks)
+
+    def invalidate():
+        for user_pk in user_pks:
+            try:
+                cache.incr(UNREAD_COUNT_VERSION_KEY % user_pk)
+            except ValueError:  # No version, so nothing cached for this user
+                pass
+
+    if using is None:
+        using = router.db_for_write(load_model('notifications', 'Notification'))
+    transaction.on_commit(invalidate, using=using)
+
 def get_num_to_fetch(request):
     default_num_to_fetch = get_config()['NUM_TO_FETCH']
     try:
@@ -27,33 +108,261 @@ def get_num_to_fetch(request):
         num_to_fetch = default_num_to_fetch
     return num_to_fetch
 
+def get_notification_dict(notification, request, fields=None):
+    """
+    Return the JSON representation of ``notification`` used by the API,
+    restricted to the keys of ``fields`` if given.
+    """
+    struct = model_to_dict(notification, fields=fields)
+    opts = notification._meta  # pylint: disable=protected-access
+    for name in ('actor_object_id', 'target_object_id', 'action_object_object_id'):
+        if name in struct:
+            # Before Django 4.0, prefetching sets them from the objects' pks
+            struct[name] = opts.get_field(name).to_python(struct[name])
+    if fields is None or 'slug' in fields:
+        struct['slug'] = id2slug(notification.id)
+    for name in ('actor', 'target', 'action_object'):
+        if fields is not None and name not in fields and name + '_url' not in fields:
+            continue
+        obj = getattr(notification, name)
+        if obj:
+            struct[name] = str(obj)
+            url = get_object_url(obj, notification, request)
+            if url:
+                struct[name + '_url'] = url
+    if (fields is None or 'data' in fields) and notification.data:
+        struct['data'] = notification.data
+    return struct
+
+def _keyset(notification):
+    if isinstance(notification, dict):
+        return notification['timestamp'], notification['id']
+    return notification.timestamp, notification.pk
+
+ARCHIVE_BOUNDARY_KEY = 'notifications:archive_boundary'
+
+def get_archived_notifications(user, active=False):
+    """
+    Return the archived notifications of ``user``, only the active ones if
+    ``active``, or ``None`` without ``USE_ARCHIVE``.
+    """
+    if not get_config()['USE_ARCHIVE'] or not apps.is_installed('notifications'):
+        return None
+    archived = apps.get_model('notifications', 'ArchivedNotification').objects.filter(recipient=user)
+    return archived.active() if active else archived
+
+def get_archive_boundary():
+    """
+    Return the timestamp of the newest archived notification, or ``None``
+    when the archive is empty: the newer notifications are never archived.
+    """
+    boundary = cache.get(ARCHIVE_BOUNDARY_KEY)
+    if boundary is None:
+        ArchivedNotification = apps.get_model('notifications', 'ArchivedNotification')
+        # Cached in a list, to tell an empty archive from a cache miss
+        boundary = [ArchivedNotification.objects.order_by('-timestamp').values_list('timestamp', flat=True).first()]
+        cache.set(ARCHIVE_BOUNDARY_KEY, boundary, get_config()['CACHE_TIMEOUT'])
+    return boundary[0]
+
+def _reaches_archive(notifications, limit):
+    """
+    Tell whether the first ``limit`` notifications, newest first, may
+    include archived ones, given the first ``notifications`` of the table.
+    """
+    boundary = get_archive_boundary()
+    if boundary is None:
+        return False
+    return len(notifications) < limit or _keyset(notifications[limit - 1])[0] <= boundary
+
+def _fetch(queryset, limit, fetch):
+    if fetch is None:
+        return list(queryset[:limit])
+    return list(fetch(queryset, limit))
+
+class NotificationArchiveList:
+    """
+    The notifications of ``queryset`` then of ``archive``, its archived
+    notifications, newest first, for the paginators. The archive is only
+    queried for its count, and for the pages which may hold archived
+    notifications.
+    """
+    def __init__(self, queryset, archive):
+        self.queryset = queryset.order_by('-timestamp', '-id')
+        self.archive = archive.order_by('-timestamp', '-id')
+        self.ordered = True
+
+    def count(self):
+        return self.queryset.count() + self.archive.count()
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        start, stop = index.start or 0, index.stop
+        notifications = list(self.queryset[start:stop])
+        boundary = get_archive_boundary()
+        if boundary is None or (len(notifications) == stop - start and notifications[-1].timestamp > boundary):
+            return notifications
+        # Past the notifications newer than the archive, merge the keys of
+        # both tables in SQL, then load the rows of the page
+        newer = self.queryset.filter(timestamp__gt=boundary).count()
+        tail_start, tail_stop = max(start - newer, 0), stop - newer
+        keys = list(self._keys(self.queryset.filter(timestamp__lte=boundary), False).union(
+            self._keys(self.archive, True), all=True).order_by('-timestamp', '-id')[tail_start:tail_stop])
+        rows = {
+            False: self.queryset.in_bulk([pk for _, pk, archived in keys if not archived]),
+            True: self.archive.in_bulk([pk for _, pk, archived in keys if archived]),
+        }
+        tail = [rows[bool(archived)][pk] for _, pk, archived in keys]
+        return notifications[:max(newer - start, 0)] + tail
+
+    @staticmethod
+    def _keys(queryset, archived):
+        return queryset.order_by().annotate(
+            archived=Value(archived, output_field=BooleanField())).values_list('timestamp', 'id', 'archived')
+
+def paginate_by_keyset(queryset, cursor=None, per_page=None, fetch=None, archive=None):
+    """
+    Return ``(notifications, next_cursor, previous_cursor)`` for the page of
+    ``queryset`` starting at ``cursor``, newest first. The page is found by
+    seeking on ``(timestamp, id)``, without ``OFFSET`` nor ``COUNT(*)``, and
+    the cursors are ``None`` on the first and last pages. Raise
+    ``ValueError`` for an invalid cursor.
+
+    ``fetch(queryset, limit)`` returns the first ``limit`` notifications of
+    the ordered queryset, as model instances (the default) or dicts with
+    their ``timestamp`` and ``id``. The notifications of ``archive``, the
+    archived notifications of the same user, are merged into the pages
+    past the newest archived notification.
+    """
+    per_page = per_page or get_config()['PAGINATE_BY']
+    querysets = [queryset] if archive is None else [queryset, archive]
+    querysets = [queryset.order_by('-timestamp', '-id') for queryset in querysets]
+    if not cursor:
+        direction = 'n'
+    else:
+        direction, timestamp, notification_id = decode_cursor(cursor)
+        if direction == 'n':
+            querysets = [queryset.filter(
+                Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=notification_id))
+                for queryset in querysets]
+        else:
+            querysets = [queryset.filter(
+                Q(timestamp__gt=timestamp) | Q(timestamp=timestamp, id__gt=notification_id)).reverse()
+                for queryset in querysets]
+
+    # One more row tells whether there is another page in this direction
+    notifications = _fetch(querysets[0], per_page + 1, fetch)
+    if archive is not None:
+        if direction == 'n':
+            merge = _reaches_archive(notifications, per_page + 1)
+        else:
+            boundary = get_archive_boundary()
+            merge = boundary is not None and timestamp <= boundary
+        if merge:
+            notifications = sorted(
+                notifications + _fetch(querysets[1], per_page + 1, fetch),
+                key=_keyset, reverse=direction == 'n')[:per_page + 1]
+    has_more = len(notifications) > per_page
+    notifications = notifications[:per_page]
+    if direction == 'n':
+        has_next, has_previous = has_more, bool(cursor)
+    else:
+        notifications.reverse()
+        has_next, has_previous = True, has_more
+
+    next_cursor = previous_cursor = None
+    if has_next and notifications:
+        next_cursor = encode_cursor(*_keyset(notifications[-1]), 'n')
+    if has_previous and notifications:
+        previous_cursor = encode_cursor(*_keyset(notifications[0]), 'p')
+    return notifications, next_cursor, previous_cursor
+
+def get_notification_page(request, method_name='all'):
+    """
+    Return ``(notification_list, next_cursor, previous_cursor, count)`` for
+    the live API: the first ``max`` notifications, or the page at the
+    ``cursor`` of the request with ``KEYSET_PAGINATION``, serialized by
+    ``SERIALIZER`` with the ``fields`` of the request. ``count`` is the
+    number of notifications of the list when the serializer computed it
+    along with the list, otherwise ``None``. The all list reaches into the
+    archive with ``USE_ARCHIVE``; ``count`` leaves it out.
+    """
+    from notifications.serializers import get_requested_fields, get_serializer
+
+    serializer = get_serializer()
+    num_to_fetch = get_num_to_fetch(request)
+    queryset = getattr(request.user.notifications, method_name)()
+    archive = get_archived_notifications(request.user) if method_name == 'all' else None
+    fields = serialized_fields = get_requested_fields(request, queryset.model)
+    if fields is not None:
+        # The ids and timestamps make the cursors and mark the list as read
+        serialized_fields = list(dict.fromkeys(fields + ['id', 'timestamp']))
+
+    def fetch(queryset, limit):
+        return serializer.serialize(request, queryset, limit, fields=serialized_fields)[0]
+
+    next_cursor = previous_cursor = count = None
+    if get_config()['KEYSET_PAGINATION']:
+        try:
+            notification_list, next_cursor, previous_cursor = paginate_by_keyset(
+                queryset, request.GET.get('cursor'), num_to_fetch, fetch, archive)
+        except ValueError:
+            notification_list, next_cursor, previous_cursor = paginate_by_keyset(
+                queryset, None, num_to_fetch, fetch, archive)
+    else:
+        notification_list, count = serializer.serialize(
+            request, queryset, num_to_fetch, with_count=True, fields=serialized_fields)
+        if archive is not None and _reaches_archive(notification_list, num_to_fetch):
+            notification_list = sorted(
+                notification_list + fetch(archive.order_by('-timestamp', '-id'), num_to_fetch),
+                key=_keyset, reverse=True)[:num_to_fetch]
+    if request.GET.get('mark_as_read') and notification_list:
+        # One UPDATE for the whole list
+        request.user.notifications.filter(
+            pk__in=[struct['id'] for struct in notification_list]).mark_all_as_read()
+        count = None
+    if fields is not None:
+        notification_list = [
+            {name: struct[name] for name in fields if name in struct} for struct in notification_list
+        ]
+    return notification_list, next_cursor, previous_cursor, count
+
 def get_notification_list(request, method_name='all'):
+    return get_notification_page(request, method_name)[0]
+
+def get_change_log_cursor():
+    """Return the latest change log cursor, or ``None`` without ``USE_CHANGE_LOG``."""
+    if not get_config()['USE_CHANGE_LOG']:
+        return None
+    return apps.get_model('notifications', 'NotificationChange').objects.cursor()
+
+def get_notification_changes(request):
+    """
+    Return the API payload of the changes of the notifications of the user
+    since the ``since`` cursor of the request, see ``USE_CHANGE_LOG``.
+    """
+    NotificationChange = apps.get_model('notifications', 'NotificationChange')
+    try:
+        cursor = int(request.GET['since'])
+    except (KeyError, ValueError):
+        return {'cursor': NotificationChange.objects.cursor(), 'reset': True, 'changed': [], 'deleted': []}
+
     num_to_fetch = get_num_to_fetch(request)
-    notification_list = []
-    for notification in getattr(request.user.notifications, method_name)()[0:num_to_fetch]:
-        struct = model_to_dict(notification)
-        struct['slug'] = id2slug(notification.id)
-        if notification.actor:
-            struct['actor'] = str(notification.actor)
-            actor_url = get_object_url(
-                notification.actor, notification, request)
-            if actor_url:
-                struct['actor_url'] = actor_url
-        if notification.target:
-            struct['target'] = str(notification.target)
-            target_url = get_object_url(
-                notification.target, notification, request)
-            if target_url:
-                struct['target_url'] = target_url
-        if notification.action_object:
-            struct['action_object'] = str(notification.action_object)
-            action_object_url = get_object_url(
-                notification.action_object, notification, request)
-            if action_object_url:
-                struct['action_object_url'] = action_object_url
-        if notification.data:
-            struct['data'] = notification.data
-        notification_list.append(struct)
-        if request.GET.get('mark_as_read'):
-            notification.mark_as_read()
-    return notification_list
+    changes, cursor, reset = NotificationChange.objects.changes_since(request.user, cursor, num_to_fetch)
+    data = {'cursor': cursor, 'reset': reset, 'more': len(changes) == num_to_fetch, 'changed': [], 'deleted': []}
+    if reset:
+        return data
+
+    # Only the current state of each changed notification matters
+    notification_ids = list(dict.fromkeys(change.notification_id for change in changes))
+    notifications = request.user.notifications.filter(pk__in=notification_ids).with_related_objects().in_bulk()
+    for notification_id in notification_ids:
+        notification = notifications.get(notification_id)
+        if notification is None or (get_config()['SOFT_DELETE'] and notification.deleted):
+            data['deleted'].append(id2slug(notification_id))
+        else:
+            data['changed'].append(get_notification_dict(notification, request))
+    return data
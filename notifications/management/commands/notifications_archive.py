@@ -0,0 +1,64 @@
+''' Django notifications archive command '''
+# -*- coding: utf-8 -*-
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from swapper import load_model
+
+from notifications.models import ArchivedNotification
+
+Notification = load_model('notifications', 'Notification')
+
+
+class Command(BaseCommand):
+    help = 'Move the read notifications older than a number of days to the archive, in chunks of primary keys.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, required=True,
+            help='Archive the read notifications older than this number of days.',
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=1000,
+            help='Number of notifications moved by each transaction (default: 1000).',
+        )
+        parser.add_argument(
+            '--pause', type=float, default=0,
+            help='Seconds to wait between the chunks (default: 0).',
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only count the notifications to archive.',
+        )
+
+    def handle(self, *args, **options):
+        queryset = Notification.objects.filter(
+            unread=False, timestamp__lt=timezone.now() - timedelta(days=options['days']))
+
+        if options['dry_run']:
+            self.stdout.write('Would archive %d notifications.' % queryset.count())
+            return
+
+        count, last_pk, start = 0, None, time.monotonic()
+        while True:
+            chunk = queryset.order_by('pk')
+            if last_pk is not None:
+                chunk = chunk.filter(pk__gt=last_pk)
+            pks = list(chunk.values_list('pk', flat=True)[:options['chunk_size']])
+            if not pks:
+                break
+            # Filtered again, to skip the notifications marked unread since
+            count += ArchivedNotification.objects.archive(queryset.filter(pk__in=pks))
+            last_pk = pks[-1]
+            if options['verbosity'] > 1:
+                self.stdout.write('Archived %d notifications up to id %s.' % (count, last_pk))
+            if len(pks) < options['chunk_size']:
+                break
+            if options['pause']:
+                time.sleep(options['pause'])
+
+        elapsed = time.monotonic() - start
+        self.stdout.write('Archived %d notifications in %.1f seconds (%d per second).' % (
+            count, elapsed, count / elapsed if elapsed else count))
@@ -0,0 +1,61 @@
+''' Django notifications change log prune command '''
+# -*- coding: utf-8 -*-
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from notifications.models import NotificationChange
+from notifications.settings import get_config
+
+
+class Command(BaseCommand):
+    help = 'Delete the change log entries older than a number of days, in chunks of primary keys.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int,
+            help='Delete the changes older than this number of days (default: CHANGE_LOG_RETENTION).',
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=1000,
+            help='Number of changes deleted by each statement (default: 1000).',
+        )
+        parser.add_argument(
+            '--pause', type=float, default=0,
+            help='Seconds to wait between the chunks (default: 0).',
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only count the changes to delete.',
+        )
+
+    def handle(self, *args, **options):
+        days = options['days'] if options['days'] is not None else get_config()['CHANGE_LOG_RETENTION']
+        queryset = NotificationChange.objects.prunable(timezone.now() - timedelta(days=days))
+
+        if options['dry_run']:
+            self.stdout.write('Would delete %d changes.' % queryset.count())
+            return
+
+        count, last_pk, start = 0, None, time.monotonic()
+        while True:
+            chunk = queryset.order_by('pk')
+            if last_pk is not None:
+                chunk = chunk.filter(pk__gt=last_pk)
+            pks = list(chunk.values_list('pk', flat=True)[:options['chunk_size']])
+            if not pks:
+                break
+            count += NotificationChange.objects.filter(pk__in=pks).delete()[0]
+            last_pk = pks[-1]
+            if options['verbosity'] > 1:
+                self.stdout.write('Deleted %d changes up to id %s.' % (count, last_pk))
+            if len(pks) < options['chunk_size']:
+                break
+            if options['pause']:
+                time.sleep(options['pause'])
+
+        elapsed = time.monotonic() - start
+        self.stdout.write('Deleted %d changes in %.1f seconds (%d per second).' % (
+            count, elapsed, count / elapsed if elapsed else count))
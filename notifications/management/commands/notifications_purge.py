@@ -0,0 +1,97 @@
+''' Django notifications retention purge command '''
+# -*- coding: utf-8 -*-
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import models
+from django.utils import timezone
+from swapper import load_model
+
+from notifications.helpers import invalidate_unread_count
+from notifications.models import UnreadCounter
+from notifications.settings import get_config
+
+Notification = load_model('notifications', 'Notification')
+
+
+class Command(BaseCommand):
+    help = 'Delete the notifications older than a number of days, in chunks of primary keys.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, required=True,
+            help='Delete the notifications older than this number of days.',
+        )
+        parser.add_argument(
+            '--read', action='store_true',
+            help='Only delete the read notifications.',
+        )
+        parser.add_argument(
+            '--deleted', action='store_true',
+            help='Only delete the soft deleted notifications.',
+        )
+        parser.add_argument(
+            '--level', action='append', choices=[level for level, _ in Notification.LEVELS],
+            help='Only delete the notifications of this level; may be repeated.',
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=1000,
+            help='Number of notifications deleted by each statement (default: 1000).',
+        )
+        parser.add_argument(
+            '--pause', type=float, default=0,
+            help='Seconds to wait between the chunks (default: 0).',
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only count the notifications to delete.',
+        )
+
+    def handle(self, *args, **options):
+        queryset = Notification.objects.filter(timestamp__lt=timezone.now() - timedelta(days=options['days']))
+        if options['read']:
+            queryset = queryset.filter(unread=False)
+        if options['deleted']:
+            queryset = queryset.filter(deleted=True)
+        if options['level']:
+            queryset = queryset.filter(level__in=options['level'])
+
+        if options['dry_run']:
+            self.stdout.write('Would delete %d notifications.' % queryset.count())
+            return
+
+        count, last_pk, start = 0, None, time.monotonic()
+        recipients, unread_recipients = set(), set()
+        while True:
+            # Walk the primary keys so each DELETE only locks a bounded range
+            chunk = queryset.order_by('pk')
+            if last_pk is not None:
+                chunk = chunk.filter(pk__gt=last_pk)
+            rows = list(chunk.values_list('pk', 'recipient_id', 'unread')[:options['chunk_size']])
+            if not rows:
+                break
+            pks = [row[0] for row in rows]
+            recipients.update(row[1] for row in rows)
+            unread_recipients.update(row[1] for row in rows if row[2])
+            # Without the locks and notifications_changed of NotificationQuerySet.delete()
+            count += models.QuerySet.delete(queryset.filter(pk__in=pks))[0]
+            last_pk = pks[-1]
+            if options['verbosity'] > 1:
+                self.stdout.write('Deleted %d notifications up to id %s.' % (count, last_pk))
+            if len(pks) < options['chunk_size']:
+                break
+            if options['pause']:
+                time.sleep(options['pause'])
+
+        config = get_config()
+        # The ETag also covers the lists of the read notifications
+        changed_recipients = recipients if config['USE_ETAG'] else unread_recipients
+        if changed_recipients:
+            invalidate_unread_count(changed_recipients)
+        if unread_recipients and config['USE_UNREAD_COUNTER']:
+            UnreadCounter.objects.refresh(unread_recipients)
+
+        elapsed = time.monotonic() - start
+        self.stdout.write('Deleted %d notifications in %.1f seconds (%d per second).' % (
+            count, elapsed, count / elapsed if elapsed else count))
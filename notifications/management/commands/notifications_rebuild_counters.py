@@ -0,0 +1,27 @@
+''' Django notifications unread counters rebuild command '''
+# -*- coding: utf-8 -*-
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from notifications.models import UnreadCounter
+
+
+class Command(BaseCommand):
+    help = 'Recount the unread notifications stored by USE_UNREAD_COUNTER.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--create', action='store_true',
+            help='Also create the missing counters, for every user.',
+        )
+
+    def handle(self, *args, **options):
+        if options['create']:
+            User = get_user_model()
+            missing = User.objects.exclude(pk__in=UnreadCounter.objects.values('user'))
+            UnreadCounter.objects.bulk_create(
+                [UnreadCounter(user_id=pk) for pk in missing.values_list('pk', flat=True).iterator()],
+                batch_size=500,
+            )
+        count = UnreadCounter.objects.refresh()
+        self.stdout.write('Rebuilt %d unread counters.' % count)
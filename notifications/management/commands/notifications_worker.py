@@ -0,0 +1,44 @@
+''' Django notifications outbox worker command '''
+# -*- coding: utf-8 -*-
+import time
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+from notifications.dispatch import OutboxBackend
+
+
+class Command(BaseCommand):
+    help = 'Expand the events written by the outbox dispatch backend into notifications.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=100,
+            help='Maximum number of events expanded per batch (default: 100).',
+        )
+        parser.add_argument(
+            '--sleep', type=float, default=1.0,
+            help='Seconds to wait when the outbox is empty (default: 1).',
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Expand the pending events and exit instead of polling forever.',
+        )
+        parser.add_argument(
+            '--retry-failed', action='store_true',
+            help='Retry the events given up after OUTBOX_MAX_ATTEMPTS attempts.',
+        )
+
+    def handle(self, *args, **options):
+        if options['retry_failed']:
+            retried = apps.get_model('notifications', 'OutboxEvent').objects.failed().update(attempts=0)
+            self.stdout.write('Retrying %d failed outbox events.' % retried)
+        total = 0
+        while True:
+            processed = OutboxBackend.process(limit=options['batch_size'])
+            total += processed
+            if processed < options['batch_size']:
+                if options['once']:
+                    break
+                time.sleep(options['sleep'])
+        self.stdout.write('Expanded %d outbox events.' % total)
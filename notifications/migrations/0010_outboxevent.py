@@ -0,0 +1,30 @@
+# Generated by Django 4.1.13 on 2026-10-18 18:10
+
+from django.db import migrations, models
+import django.utils.timezone
+import jsonfield.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0009_alter_notification_options_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxEvent',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('verb', models.CharField(max_length=255, verbose_name='verb')),
+                ('payload', jsonfield.fields.JSONField(verbose_name='payload')),
+                ('timestamp', models.DateTimeField(default=django.utils.timezone.now, verbose_name='timestamp')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='attempts')),
+            ],
+            options={
+                'verbose_name': 'Outbox event',
+                'verbose_name_plural': 'Outbox events',
+                'ordering': ('pk',),
+            },
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 4.1.13 on 2026-10-18 18:15
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import jsonfield.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('notifications', '0010_outboxevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BroadcastCursor',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='user')),
+                ('last_broadcast_id', models.PositiveIntegerField(default=0, verbose_name='last broadcast id')),
+            ],
+            options={
+                'verbose_name': 'Broadcast cursor',
+                'verbose_name_plural': 'Broadcast cursors',
+            },
+        ),
+        migrations.CreateModel(
+            name='Broadcast',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('level', models.CharField(choices=[('success', 'success'), ('info', 'info'), ('warning', 'warning'), ('error', 'error')], default='info', max_length=20, verbose_name='level')),
+                ('actor_object_id', models.CharField(max_length=255, verbose_name='actor object id')),
+                ('verb', models.CharField(max_length=255, verbose_name='verb')),
+                ('description', models.TextField(blank=True, null=True, verbose_name='description')),
+                ('target_object_id', models.CharField(blank=True, max_length=255, null=True, verbose_name='target object id')),
+                ('action_object_object_id', models.CharField(blank=True, max_length=255, null=True, verbose_name='action object object id')),
+                ('timestamp', models.DateTimeField(default=django.utils.timezone.now, verbose_name='timestamp')),
+                ('public', models.BooleanField(default=True, verbose_name='public')),
+                ('data', jsonfield.fields.JSONField(blank=True, null=True, verbose_name='data')),
+                ('action_object_content_type', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='contenttypes.contenttype', verbose_name='action object content type')),
+                ('actor_content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='contenttypes.contenttype', verbose_name='actor content type')),
+                ('group', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='auth.group', verbose_name='group')),
+                ('target_content_type', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='contenttypes.contenttype', verbose_name='target content type')),
+            ],
+            options={
+                'verbose_name': 'Broadcast',
+                'verbose_name_plural': 'Broadcasts',
+                'ordering': ('-timestamp',),
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.1.13 on 2026-10-18 18:22
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('notifications', '0011_broadcast'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UnreadCounter',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='user')),
+                ('unread_count', models.PositiveIntegerField(default=0, verbose_name='unread count')),
+            ],
+            options={
+                'verbose_name': 'Unread counter',
+                'verbose_name_plural': 'Unread counters',
+            },
+        ),
+    ]
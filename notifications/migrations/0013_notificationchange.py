@@ -0,0 +1,36 @@
+# Generated by Django 4.1.13 on 2026-10-18 18:32
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('notifications', '0012_unreadcounter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationChange',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('notification_id', models.PositiveIntegerField(blank=True, null=True, verbose_name='notification id')),
+                ('action', models.CharField(choices=[('created', 'created'), ('updated', 'updated'), ('read', 'read'), ('unread', 'unread'), ('deleted', 'deleted'), ('active', 'active')], max_length=10, verbose_name='action')),
+                ('timestamp', models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='timestamp')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='user')),
+            ],
+            options={
+                'verbose_name': 'Notification change',
+                'verbose_name_plural': 'Notification changes',
+                'ordering': ('pk',),
+            },
+        ),
+        migrations.AddIndex(
+            model_name='notificationchange',
+            index=models.Index(fields=['user', 'id'], name='notificatio_user_id_23531f_idx'),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 4.1.13 on 2026-10-18 18:55
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('notifications', '0013_notificationchange'),
+    ]
+
+    operations = [
+        # Create the new indexes before dropping the ones they replace
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['recipient', '-timestamp'], name='notification_recipient_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(condition=models.Q(('unread', True)), fields=['recipient', '-timestamp'], name='notification_unread_idx'),
+        ),
+        migrations.AlterIndexTogether(
+            name='notification',
+            index_together=set(),
+        ),
+        migrations.AlterField(
+            model_name='notification',
+            name='deleted',
+            field=models.BooleanField(default=False, verbose_name='deleted'),
+        ),
+        migrations.AlterField(
+            model_name='notification',
+            name='emailed',
+            field=models.BooleanField(default=False, verbose_name='emailed'),
+        ),
+        migrations.AlterField(
+            model_name='notification',
+            name='public',
+            field=models.BooleanField(default=True, verbose_name='public'),
+        ),
+        migrations.AlterField(
+            model_name='notification',
+            name='recipient',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='notifications', to=settings.AUTH_USER_MODEL, verbose_name='recipient'),
+        ),
+        migrations.AlterField(
+            model_name='notification',
+            name='unread',
+            field=models.BooleanField(default=True, verbose_name='unread'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.1.13 on 2026-10-18 19:09
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0015_archivednotification'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='archivednotification',
+            name='data',
+            field=models.JSONField(blank=True, encoder=django.core.serializers.json.DjangoJSONEncoder, null=True, verbose_name='data'),
+        ),
+        migrations.AlterField(
+            model_name='broadcast',
+            name='data',
+            field=models.JSONField(blank=True, encoder=django.core.serializers.json.DjangoJSONEncoder, null=True, verbose_name='data'),
+        ),
+        migrations.AlterField(
+            model_name='notification',
+            name='data',
+            field=models.JSONField(blank=True, encoder=django.core.serializers.json.DjangoJSONEncoder, null=True, verbose_name='data'),
+        ),
+    ]
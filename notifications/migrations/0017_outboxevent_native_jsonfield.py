@@ -0,0 +1,19 @@
+# Generated by Django 4.1.13 on 2026-10-18 19:52
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0016_native_jsonfield'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='outboxevent',
+            name='payload',
+            field=models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder, verbose_name='payload'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.1.13 on 2026-10-18 20:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0017_outboxevent_native_jsonfield'),
+    ]
+
+    operations = [
+        # Not RenameIndex, which requires Django 4.1
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['recipient', '-timestamp'], name='notificati_notificati_recip'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(condition=models.Q(('unread', True)), fields=['recipient', '-timestamp'], name='notificati_notificati_unread'),
+        ),
+        migrations.RemoveIndex(
+            model_name='notification',
+            name='notification_recipient_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='notification',
+            name='notification_unread_idx',
+        ),
+    ]
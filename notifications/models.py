@@ -1,6 +1,32 @@
-from swapper import swappable_setting
+from datetime import timedelta
 
-from .base.models import AbstractNotification, notify_handler  # noqa
+from django.conf import settings
+from django.contrib.auth.models import Group
+from django.contrib.contenttypes.fields import GenericForeignKey
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, router, transaction
+from django.db.models import Count, F, Max, Min, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from model_utils import Choices
+from swapper import load_model, swappable_setting
+
+from notifications.helpers import ARCHIVE_BOUNDARY_KEY, invalidate_unread_count
+from notifications.settings import get_config
+from notifications.signals import notifications_changed
+
+from .base.models import (  # noqa
+    AbstractNotification,
+    NotificationQuerySet,
+    _insert_select,
+    _send_changed,
+    anotify,
+    deliver_broadcasts,
+    notify_handler,
+)
 
 
 class Notification(AbstractNotification):
@@ -20,4 +46,444 @@ class Notification(AbstractNotification):
 
     def naturaltime(self):
         from django.contrib.humanize.templatetags.humanize import naturaltime
-        return naturaltime(self.timestamp)     
\ No newline at end of file
+        return naturaltime(self.timestamp)
+
+
+class OutboxEventQuerySet(models.QuerySet):
+
+    def pending(self, max_attempts=None):
+        """
+        Return the events failed less than ``max_attempts`` times,
+        ``OUTBOX_MAX_ATTEMPTS`` by default; all of them if it is 0.
+        """
+        if max_attempts is None:
+            max_attempts = get_config()['OUTBOX_MAX_ATTEMPTS']
+        return self.filter(attempts__lt=max_attempts) if max_attempts else self.all()
+
+    def failed(self, max_attempts=None):
+        """Return the events given up after failing ``max_attempts`` times."""
+        if max_attempts is None:
+            max_attempts = get_config()['OUTBOX_MAX_ATTEMPTS']
+        return self.filter(attempts__gte=max_attempts) if max_attempts else self.none()
+
+
+class OutboxEvent(models.Model):
+    """
+    A ``notify.send`` call written by the outbox dispatch backend, waiting to
+    be expanded into notifications by ``manage.py notifications_worker``.
+    The events failed ``OUTBOX_MAX_ATTEMPTS`` times are kept, but no longer
+    expanded.
+    """
+    verb = models.CharField(_('verb'), max_length=255)
+    payload = models.JSONField(_('payload'), encoder=DjangoJSONEncoder)
+    timestamp = models.DateTimeField(_('timestamp'), default=timezone.now)
+    attempts = models.PositiveIntegerField(_('attempts'), default=0)
+
+    objects = OutboxEventQuerySet.as_manager()
+
+    class Meta:
+        ordering = ('pk',)
+        verbose_name = _('Outbox event')
+        verbose_name_plural = _('Outbox events')
+
+    def __str__(self):
+        return self.verb
+
+
+class BroadcastManager(models.Manager):
+
+    def deliver(self, user):
+        """
+        Create the notifications of ``user`` for the broadcasts sent since
+        the last delivery, with a single ``INSERT ... SELECT``. Return the
+        number of notifications created.
+        """
+        latest_id = self.order_by('-pk').values_list('pk', flat=True).first()
+        if latest_id is None:
+            return 0
+        delivered_id = BroadcastCursor.objects.filter(user=user).values_list('last_broadcast_id', flat=True).first()
+        if delivered_id is not None and delivered_id >= latest_id:
+            return 0
+
+        Notification = load_model('notifications', 'Notification')
+        with transaction.atomic(using=self.db):
+            cursor, created = BroadcastCursor.objects.select_for_update().get_or_create(user=user)
+            broadcasts = self._sent_to(user, None if created else cursor.last_broadcast_id).filter(pk__lte=latest_id)
+            copied = {
+                name: name for name in (
+                    'level', 'actor_content_type', 'actor_object_id', 'verb', 'description',
+                    'target_content_type', 'target_object_id', 'action_object_content_type',
+                    'action_object_object_id', 'timestamp', 'public', 'data',
+                )
+            }
+            count = _insert_select(Notification, broadcasts, copied, Notification(recipient=user))
+            cursor.last_broadcast_id = latest_id
+            cursor.save(update_fields=['last_broadcast_id'])
+            if count:
+                _send_changed(Notification, 'created', [user.pk] * count)
+        return count
+
+    def pending(self, user):
+        """
+        Return the broadcasts of ``user`` not delivered yet, without
+        delivering them.
+        """
+        delivered_id = BroadcastCursor.objects.filter(user=user).values_list('last_broadcast_id', flat=True).first()
+        return self._sent_to(user, delivered_id)
+
+    def _sent_to(self, user, delivered_id):
+        broadcasts = self.filter(pk__gt=delivered_id or 0)
+        if delivered_id is None and getattr(user, 'date_joined', None):
+            # Do not flood new users with the announcements made before they joined
+            broadcasts = broadcasts.filter(timestamp__gte=user.date_joined)
+        audience = Q(group__isnull=True)
+        if hasattr(user, 'groups'):
+            audience |= Q(group__in=user.groups.all())
+        return broadcasts.filter(audience)
+
+
+class Broadcast(models.Model):
+    """
+    A notification for all users, or all members of ``group``, stored once.
+
+    Each user gets their own ``Notification`` copy the first time they load
+    their notifications after it was sent (see ``deliver_broadcasts``).
+    """
+    LEVELS = AbstractNotification.LEVELS
+    level = models.CharField(_('level'), choices=LEVELS, default=LEVELS.info, max_length=20)
+
+    group = models.ForeignKey(
+        Group,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name=_('group'),
+        blank=True,
+        null=True,
+    )
+
+    actor_content_type = models.ForeignKey(
+        ContentType,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name=_('actor content type')
+    )
+    actor_object_id = models.CharField(_('actor object id'), max_length=255)
+    actor = GenericForeignKey('actor_content_type', 'actor_object_id')
+
+    verb = models.CharField(_('verb'), max_length=255)
+    description = models.TextField(_('description'), blank=True, null=True)
+
+    target_content_type = models.ForeignKey(
+        ContentType,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name=_('target content type'),
+        blank=True,
+        null=True
+    )
+    target_object_id = models.CharField(_('target object id'), max_length=255, blank=True, null=True)
+    target = GenericForeignKey('target_content_type', 'target_object_id')
+
+    action_object_content_type = models.ForeignKey(
+        ContentType,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name=_('action object content type'),
+        blank=True,
+        null=True
+    )
+    action_object_object_id = models.CharField(_('action object object id'), max_length=255, blank=True, null=True)
+    action_object = GenericForeignKey('action_object_content_type', 'action_object_object_id')
+
+    timestamp = models.DateTimeField(_('timestamp'), default=timezone.now)
+    public = models.BooleanField(_('public'), default=True)
+
+    data = models.JSONField(_('data'), blank=True, null=True, encoder=DjangoJSONEncoder)
+
+    objects = BroadcastManager()
+
+    class Meta:
+        ordering = ('-timestamp',)
+        verbose_name = _('Broadcast')
+        verbose_name_plural = _('Broadcasts')
+
+    def __str__(self):
+        return self.verb
+
+
+class BroadcastCursor(models.Model):
+    """The last broadcast delivered to a user."""
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='+',
+        verbose_name=_('user'),
+    )
+    last_broadcast_id = models.PositiveIntegerField(_('last broadcast id'), default=0)
+
+    class Meta:
+        verbose_name = _('Broadcast cursor')
+        verbose_name_plural = _('Broadcast cursors')
+
+
+class UnreadCounterManager(models.Manager):
+
+    def unread_count(self, user):
+        """Return the number of unread notifications of ``user``."""
+        count = self.filter(user=user).values_list('unread_count', flat=True).first()
+        if count is None:
+            # First read: count once, then keep the row up to date
+            count = user.notifications.unread().count()
+            self.get_or_create(user=user, defaults={'unread_count': count})
+        return count
+
+    def increment(self, recipients):
+        """
+        Add one unread notification per occurrence of a user in ``recipients``,
+        and create the missing rows from a recount.
+        """
+        if isinstance(recipients, models.QuerySet):
+            # A single notification for each user of the queryset
+            missing = list(recipients.exclude(pk__in=self.values('user')).values_list('pk', flat=True))
+            count = self.filter(user__in=recipients).update(unread_count=F('unread_count') + 1)
+            return count + self._create_missing(missing)
+        increments = {}
+        for user_id in recipients:
+            increments[user_id] = increments.get(user_id, 0) + 1
+        existing = set(self.filter(user__in=list(increments)).values_list('user', flat=True))
+        by_amount = {}
+        for user_id, amount in increments.items():
+            if user_id in existing:
+                by_amount.setdefault(amount, []).append(user_id)
+        for amount, user_ids in by_amount.items():
+            self.filter(user__in=user_ids).update(unread_count=F('unread_count') + amount)
+        self._create_missing([user_id for user_id in increments if user_id not in existing])
+        return len(increments)
+
+    def _create_missing(self, user_ids):
+        # A first read may have counted before these notifications and be
+        # creating the row right now: recount whichever row wins
+        if not user_ids:
+            return 0
+        self.bulk_create([self.model(user_id=user_id) for user_id in user_ids], ignore_conflicts=True)
+        return self.refresh(user_ids)
+
+    def refresh(self, recipients=None):
+        """
+        Recount the unread notifications of the counters of ``recipients``,
+        or of every counter.
+        """
+        Notification = load_model('notifications', 'Notification')
+        counters = self.all()
+        if recipients is not None:
+            counters = counters.filter(user__in=recipients)
+        unread = Notification.objects.filter(recipient=OuterRef('user'), unread=True)
+        if get_config()['SOFT_DELETE']:
+            unread = unread.filter(deleted=False)
+        unread = unread.order_by().values('recipient').annotate(count=Count('pk')).values('count')
+        return counters.update(unread_count=Coalesce(Subquery(unread), 0))
+
+
+class UnreadCounter(models.Model):
+    """
+    The number of unread notifications of ``user``, kept up to date when
+    ``USE_UNREAD_COUNTER`` is enabled so the unread count is read from a
+    single row instead of counted. Rebuilt by
+    ``manage.py notifications_rebuild_counters``.
+    """
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='+',
+        verbose_name=_('user'),
+    )
+    unread_count = models.PositiveIntegerField(_('unread count'), default=0)
+
+    objects = UnreadCounterManager()
+
+    class Meta:
+        verbose_name = _('Unread counter')
+        verbose_name_plural = _('Unread counters')
+
+    def __str__(self):
+        return str(self.unread_count)
+
+
+def update_unread_counters(sender, action, recipients, **kwargs):  # pylint: disable=unused-argument
+    if not get_config()['USE_UNREAD_COUNTER']:
+        return
+    if action == 'created':
+        UnreadCounter.objects.increment(recipients)
+    elif action != 'updated':
+        UnreadCounter.objects.refresh(set(recipients))
+
+
+notifications_changed.connect(update_unread_counters, dispatch_uid='notifications.models.unread_counter')
+
+
+class NotificationChangeManager(models.Manager):
+
+    def cursor(self):
+        """
+        Return the cursor of the latest change logged ``CHANGE_LOG_LAG``
+        seconds ago, to pass to ``changes_since``. The ids are allocated
+        before the transactions commit, so the newer changes are not served
+        yet: one committed later than a change with a greater id would be
+        skipped.
+        """
+        before = timezone.now() - timedelta(seconds=get_config()['CHANGE_LOG_LAG'])
+        cursor = self.filter(timestamp__lte=before).order_by('-timestamp', '-pk').values_list('pk', flat=True)[:1]
+        return next(iter(cursor), 0)
+
+    def changes_since(self, user, cursor, limit):
+        """
+        Return ``(changes, cursor, reset)`` for the first ``limit`` changes
+        of ``user`` after ``cursor``, up to ``cursor()``: the changes, the
+        cursor to pass next time, and whether the client must reload all
+        its notifications instead, because the changes after ``cursor`` were
+        pruned or some created notifications are not known.
+        """
+        oldest = self.aggregate(oldest=Min('pk'))['oldest']
+        if oldest is not None and cursor < oldest - 1:
+            return [], self.cursor(), True
+        changes = list(self.filter(user=user, pk__gt=cursor, pk__lte=self.cursor()).order_by('pk')[:limit])
+        if not changes:
+            return [], cursor, False
+        reset = any(change.notification_id is None for change in changes)
+        return changes, changes[-1].pk, reset
+
+    def prunable(self, before):
+        """
+        Return the changes logged before the ``before`` datetime, except the
+        latest one which tells apart the pruned cursors.
+        """
+        return self.filter(timestamp__lt=before).exclude(pk=self.aggregate(latest=Max('pk'))['latest'])
+
+    def prune(self, before):
+        """Delete the changes of ``prunable(before)``."""
+        return self.prunable(before).delete()[0]
+
+
+class NotificationChange(models.Model):
+    """
+    A change of the notifications of ``user``, logged when ``USE_CHANGE_LOG``
+    is enabled so clients can fetch the changes since their last poll.
+    ``notification_id`` is empty when the ids of created notifications
+    are not known.
+    """
+    ACTIONS = Choices('created', 'updated', 'read', 'unread', 'deleted', 'active')
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name=_('user'),
+    )
+    notification_id = models.PositiveIntegerField(_('notification id'), blank=True, null=True)
+    action = models.CharField(_('action'), choices=ACTIONS, max_length=10)
+    timestamp = models.DateTimeField(_('timestamp'), default=timezone.now, db_index=True)
+
+    objects = NotificationChangeManager()
+
+    class Meta:
+        ordering = ('pk',)
+        verbose_name = _('Notification change')
+        verbose_name_plural = _('Notification changes')
+        indexes = [
+            models.Index(fields=['user', 'id']),
+        ]
+
+    def __str__(self):
+        return '%s %s' % (self.action, self.notification_id)
+
+
+def log_notification_changes(
+        sender, action, recipients, notifications=None, **kwargs):  # pylint: disable=unused-argument
+    if not get_config()['USE_CHANGE_LOG']:
+        return
+    if notifications is None:
+        # One entry per user, telling their clients to reload
+        changes = [NotificationChange(user_id=user_id, action=action) for user_id in set(recipients)]
+    else:
+        changes = [
+            NotificationChange(user_id=user_id, notification_id=notification_id, action=action)
+            for user_id, notification_id in zip(recipients, notifications)
+        ]
+    NotificationChange.objects.bulk_create(changes)
+
+
+notifications_changed.connect(log_notification_changes, dispatch_uid='notifications.models.change_log')
+
+
+class ArchivedNotificationManager(models.Manager.from_queryset(NotificationQuerySet)):
+
+    def archive(self, notifications):
+        """
+        Move ``notifications``, a queryset of notifications, to the archive
+        in a single transaction, keeping their ids. Return the number of
+        notifications moved.
+        """
+        Notification = notifications.model
+        db = router.db_for_write(Notification)
+        with transaction.atomic(using=db):
+            rows = list(notifications.using(db).order_by().select_for_update().values_list('pk', 'recipient_id'))
+            if not rows:
+                return 0
+            moved = Notification.objects.using(db).filter(pk__in=[row[0] for row in rows])
+            copied = {field.name: field.name for field in self.model._meta.concrete_fields}
+            _insert_select(self.model, moved, copied, None)
+            # Moved, not deleted: the lists are the same, without notifications_changed
+            models.QuerySet.delete(moved)
+        invalidate_unread_count([row[1] for row in rows], using=db)
+        cache.delete(ARCHIVE_BOUNDARY_KEY)
+        return len(rows)
+
+
+class ArchivedNotification(AbstractNotification):
+    """
+    A read notification moved out of the ``Notification`` table by
+    ``manage.py notifications_archive``, so that the table and its indexes
+    stay small. Listed after the recent notifications by the all list views
+    when ``USE_ARCHIVE`` is enabled.
+    """
+    recipient = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='archived_notifications',
+        verbose_name=_('recipient'),
+        db_index=False,
+    )
+    actor_content_type = models.ForeignKey(
+        ContentType,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name=_('actor content type')
+    )
+    target_content_type = models.ForeignKey(
+        ContentType,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name=_('target content type'),
+        blank=True,
+        null=True
+    )
+    action_object_content_type = models.ForeignKey(
+        ContentType,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name=_('action object content type'),
+        blank=True,
+        null=True
+    )
+
+    objects = ArchivedNotificationManager()
+
+    class Meta(AbstractNotification.Meta):
+        abstract = False
+        indexes = [
+            models.Index(fields=['recipient', '-timestamp'], name='notification_archive_idx'),
+        ]
+        verbose_name = _('Archived notification')
+        verbose_name_plural = _('Archived notifications')
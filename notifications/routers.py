@@ -0,0 +1,91 @@
+''' Django notifications database router '''
+# -*- coding: utf-8 -*-
+from contextlib import ContextDecorator
+from contextvars import ContextVar
+
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models.query import QuerySet
+
+from notifications import settings as notifications_settings
+
+PRIMARY_KEY = 'notifications:primary:%s'
+
+_read_database = ContextVar('notifications_read_database', default=None)
+
+
+def pin_to_primary(user_pks):
+    """
+    Send the reads of the users with these primary keys, or of every user
+    when ``user_pks`` is a queryset, to the primary database for
+    ``READ_YOUR_WRITES_WINDOW`` seconds. The next reads of the current
+    ``read_from_replica`` block go to the primary database too.
+    """
+    if _read_database.get() is not None:
+        _read_database.set(None)
+    config = notifications_settings.get_config()
+    if not config['READ_DATABASE'] or not config['READ_YOUR_WRITES_WINDOW']:
+        return
+    if isinstance(user_pks, QuerySet):
+        user_pks = ['all']
+    cache.set_many(
+        {PRIMARY_KEY % user_pk: True for user_pk in set(user_pks)}, config['READ_YOUR_WRITES_WINDOW'])
+
+
+def get_read_database(user):
+    """
+    Return the alias of the database the notifications of ``user`` are read
+    from: ``READ_DATABASE``, or ``None`` for the primary one when it is not
+    set or the notifications changed less than ``READ_YOUR_WRITES_WINDOW``
+    seconds ago.
+    """
+    alias = notifications_settings.get_config()['READ_DATABASE']
+    if not alias:
+        return None
+    if cache.get_many([PRIMARY_KEY % 'all', PRIMARY_KEY % user.pk]):
+        return None
+    return alias
+
+
+class read_from_replica(ContextDecorator):  # pylint: disable=invalid-name
+    """
+    Context manager sending the reads made inside it to the database of
+    ``get_read_database(user)`` with ``ReadReplicaRouter``::
+
+        with read_from_replica(request.user):
+            count = request.user.notifications.unread().count()
+
+    Only wrap code reading the notifications: the objects it returns are
+    bound to the replica.
+    """
+    def __init__(self, user):
+        self.user = user
+        self._tokens = []
+
+    def __enter__(self):
+        self._tokens.append(_read_database.set(get_read_database(self.user)))
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _read_database.reset(self._tokens.pop())
+
+
+class ReadReplicaRouter:
+    """
+    Database router sending the reads of the ``read_from_replica`` blocks to
+    ``READ_DATABASE``, and leaving the other queries to the next routers::
+
+        DATABASE_ROUTERS = ['notifications.routers.ReadReplicaRouter']
+    """
+    def db_for_read(self, model, **hints):  # pylint: disable=unused-argument
+        return _read_database.get()
+
+    def allow_relation(self, obj1, obj2, **hints):  # pylint: disable=unused-argument
+        alias = notifications_settings.get_config()['READ_DATABASE']
+        if not alias:
+            return None
+        # The replica holds the same rows as the primary database
+        databases = {DEFAULT_DB_ALIAS, alias}
+        if obj1._state.db in databases and obj2._state.db in databases:  # pylint: disable=protected-access
+            return True
+        return None
@@ -0,0 +1,200 @@
+''' Django notifications API serializers '''
+# -*- coding: utf-8 -*-
+from django.db import connections
+from django.db.models import Count, Window
+
+from notifications import settings as notifications_settings
+from notifications.base.models import RELATED_OBJECTS, _load_objects
+from notifications.dispatch import _load_backend
+from notifications.helpers import get_notification_dict, get_object_url
+from notifications.utils import id2slug
+
+TOTAL_COUNT = 'notifications_total_count'
+
+COMPACT_MEDIA_TYPE = 'application/vnd.django-notifications.compact+json'
+ROWS_MEDIA_TYPE = 'application/vnd.django-notifications.rows+json'
+
+# The keys of the compact encoding, other keys are kept as is
+SHORT_KEYS = {
+    'id': 'i',
+    'slug': 's',
+    'level': 'l',
+    'recipient': 'r',
+    'unread': 'u',
+    'actor': 'a',
+    'actor_url': 'au',
+    'actor_content_type': 'ac',
+    'actor_object_id': 'ai',
+    'verb': 'v',
+    'description': 'd',
+    'target': 't',
+    'target_url': 'tu',
+    'target_content_type': 'tc',
+    'target_object_id': 'ti',
+    'action_object': 'o',
+    'action_object_url': 'ou',
+    'action_object_content_type': 'oc',
+    'action_object_object_id': 'oi',
+    'timestamp': 'ts',
+    'public': 'p',
+    'deleted': 'x',
+    'emailed': 'e',
+    'data': 'dt',
+}
+
+
+def get_serializer():
+    """Return the serializer of the live API configured by ``SERIALIZER``."""
+    return _load_backend(notifications_settings.get_config()['SERIALIZER'])
+
+
+def get_requested_fields(request, model):
+    """
+    Return the list of keys of the ``fields`` argument of the request, a
+    comma separated list, or ``None`` for every key. Unknown keys are
+    ignored.
+    """
+    value = request.GET.get('fields')
+    if not value:
+        return None
+    opts = model._meta  # pylint: disable=protected-access
+    available = {field.name for field in opts.concrete_fields if field.editable}
+    available.add('slug')
+    available.update(RELATED_OBJECTS)
+    available.update(name + '_url' for name in RELATED_OBJECTS)
+    fields = [name for name in dict.fromkeys(name.strip() for name in value.split(',')) if name in available]
+    return fields or None
+
+
+def get_columns(model, fields):
+    """Return the names of the model fields needed to serialize the keys of ``fields``."""
+    opts = model._meta  # pylint: disable=protected-access
+    columns = set()
+    for name in fields:
+        if name == 'slug':
+            columns.add('id')
+        elif name in RELATED_OBJECTS or name[:-len('_url')] in RELATED_OBJECTS:
+            # with_related_objects() loads them all
+            for field in RELATED_OBJECTS:
+                field = opts.get_field(field)
+                columns.update((field.ct_field, field.fk_field))
+        else:
+            columns.add(name)
+    return [field.name for field in opts.concrete_fields if field.name in columns]
+
+
+def get_list_media_type(request):
+    """
+    Return the media type of the live-updater lists explicitly accepted by
+    the request, ``COMPACT_MEDIA_TYPE`` or ``ROWS_MEDIA_TYPE``, otherwise
+    ``'application/json'``.
+    """
+    for accepted_type in request.accepted_types:
+        media_type = '%s/%s' % (accepted_type.main_type, accepted_type.sub_type)
+        if media_type in (COMPACT_MEDIA_TYPE, ROWS_MEDIA_TYPE):
+            return media_type
+    return 'application/json'
+
+
+def encode_notification_list(notification_list, media_type):
+    """
+    Return ``(notification_list, columns)``: the dicts of
+    ``notification_list`` with the keys of ``SHORT_KEYS`` for
+    ``COMPACT_MEDIA_TYPE``, or lists of the values of the ``columns`` keys
+    for ``ROWS_MEDIA_TYPE``. ``columns`` is ``None`` for the other media
+    types.
+    """
+    if media_type == COMPACT_MEDIA_TYPE:
+        return [
+            {SHORT_KEYS.get(key, key): value for key, value in struct.items()} for struct in notification_list
+        ], None
+    if media_type == ROWS_MEDIA_TYPE:
+        columns = list(dict.fromkeys(key for struct in notification_list for key in struct))
+        return [[struct.get(key) for key in columns] for struct in notification_list], columns
+    return notification_list, None
+
+
+class BaseSerializer:
+    """
+    Base class for the serializers of the live API notification lists.
+    """
+    def serialize(self, request, queryset, limit, with_count=False, fields=None):
+        """
+        Return ``(notification_list, count)``: the dicts of the first
+        ``limit`` notifications of ``queryset``, with at least the keys of
+        ``fields`` if given, and, if ``with_count`` and the serializer can get
+        it with the same query, the number of notifications of
+        ``queryset``, otherwise ``None``.
+        """
+        raise NotImplementedError('subclasses of BaseSerializer must provide a serialize() method')
+
+
+class ModelSerializer(BaseSerializer):
+    """
+    Serialize notification instances with ``get_notification_dict()``.
+    """
+    def serialize(self, request, queryset, limit, with_count=False, fields=None):
+        if fields is not None:
+            # The related managers set the recipient of the notifications from its id
+            queryset = queryset.only('recipient', *get_columns(queryset.model, fields))
+        if fields is None or any(name in fields or name + '_url' in fields for name in RELATED_OBJECTS):
+            queryset = queryset.with_related_objects()
+        return [
+            get_notification_dict(notification, request, fields)
+            for notification in queryset[:limit]
+        ], None
+
+
+class ValuesSerializer(BaseSerializer):
+    """
+    Serialize the notifications from a ``values()`` projection of their
+    columns, without building model instances, and count them with a window
+    function in the same query when the database supports it.
+
+    The dicts are the same as ``ModelSerializer`` ones, but the
+    ``get_url_for_notifications()`` methods of the actors, targets and
+    action objects are passed ``None`` as notification.
+    """
+    def serialize(self, request, queryset, limit, with_count=False, fields=None):
+        model = queryset.model
+        if fields is None:
+            opts = model._meta  # pylint: disable=protected-access
+            columns = [field.name for field in opts.concrete_fields if field.editable]
+            if 'id' not in columns:
+                columns.insert(0, 'id')
+        else:
+            columns = get_columns(model, fields)
+        queryset = queryset.values(*columns)
+        with_count = with_count and connections[queryset.db].features.supports_over_clause
+        if with_count:
+            queryset = queryset.annotate(**{TOTAL_COUNT: Window(expression=Count('pk'))})
+        rows = list(queryset[:limit])
+        count = None
+        if with_count:
+            count = rows[0][TOTAL_COUNT] if rows else 0
+            for row in rows:
+                del row[TOTAL_COUNT]
+
+        generic_fields = [model._meta.get_field(name) for name in RELATED_OBJECTS]  # pylint: disable=protected-access
+        generic_fields = [field for field in generic_fields if field.ct_field in columns]
+        object_ids = {}
+        for row in rows:
+            for field in generic_fields:
+                content_type_id = row[field.ct_field]
+                object_id = row[field.fk_field]
+                if content_type_id is not None and object_id is not None:
+                    object_ids.setdefault(content_type_id, set()).add(object_id)
+        objects = _load_objects(object_ids, queryset.db)
+
+        for row in rows:
+            if 'id' in row:
+                row['slug'] = id2slug(row['id'])
+            for field in generic_fields:
+                obj = objects.get((row[field.ct_field], str(row[field.fk_field])))
+                if obj is None:
+                    continue
+                row[field.name] = str(obj)
+                url = get_object_url(obj, None, request)
+                if url:
+                    row[field.name + '_url'] = url
+        return rows, count
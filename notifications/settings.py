@@ -8,7 +8,29 @@ CONFIG_DEFAULTS = {
     'USE_JSONFIELD': False,
     'SOFT_DELETE': False,
     'NUM_TO_FETCH': 10,
-    'CACHE_TIMEOUT': 2,
+    'CACHE_TIMEOUT': 300,
+    'USE_ETAG': False,
+    'BULK_CREATE': False,
+    'BULK_CREATE_BATCH_SIZE': 500,
+    'DISPATCH_BACKEND': 'notifications.dispatch.ImmediateBackend',
+    'DISPATCH_MAX_WORKERS': 4,
+    'OUTBOX_MAX_ATTEMPTS': 5,
+    'USE_BROADCASTS': False,
+    'COALESCE_WINDOW': 3600,
+    'COALESCE_MAX_ACTORS': 5,
+    'USE_UNREAD_COUNTER': False,
+    'USE_CHANGE_LOG': False,
+    'CHANGE_LOG_LAG': 5,
+    'CHANGE_LOG_RETENTION': 30,
+    'KEYSET_PAGINATION': False,
+    'STREAM_BACKEND': None,
+    'STREAM_HEARTBEAT': 15,
+    'STREAM_TIMEOUT': 300,
+    'CHANNEL_LAYER': None,
+    'SERIALIZER': 'notifications.serializers.ModelSerializer',
+    'USE_ARCHIVE': False,
+    'READ_DATABASE': None,
+    'READ_YOUR_WRITES_WINDOW': 10,
 }
 
 
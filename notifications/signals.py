@@ -3,3 +3,14 @@
 from django.dispatch import Signal
 
 notify = Signal()
+
+# Sent with ``sender`` the Notification model whenever notifications are
+# created or change state. ``action`` is one of 'created', 'updated', 'read',
+# 'unread', 'deleted' or 'active'. ``recipients`` holds the recipient pk of
+# each changed notification (a user appears once per notification); it may
+# be a lazy ``values_list`` QuerySet for database-side fan-out.
+# ``notifications`` holds their pks in the same order, or None when unknown,
+# in which case a user may appear once for all their notifications. The
+# queryset methods only list the changed notifications with USE_CHANGE_LOG,
+# STREAM_BACKEND or CHANNEL_LAYER.
+notifications_changed = Signal()
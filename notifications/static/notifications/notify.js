@@ -5,9 +5,16 @@ var notify_fetch_count;
 var notify_unread_url;
 var notify_mark_all_unread_url;
 var notify_refresh_period = 15000;
+// Server-sent events URL; when set, poll only when the notifications change
+var notify_stream_url = null;
+// The stream only carries the changes made by the process serving it, so
+// still poll that often for the changes made by the other processes
+var notify_stream_refresh_period = 60000;
 // Set notify_mark_as_read to true to mark notifications as read when fetched
 var notify_mark_as_read = false;
 var consecutive_misfires = 0;
+// ETag of the last response, sent back so unchanged polls are answered with 304
+var notify_etag = null;
 var registered_functions = [];
 
 function fill_notification_badge(data) {
@@ -50,31 +57,41 @@ function register_notifier(func) {
     registered_functions.push(func);
 }
 
-function fetch_api_data() {
-    // only fetch data if a function is setup
-    if (registered_functions.length > 0) {
-        var r = new XMLHttpRequest();
-        var params = '?max=' + notify_fetch_count;
+function request_api_data() {
+    var r = new XMLHttpRequest();
+    var params = '?max=' + notify_fetch_count;
 
-        if (notify_mark_as_read) {
-            params += '&mark_as_read=true';
-        }
+    if (notify_mark_as_read) {
+        params += '&mark_as_read=true';
+    }
 
-        r.addEventListener('readystatechange', function(event) {
-            if (this.readyState === 4) {
-                if (this.status === 200) {
-                    consecutive_misfires = 0;
-                    var data = JSON.parse(r.responseText);
-                    for (var i = 0; i < registered_functions.length; i++) {
-                       registered_functions[i](data);
-                    }
-                } else {
-                    consecutive_misfires++;
+    r.addEventListener('readystatechange', function(event) {
+        if (this.readyState === 4) {
+            if (this.status === 304) {
+                consecutive_misfires = 0;
+            } else if (this.status === 200) {
+                consecutive_misfires = 0;
+                notify_etag = r.getResponseHeader('ETag');
+                var data = JSON.parse(r.responseText);
+                for (var i = 0; i < registered_functions.length; i++) {
+                   registered_functions[i](data);
                 }
+            } else {
+                consecutive_misfires++;
             }
-        });
-        r.open("GET", notify_api_url + params, true);
-        r.send();
+        }
+    });
+    r.open("GET", notify_api_url + params, true);
+    if (notify_etag) {
+        r.setRequestHeader('If-None-Match', notify_etag);
+    }
+    r.send();
+}
+
+function fetch_api_data() {
+    // only fetch data if a function is setup
+    if (registered_functions.length > 0) {
+        request_api_data();
     }
     if (consecutive_misfires < 10) {
         setTimeout(fetch_api_data, notify_refresh_period);
@@ -89,4 +106,34 @@ function fetch_api_data() {
     }
 }
 
-setTimeout(fetch_api_data, 1000);
+function start_notify() {
+    if (!notify_stream_url || typeof EventSource === 'undefined') {
+        fetch_api_data();
+        return;
+    }
+    var source = new EventSource(notify_stream_url);
+    function poll_while_streaming() {
+        if (source.readyState === EventSource.CLOSED) {
+            return;
+        }
+        if (registered_functions.length > 0) {
+            request_api_data();
+        }
+        setTimeout(poll_while_streaming, notify_stream_refresh_period);
+    }
+    setTimeout(poll_while_streaming, notify_stream_refresh_period);
+    // Sent on connection and after each change
+    source.addEventListener('unread_count', function(event) {
+        if (registered_functions.length > 0) {
+            request_api_data();
+        }
+    });
+    source.addEventListener('error', function(event) {
+        // The browser reconnects by itself unless the stream is unavailable
+        if (source.readyState === EventSource.CLOSED) {
+            fetch_api_data();
+        }
+    });
+}
+
+setTimeout(start_notify, 1000);
@@ -0,0 +1,155 @@
+''' Django notifications server-sent events backends '''
+# -*- coding: utf-8 -*-
+import asyncio
+import logging
+import queue
+import threading
+
+from django.db import router, transaction
+from django.db.models.query import QuerySet
+from swapper import load_model
+
+from notifications import settings as notifications_settings
+from notifications.dispatch import _load_backend
+
+logger = logging.getLogger(__name__)
+
+# Milliseconds browsers wait before reconnecting to a closed stream
+RETRY = 3000
+
+
+def get_stream_backend():
+    """Return the stream backend configured by ``STREAM_BACKEND``, or ``None``."""
+    path = notifications_settings.get_config()['STREAM_BACKEND']
+    return _load_backend(path) if path else None
+
+
+class Subscription:
+    """
+    The events published for one user, until ``close()``. Created in an
+    event loop, the events are read with ``aget()``, otherwise with ``get()``.
+    """
+    def __init__(self, backend, user_id, loop=None):
+        self.backend = backend
+        self.user_id = user_id
+        self.loop = loop
+        self.queue = asyncio.Queue() if loop else queue.Queue()
+
+    def put(self, event):
+        """Add ``event``; may be called from any thread."""
+        if self.loop is None:
+            self.queue.put(event)
+            return
+        try:
+            self.loop.call_soon_threadsafe(self.queue.put_nowait, event)
+        except RuntimeError:  # The loop is closed
+            self.close()
+
+    def get(self, timeout):
+        """Return the next event, or ``None`` after ``timeout`` seconds."""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    async def aget(self, timeout):
+        """Return the next event, or ``None`` after ``timeout`` seconds."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.backend.unsubscribe(self)
+
+
+class BaseStreamBackend:
+    """
+    Base class for stream backends.
+
+    ``publish()`` is called once the changes of the notifications of a user
+    are committed; ``subscribe()`` by the stream view of each connection.
+    The events are dicts with the ``action`` of the ``notifications_changed``
+    signal and the ids of the changed ``notifications`` (``None`` when not
+    known).
+    """
+    def publish(self, user_id, event):
+        """Send ``event`` to the subscriptions of ``user_id``, or of every user if ``None``."""
+        raise NotImplementedError('subclasses of BaseStreamBackend must provide a publish() method')
+
+    def subscribe(self, user_id, loop=None):
+        """Return a ``Subscription`` to the events of ``user_id``."""
+        raise NotImplementedError('subclasses of BaseStreamBackend must provide a subscribe() method')
+
+    def unsubscribe(self, subscription):
+        pass
+
+
+class InProcessBackend(BaseStreamBackend):
+    """
+    Deliver the events to the streams opened in the same process; the
+    changes made by other processes only reach ``notify.js`` through its
+    slow fallback poll.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscriptions = {}
+
+    def publish(self, user_id, event):
+        with self.lock:
+            if user_id is None:
+                subscriptions = [sub for subs in self.subscriptions.values() for sub in subs]
+            else:
+                subscriptions = list(self.subscriptions.get(user_id, ()))
+        for subscription in subscriptions:
+            subscription.put(event)
+
+    def subscribe(self, user_id, loop=None):
+        subscription = Subscription(self, user_id, loop)
+        with self.lock:
+            self.subscriptions.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            subscriptions = self.subscriptions.get(subscription.user_id, set())
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                self.subscriptions.pop(subscription.user_id, None)
+
+
+def publish_notification_changes(
+        sender, action, recipients, notifications=None, **kwargs):  # pylint: disable=unused-argument
+    """
+    ``notifications_changed`` receiver publishing the changes to the stream
+    backend and to the consumers of the channel layer, once committed.
+    """
+    backend = get_stream_backend()
+    channel_layer = notifications_settings.get_config()['CHANNEL_LAYER']
+    if backend is None and channel_layer is None:
+        return
+    if isinstance(recipients, QuerySet):
+        # Not worth listing the recipients, let every stream refresh
+        events = [(None, {'action': action, 'notifications': None})]
+    else:
+        by_user = {}
+        for index, user_id in enumerate(recipients):
+            by_user.setdefault(user_id, []).append(notifications[index] if notifications is not None else None)
+        events = [
+            (user_id, {'action': action, 'notifications': None if None in ids else ids})
+            for user_id, ids in by_user.items()
+        ]
+
+    def publish():
+        if channel_layer is not None:
+            from notifications.consumers import send_to_group
+        for user_id, event in events:
+            try:
+                if backend is not None:
+                    backend.publish(user_id, event)
+                if channel_layer is not None:
+                    send_to_group(user_id, event)
+            except Exception:  # pylint: disable=broad-except
+                logger.exception('Could not publish the %r notification changes', action)
+
+    transaction.on_commit(publish, using=router.db_for_write(load_model('notifications', 'Notification')))
@@ -1,14 +1,14 @@
 ''' Django notifications template tags file '''
 # -*- coding: utf-8 -*-
 from django import get_version
-from django.core.cache import cache
 from django.template import Library
 from django.utils.html import format_html
 from packaging.version import (
     parse as parse_version,  # pylint: disable=no-name-in-module,import-error
 )
 
-from notifications import settings
+from notifications.base.models import pending_broadcasts
+from notifications.helpers import get_cached_unread_count, get_unread_count
 from notifications.settings import get_config
 
 try:
@@ -23,11 +23,12 @@ register = Library()
 
 def get_cached_notification_unread_count(user):
 
-    return cache.get_or_set(
-        'cache_notification_unread_count',
-        user.notifications.unread().count,
-        settings.get_config()['CACHE_TIMEOUT']
-    )
+    def unread_count():
+        # The tags are read-only, the views deliver the broadcasts
+        broadcasts = pending_broadcasts(user)
+        return get_unread_count(user) + (broadcasts.count() if broadcasts is not None else 0)
+
+    return get_cached_unread_count(user, unread_count)
 
 def notifications_unread(context):
     user = user_context(context)
@@ -45,7 +46,10 @@ else:
 @register.filter
 def has_notification(user):
     if user:
-        return user.notifications.unread().exists()
+        if user.notifications.unread().exists():
+            return True
+        broadcasts = pending_broadcasts(user)
+        return broadcasts is not None and broadcasts.exists()
     return False
 
 
@@ -77,6 +81,7 @@ def register_notify_callbacks(badge_class='live_notify_badge',  # pylint: disabl
         notify_mark_all_unread_url='{mark_all_unread_url}';
         notify_refresh_period={refresh};
         notify_mark_as_read={mark_as_read};
+        notify_stream_url={stream_url};
     """.format(
         badge_class=badge_class,
         menu_class=menu_class,
@@ -85,7 +90,9 @@ def register_notify_callbacks(badge_class='live_notify_badge',  # pylint: disabl
         unread_url=reverse('notifications:unread'),
         mark_all_unread_url=reverse('notifications:mark_all_as_read'),
         fetch_count=fetch,
-        mark_as_read=str(mark_as_read).lower()
+        mark_as_read=str(mark_as_read).lower(),
+        stream_url="'%s'" % reverse('notifications:live_notification_stream')
+        if get_config()['STREAM_BACKEND'] else 'null'
     )
 
     # add a nonce value to the script tag if one is provided
@@ -0,0 +1,52 @@
+# Generated by Django 4.1.13 on 2026-10-18 19:06
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import jsonfield.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('test_models', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BigIntegerIdNotification',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('level', models.CharField(choices=[('success', 'success'), ('info', 'info'), ('warning', 'warning'), ('error', 'error')], default='info', max_length=20, verbose_name='level')),
+                ('unread', models.BooleanField(default=True, verbose_name='unread')),
+                ('verb', models.CharField(max_length=255, verbose_name='verb')),
+                ('description', models.TextField(blank=True, null=True, verbose_name='description')),
+                ('timestamp', models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='timestamp')),
+                ('public', models.BooleanField(default=True, verbose_name='public')),
+                ('deleted', models.BooleanField(default=False, verbose_name='deleted')),
+                ('emailed', models.BooleanField(default=False, verbose_name='emailed')),
+                ('data', jsonfield.fields.JSONField(blank=True, null=True, verbose_name='data')),
+                ('actor_object_id', models.BigIntegerField(verbose_name='actor object id')),
+                ('target_object_id', models.BigIntegerField(blank=True, null=True, verbose_name='target object id')),
+                ('action_object_object_id', models.BigIntegerField(blank=True, null=True, verbose_name='action object object id')),
+                ('legacy_target_object_id', models.CharField(blank=True, max_length=255, null=True)),
+                ('action_object_content_type', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='contenttypes.contenttype')),
+                ('actor_content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='contenttypes.contenttype')),
+                ('recipient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('target_content_type', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='contenttypes.contenttype')),
+            ],
+            options={
+                'verbose_name': 'Notification',
+                'verbose_name_plural': 'Notifications',
+                'ordering': ('-timestamp',),
+                'abstract': False,
+            },
+        ),
+        migrations.AddIndex(
+            model_name='bigintegeridnotification',
+            index=models.Index(fields=['target_content_type', 'target_object_id'], name='test_models_target_idx'),
+        ),
+    ]
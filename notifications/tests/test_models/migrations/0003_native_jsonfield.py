@@ -0,0 +1,24 @@
+# Generated by Django 4.1.13 on 2026-10-18 19:09
+
+import django.core.serializers.json
+from django.db import migrations, models
+import notifications.base.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('test_models', '0002_bigintegeridnotification'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='bigintegeridnotification',
+            name='data',
+            field=models.JSONField(blank=True, encoder=django.core.serializers.json.DjangoJSONEncoder, null=True, verbose_name='data'),
+        ),
+        migrations.AddIndex(
+            model_name='bigintegeridnotification',
+            index=models.Index(notifications.base.models.DataKey('thread_id'), name='test_models_thread_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.1.13 on 2026-10-18 20:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('test_models', '0003_native_jsonfield'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bigintegeridnotification',
+            index=models.Index(fields=['recipient', '-timestamp'], name='test_model_biginteger_recip'),
+        ),
+        migrations.AddIndex(
+            model_name='bigintegeridnotification',
+            index=models.Index(condition=models.Q(('unread', True)), fields=['recipient', '-timestamp'], name='test_model_biginteger_unread'),
+        ),
+    ]
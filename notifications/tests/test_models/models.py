@@ -1,4 +1,7 @@
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
 from django.db import models
+from notifications.base.models import AbstractBigIntegerIdNotification, data_index
 
 
 class Customer(models.Model):
@@ -15,3 +18,20 @@ class Customer(models.Model):
 class TargetObject(Customer):
     def get_url_for_notifications(self, notification, request):
         return f"bar/{self.id}/"
+
+
+class BigIntegerIdNotification(AbstractBigIntegerIdNotification):
+    recipient = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    actor_content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE, related_name='+')
+    target_content_type = models.ForeignKey(
+        ContentType, on_delete=models.CASCADE, related_name='+', blank=True, null=True)
+    action_object_content_type = models.ForeignKey(
+        ContentType, on_delete=models.CASCADE, related_name='+', blank=True, null=True)
+    # The text object id before the migration to integers
+    legacy_target_object_id = models.CharField(max_length=255, blank=True, null=True)
+
+    class Meta(AbstractBigIntegerIdNotification.Meta):
+        indexes = AbstractBigIntegerIdNotification.Meta.indexes + [
+            models.Index(fields=['target_content_type', 'target_object_id'], name='test_models_target_idx'),
+            data_index('thread_id', name='test_models_thread_idx'),
+        ]
@@ -5,24 +5,49 @@ Replace this with more appropriate tests for your application.
 '''
 # -*- coding: utf-8 -*-
 # pylint: disable=too-many-lines,missing-docstring
+import asyncio
+import io
 import json
+import os
+import threading
+from datetime import timedelta
+from unittest import mock, skipIf
 
 import pytz
 
+from asgiref.sync import async_to_sync, sync_to_async
+from django import get_version
 from django.conf import settings
+from django.apps import apps
 from django.contrib.auth.models import Group, User
+from django.contrib.contenttypes.models import ContentType
 from django.core.exceptions import ImproperlyConfigured
-from django.db import connection
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, connections, transaction
 from django.template import Context, Template
-from django.test import Client, RequestFactory, TestCase
+from django.test import RequestFactory, TestCase, TransactionTestCase, skipUnlessDBFeature
 from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 from django.utils.timezone import localtime, utc
-from notifications.base.models import notify_handler
-from notifications.signals import notify
-from notifications.utils import id2slug
+from packaging.version import parse as parse_version  # pylint: disable=no-name-in-module,import-error
+from notifications.base.models import _insert_select, anotify, notify_handler
+from notifications.dispatch import _load_backend, batch_notifications, get_dispatch_backend
+from notifications.helpers import (
+    UNREAD_COUNT_VERSION_KEY, UNREAD_COUNT_VERSION_TIMEOUT, NotificationArchiveList, get_cached_unread_count,
+    get_notifications_version,
+)
+from notifications.routers import PRIMARY_KEY, get_read_database, read_from_replica
+from notifications.signals import notifications_changed, notify
+from notifications.streaming import get_stream_backend
+from notifications.utils import copy_object_ids, id2slug, slug2id
 from swapper import load_model
-from notifications.tests.test_models.models import Customer, TargetObject
+from notifications.tests.test_models.models import BigIntegerIdNotification, Customer, TargetObject
+
+try:
+    from channels.testing import WebsocketCommunicator
+except ImportError:  # channels is not installed, or channels>=4 without daphne
+    WebsocketCommunicator = None
 
 Notification = load_model('notifications', 'Notification')
 
@@ -199,6 +224,1792 @@ class NotificationManagersTest(TestCase):
         self.assertEqual(Notification.objects.deleted().count(), 0)
 
 
+class NotificationBulkCreateTest(TestCase):
+    ''' Django notifications bulk creation tests '''
+    def setUp(self):
+        self.from_user = User.objects.create(username="from_bulk", password="pwd", email="example@example.com")
+        self.to_group = Group.objects.create(name="to_bulk_g")
+        for index in range(25):
+            user = User.objects.create(username="to_bulk%d" % index, password="pwd", email="example@example.com")
+            self.to_group.user_set.add(user)
+        self.target = Customer.objects.create(name='target')
+
+    def send(self):
+        return notify.send(self.from_user, recipient=self.to_group, verb='commented',
+                           action_object=self.from_user, target=self.target, url='/foo/')[0][1]
+
+    def test_default_saves_each_notification(self):
+        with CaptureQueriesContext(connection=connection) as context:
+            notifications = self.send()
+        self.assertEqual(len(notifications), 25)
+        self.assertGreaterEqual(len(context), 25)
+
+    @override_settings(DJANGO_NOTIFICATIONS_CONFIG={
+        'USE_JSONFIELD': True,
+        'BULK_CREATE': True,
+    })
+    def test_bulk_create(self):
+        self.send()  # warm up the content type cache
+        with CaptureQueriesContext(connection=connection) as context:
+            notifications = self.send()
+        # one query for the group members and one INSERT
+        self.assertEqual(len(context), 2)
+        self.assertEqual(len(notifications), 25)
+        self.assertEqual(Notification.objects.count(), 50)
+        for notification in notifications:
+            if connection.features.can_return_rows_from_bulk_insert:
+                self.assertIsNotNone(notification.pk)
+            self.assertEqual(notification.target, self.target)
+            self.assertEqual(notification.data, {'url': '/foo/'})
+
+    @override_settings(DJANGO_NOTIFICATIONS_CONFIG={
+        'BULK_CREATE': True,
+        'BULK_CREATE_BATCH_SIZE': 10,
+    })
+    def test_bulk_create_batch_size(self):
+        self.send()
+        with CaptureQueriesContext(connection=connection) as context:
+            self.send()
+        inserts = [query for query in context.captured_queries if query['sql'].startswith('INSERT')]
+        self.assertEqual(len(inserts), 3)
+
+
+class NotificationInsertSelectTest(TestCase):
+    ''' Django notifications INSERT ... SELECT fan-out tests '''
+    def setUp(self):
+        self.from_user = User.objects.create(username="from_select", password="pwd", email="example@example.com")
+        self.to_group = Group.objects.create(name="to_select_g")
+        for index in range(25):
+            user = User.objects.create(username="to_select%d" % index, password="pwd", email="example@example.com")
+            self.to_group.user_set.add(user)
+        self.target = Customer.objects.create(name='target')
+
+    def test_group(self):
+        notify.send(self.from_user, recipient=self.from_user, verb='warm up', target=self.target)
+        with CaptureQueriesContext(connection=connection) as context:
+            results = notify.send(self.from_user, recipient=self.to_group, verb='commented', target=self.target,
+                                  level='warning', insert_select=True, url='/foo/')
+        self.assertEqual(len(context), 1)
+        self.assertEqual(results[0][1], 25)
+
+        notifications = Notification.objects.filter(verb='commented')
+        self.assertEqual(notifications.count(), 25)
+        self.assertEqual(
+            set(notifications.values_list('recipient', flat=True)),
+            set(self.to_group.user_set.values_list('pk', flat=True))
+        )
+        for notification in notifications:
+            self.assertEqual(notification.actor, self.from_user)
+            self.assertEqual(notification.target, self.target)
+            self.assertIsNone(notification.action_object)
+            self.assertEqual(notification.level, 'warning')
+            self.assertTrue(notification.unread)
+            self.assertTrue(notification.public)
+            self.assertFalse(notification.deleted)
+            self.assertEqual(notification.data, {'url': '/foo/'})
+        self.assertEqual(len(set(notifications.values_list('timestamp', flat=True))), 1)
+
+    def test_queryset(self):
+        users = User.objects.filter(username__in=['to_select1', 'to_select2'])
+        results = notify.send(self.from_user, recipient=users, verb='commented', insert_select=True)
+        self.assertEqual(results[0][1], 2)
+        self.assertEqual(
+            set(Notification.objects.values_list('recipient', flat=True)),
+            set(users.values_list('pk', flat=True))
+        )
+
+    def test_single_user_returns_count(self):
+        results = notify.send(self.from_user, recipient=self.from_user, verb='commented', insert_select=True)
+        self.assertEqual(results[0][1], 1)
+        self.assertEqual(Notification.objects.count(), 1)
+
+
+@skipIf(parse_version(get_version()) < parse_version('4.1'), 'The async ORM requires Django >= 4.1')
+class AsyncNotifyTest(TestCase):
+    ''' Django notifications anotify tests '''
+    def setUp(self):
+        self.from_user = User.objects.create_user(username="from_async", password="pwd", email="example@example.com")
+        self.to_user = User.objects.create_user(username="to_async", password="pwd", email="example@example.com")
+        self.to_group = Group.objects.create(name="to_async_g")
+        self.to_group.user_set.add(self.from_user, self.to_user)
+        self.async_client.force_login(self.to_user)
+
+    async def test_anotify(self):
+        notifications = await anotify(self.from_user, recipient=self.to_user, verb='commented',
+                                      action_object=self.from_user, level='warning', url='/foo/')
+        self.assertEqual(len(notifications), 1)
+        notification = await Notification.objects.select_related('actor_content_type').aget(
+            pk=notifications[0].pk)
+        self.assertEqual(notification.recipient_id, self.to_user.pk)
+        self.assertEqual(notification.actor_object_id, str(self.from_user.pk))
+        self.assertEqual(notification.actor_content_type.model, 'user')
+        self.assertEqual(notification.level, 'warning')
+        self.assertEqual(notification.data, {'url': '/foo/'})
+
+    async def test_anotify_group(self):
+        notifications = await anotify(self.from_user, recipient=self.to_group, verb='commented')
+        self.assertEqual(len(notifications), 2)
+        self.assertEqual(await Notification.objects.filter(verb='commented').acount(), 2)
+
+    @override_settings(DJANGO_NOTIFICATIONS_CONFIG={
+        'BULK_CREATE': True,
+    })
+    async def test_anotify_bulk_create(self):
+        notifications = await anotify(self.from_user, recipient=self.to_group, verb='commented')
+        self.assertEqual(len(notifications), 2)
+        self.assertEqual(await Notification.objects.filter(verb='commented').acount(), 2)
+
+    async def test_anotify_insert_select(self):
+        count = await anotify(self.from_user, recipient=self.to_group, verb='commented', insert_select=True)
+        self.assertEqual(count, 2)
+        self.assertEqual(await Notification.objects.filter(verb='commented').acount(), 2)
+
+    async def test_async_view(self):
+        response = await self.async_client.get('/test_make_async/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content.decode('utf-8')), {'created': 1})
+        count = await sync_to_async(self.to_user.notifications.unread().count)()
+        self.assertEqual(count, 1)
+
+
+@skipIf(os.environ.get('SAMPLE_APP', False), 'The outbox requires the notifications app')
+@override_settings(DJANGO_NOTIFICATIONS_CONFIG={
+    'USE_JSONFIELD': True,
+    'DISPATCH_BACKEND': 'notifications.dispatch.OutboxBackend',
+})
+class OutboxDispatchTest(TestCase):
+    ''' Django notifications outbox dispatch backend tests '''
+    def setUp(self):
+        from notifications.models import OutboxEvent
+        self.OutboxEvent = OutboxEvent  # pylint: disable=invalid-name
+        self.from_user = User.objects.create(username="from_outbox", password="pwd", email="example@example.com")
+        self.to_group = Group.objects.create(name="to_outbox_g")
+        for index in range(5):
+            user = User.objects.create(username="to_outbox%d" % index, password="pwd", email="example@example.com")
+            self.to_group.user_set.add(user)
+        self.target = Customer.objects.create(name='target')
+
+    def test_group(self):
+        with CaptureQueriesContext(connection=connection) as context:
+            results = notify.send(self.from_user, recipient=self.to_group, verb='commented',
+                                  target=self.target, level='warning', url='/foo/')
+        self.assertEqual(len(context), 1)
+        event = results[0][1]
+        self.assertEqual(self.OutboxEvent.objects.count(), 1)
+        self.assertEqual(Notification.objects.count(), 0)
+
+        call_command('notifications_worker', '--once', stdout=open(os.devnull, 'w'))
+        self.assertEqual(self.OutboxEvent.objects.count(), 0)
+        notifications = Notification.objects.all()
+        self.assertEqual(notifications.count(), 5)
+        for notification in notifications:
+            self.assertEqual(notification.actor, self.from_user)
+            self.assertEqual(notification.target, self.target)
+            self.assertEqual(notification.level, 'warning')
+            self.assertEqual(notification.timestamp, event.timestamp)
+            self.assertEqual(notification.data, {'url': '/foo/'})
+
+    def test_recipient_types(self):
+        users = User.objects.filter(username__in=['to_outbox1', 'to_outbox2'])
+        notify.send(self.from_user, recipient=users, verb='queryset')
+        notify.send(self.from_user, recipient=list(users), verb='list')
+        notify.send(self.from_user, recipient=self.from_user, verb='user')
+        self.assertEqual(get_dispatch_backend().process(), 3)
+        self.assertEqual(
+            set(Notification.objects.filter(verb='queryset').values_list('recipient', flat=True)),
+            set(users.values_list('pk', flat=True))
+        )
+        self.assertEqual(Notification.objects.filter(verb='list').count(), 2)
+        self.assertEqual(Notification.objects.get(verb='user').recipient, self.from_user)
+
+    def test_queryset_recipient_payload(self):
+        users = User.objects.filter(username__in=['to_outbox1', 'to_outbox2'])
+        event = notify.send(self.from_user, recipient=users, verb='queryset', insert_select=True)[0][1]
+        self.assertEqual(sorted(event.payload['recipient']['users']), sorted(users.values_list('pk', flat=True)))
+        self.assertEqual(get_dispatch_backend().process(), 1)
+        self.assertEqual(Notification.objects.filter(verb='queryset').count(), 2)
+
+        event = self.OutboxEvent.objects.create(verb='pickled', payload={'recipient': {'query': 'gASV'}})
+        with self.assertLogs('notifications.dispatch', level='ERROR'):
+            self.assertEqual(get_dispatch_backend().process(), 0)
+        self.assertFalse(Notification.objects.filter(verb='pickled').exists())
+
+    @override_settings(DJANGO_NOTIFICATIONS_CONFIG={
+        'USE_JSONFIELD': True,
+        'DISPATCH_BACKEND': 'notifications.dispatch.OutboxBackend',
+        'OUTBOX_MAX_ATTEMPTS': 2,
+    })
+    def test_failed_event_is_kept(self):
+        notify.send(self.from_user, recipient=self.from_user, verb='commented', target=self.target)
+        self.target.delete()
+        with self.assertLogs('notifications.dispatch', level='ERROR'):
+            self.assertEqual(get_dispatch_backend().process(), 0)
+        event = self.OutboxEvent.objects.get()
+        self.assertEqual(event.attempts, 1)
+        self.assertFalse(self.OutboxEvent.objects.failed().exists())
+
+        with self.assertLogs('notifications.dispatch', level='ERROR') as logs:
+            get_dispatch_backend().process()
+        self.assertIn('Giving up outbox event %s after 2 attempts' % event.pk, logs.output[-1])
+        self.assertEqual(list(self.OutboxEvent.objects.failed()), [event])
+        # Given up: no longer expanded
+        with CaptureQueriesContext(connection=connection) as context:
+            self.assertEqual(get_dispatch_backend().process(), 0)
+        self.assertEqual(len(context), 1)
+        self.assertEqual(self.OutboxEvent.objects.get().attempts, 2)
+
+        out = io.StringIO()
+        with self.assertLogs('notifications.dispatch', level='ERROR'):
+            call_command('notifications_worker', '--once', '--retry-failed', stdout=out)
+        self.assertIn('Retrying 1 failed outbox events.', out.getvalue())
+        self.assertEqual(self.OutboxEvent.objects.get().attempts, 1)
+
+
+@override_settings(DJANGO_NOTIFICATIONS_CONFIG={
+    'DISPATCH_BACKEND': 'notifications.dispatch.ThreadPoolBackend',
+})
+class ThreadPoolDispatchTest(TransactionTestCase):
+    ''' Django notifications thread pool dispatch backend tests '''
+    def tearDown(self):
+        _load_backend.cache_clear()
+
+    def test_thread_pool(self):
+        from_user = User.objects.create(username="from_pool", password="pwd", email="example@example.com")
+        to_user = User.objects.create(username="to_pool", password="pwd", email="example@example.com")
+        results = notify.send(from_user, recipient=to_user, verb='commented')
+        self.assertIsNone(results[0][1])
+        get_dispatch_backend().executor.shutdown(wait=True)
+        self.assertEqual(to_user.notifications.count(), 1)
+
+
+class BatchNotificationsTest(TestCase):
+    ''' Django notifications transaction-scoped batching tests '''
+    def setUp(self):
+        self.from_user = User.objects.create(username="from_batch", password="pwd", email="example@example.com")
+        self.to_users = [
+            User.objects.create(username="to_batch%d" % index, password="pwd", email="example@example.com")
+            for index in range(10)
+        ]
+        notify.send(self.from_user, recipient=self.from_user, verb='warm up')
+
+    def test_batch(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic(), batch_notifications():
+                for to_user in self.to_users:
+                    results = notify.send(self.from_user, recipient=to_user, verb='commented', url='/foo/')
+                    self.assertIsNone(results[0][1])
+                self.assertEqual(Notification.objects.filter(verb='commented').count(), 0)
+        notifications = Notification.objects.filter(verb='commented')
+        self.assertEqual(notifications.count(), 10)
+        self.assertEqual(set(notification.recipient for notification in notifications), set(self.to_users))
+        self.assertEqual(notifications[0].data, {'url': '/foo/'})
+
+    def test_batch_single_insert(self):
+        with CaptureQueriesContext(connection=connection) as context:
+            with self.captureOnCommitCallbacks(execute=True), batch_notifications():
+                for to_user in self.to_users:
+                    notify.send(self.from_user, recipient=to_user, verb='commented')
+                notify.send(self.from_user, recipient=User.objects.filter(pk__in=[u.pk for u in self.to_users]),
+                            verb='commented')
+        inserts = [query for query in context.captured_queries if query['sql'].startswith('INSERT')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(Notification.objects.filter(verb='commented').count(), 20)
+
+    def test_batch_rollback(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic(), batch_notifications():
+                    notify.send(self.from_user, recipient=self.to_users[0], verb='commented')
+                    raise ValueError
+            except ValueError:
+                pass
+        self.assertEqual(Notification.objects.filter(verb='commented').count(), 0)
+
+    def test_batch_savepoint_rollback(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic(), batch_notifications():
+                notify.send(self.from_user, recipient=self.to_users[0], verb='kept')
+                try:
+                    with transaction.atomic():
+                        notify.send(self.from_user, recipient=self.to_users[1], verb='dropped')
+                        raise ValueError
+                except ValueError:
+                    pass
+        self.assertEqual(list(Notification.objects.exclude(verb='warm up').values_list('verb', flat=True)), ['kept'])
+
+    def test_decorator(self):
+        @batch_notifications()
+        def send_all():
+            for to_user in self.to_users:
+                notify.send(self.from_user, recipient=to_user, verb='commented')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            send_all()
+            send_all()
+        self.assertEqual(Notification.objects.filter(verb='commented').count(), 20)
+
+
+@skipIf(os.environ.get('SAMPLE_APP', False), 'Broadcasts require the notifications app')
+@override_settings(DJANGO_NOTIFICATIONS_CONFIG={
+    'USE_JSONFIELD': True,
+    'USE_BROADCASTS': True,
+})
+class BroadcastTest(TestCase):
+    ''' Django notifications broadcast tests '''
+    def setUp(self):
+        from notifications.models import Broadcast
+        self.Broadcast = Broadcast  # pylint: disable=invalid-name
+        self.from_user = User.objects.create_user(username="from", password="pwd", email="example@example.com")
+        self.to_user = User.objects.create_user(username="to", password="pwd", email="example@example.com")
+        self.other_user = User.objects.create_user(username="other", password="pwd", email="example@example.com")
+        self.to_group = Group.objects.create(name="to_broadcast_g")
+        self.to_group.user_set.add(self.to_user)
+        self.target = Customer.objects.create(name='target')
+        self.client.force_login(self.to_user)
+
+    def unread_count(self):
+        response = self.client.get(reverse('notifications:live_unread_notification_count'))
+        return json.loads(response.content.decode('utf-8'))['unread_count']
+
+    def test_broadcast_is_one_row(self):
+        ContentType.objects.get_for_models(self.from_user, self.target)
+        with CaptureQueriesContext(connection=connection) as context:
+            results = notify.send(self.from_user, verb='announced', target=self.target, broadcast=True, url='/foo/')
+        self.assertEqual(len(context), 1)
+        self.assertIsInstance(results[0][1], self.Broadcast)
+        self.assertEqual(self.Broadcast.objects.count(), 1)
+        self.assertEqual(Notification.objects.count(), 0)
+
+    def test_delivered_on_read(self):
+        notify.send(self.from_user, verb='announced', target=self.target, level='warning', broadcast=True,
+                    url='/foo/')
+        self.assertEqual(self.unread_count(), 1)
+        self.assertEqual(self.unread_count(), 1)
+        notification = self.to_user.notifications.get()
+        self.assertEqual(notification.actor, self.from_user)
+        self.assertEqual(notification.target, self.target)
+        self.assertEqual(notification.level, 'warning')
+        self.assertEqual(notification.data, {'url': '/foo/'})
+        self.assertEqual(Notification.objects.count(), 1)
+
+        notification.mark_as_read()
+        self.assertEqual(self.unread_count(), 0)
+
+        response = self.client.get(reverse('notifications:live_unread_notification_list'))
+        self.assertEqual(json.loads(response.content.decode('utf-8'))['unread_list'], [])
+        response = self.client.get(reverse('notifications:all'))
+        self.assertEqual(len(response.context['notifications']), 1)
+
+    @override_settings(DJANGO_NOTIFICATIONS_CONFIG={
+        'USE_JSONFIELD': True,
+        'USE_BROADCASTS': True,
+        'USE_ETAG': True,
+    })
+    def test_not_modified(self):
+        url = reverse('notifications:live_unread_notification_count')
+        etag = self.client.get(url)['ETag']
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertFalse(any('notifications_broadcast' in query['sql'] for query in context.captured_queries))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            notify.send(self.from_user, verb='announced', broadcast=True)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content.decode('utf-8'))['unread_count'], 1)
+
+    def test_group_broadcast(self):
+        notify.send(self.from_user, recipient=self.to_group, verb='announced', broadcast=True)
+        self.assertEqual(self.unread_count(), 1)
+        self.client.force_login(self.other_user)
+        self.assertEqual(self.unread_count(), 0)
+
+    def test_new_users_skip_older_broadcasts(self):
+        notify.send(self.from_user, verb='announced', broadcast=True)
+        self.to_user.date_joined = timezone.now()
+        self.to_user.save()
+        self.assertEqual(self.unread_count(), 0)
+        notify.send(self.from_user, verb='announced again', broadcast=True)
+        self.assertEqual(self.unread_count(), 1)
+
+    def test_template_tags_are_read_only(self):
+        notify.send(self.from_user, verb='announced', broadcast=True)
+        request = RequestFactory().get('/')
+        request.user = self.to_user
+        template = Template('{% load notifications_tags %}{{ user|has_notification }} {% notifications_unread %}')
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(template.render(Context({'user': self.to_user, 'request': request})), 'True 1')
+        self.assertFalse([query for query in context.captured_queries if not query['sql'].startswith('SELECT')])
+        self.assertEqual(Notification.objects.count(), 0)
+
+    def test_invalid_recipient(self):
+        self.assertRaises(ValueError, notify.send, self.from_user, recipient=self.to_user, verb='announced',
+                          broadcast=True)
+
+    @override_settings(DJANGO_NOTIFICATIONS_CONFIG={})
+    def test_disabled(self):
+        self.assertRaises(ImproperlyConfigured, notify.send, self.from_user, verb='announced', broadcast=True)
+
+
+class CoalesceTest(TestCase):
+    ''' Django notifications write-time coalescing tests '''
+    def setUp(self):
+        self.to_user = User.objects.create(username="to_coalesce", password="pwd", email="example@example.com")
+        self.actors = [
+            User.objects.create(username="actor%d" % index, password="pwd", email="example@example.com")
+            for index in range(8)
+        ]
+        self.target = Customer.objects.create(name='post')
+
+    def like(self, actor, **kwargs):
+        return notify.send(actor, recipient=self.to_user, verb='liked', target=self.target, coalesce=True,
+                           **kwargs)[0][1]
+
+    def test_coalesce(self):
+        for actor in self.actors:
+            self.like(actor, url='/post/')
+        notification = self.to_user.notifications.get()
+        self.assertEqual(notification.actor, self.actors[-1])
+        self.assertEqual(notification.data['actor_count'], 8)
+        self.assertEqual(notification.data['url'], '/post/')
+        self.assertEqual(
+            notification.data['actors'],
+            [[notification.actor_content_type_id, str(actor.pk)] for actor in reversed(self.actors[-5:])]
+        )
+
+    def test_same_actor_counted_once(self):
+        self.like(self.actors[0])
+        self.like(self.actors[1])
+        self.like(self.actors[0])
+        notification = self.to_user.notifications.get()
+        self.assertEqual(notification.data['actor_count'], 2)
+        self.assertEqual(notification.actor, self.actors[0])
+
+    def test_dropped_actor_counted_once(self):
+        for actor in self.actors[:6] + [self.actors[0]]:
+            self.like(actor)
+        notification = self.to_user.notifications.get()
+        self.assertEqual(notification.data['actor_count'], 6)
+        self.assertEqual(len(notification.data['actors']), 5)
+
+    def test_read_notifications_are_not_updated(self):
+        self.like(self.actors[0])
+        self.to_user.notifications.mark_all_as_read()
+        self.like(self.actors[1])
+        self.assertEqual(self.to_user.notifications.count(), 2)
+        self.assertEqual(self.to_user.notifications.unread().get().data['actor_count'], 1)
+
+    def test_different_target_or_verb(self):
+        self.like(self.actors[0])
+        notify.send(self.actors[1], recipient=self.to_user, verb='liked', coalesce=True)
+        notify.send(self.actors[1], recipient=self.to_user, verb='shared', target=self.target, coalesce=True)
+        self.assertEqual(self.to_user.notifications.count(), 3)
+
+    @override_settings(DJANGO_NOTIFICATIONS_CONFIG={
+        'COALESCE_WINDOW': 60,
+    })
+    def test_window(self):
+        self.like(self.actors[0], timestamp=timezone.now() - timedelta(minutes=2))
+        self.like(self.actors[1])
+        self.assertEqual(self.to_user.notifications.count(), 2)
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class CoalesceConcurrencyTest(TransactionTestCase):
+    ''' Django notifications concurrent coalescing tests '''
+    def test_concurrent_first_sends(self):
+        to_user = User.objects.create(username="to_coalesce", password="pwd", email="example@example.com")
+        actors = [
+            User.objects.create(username="actor%d" % index, password="pwd", email="example@example.com")
+            for index in range(4)
+        ]
+        target = Customer.objects.create(name='post')
+        barrier = threading.Barrier(len(actors))
+        errors = []
+
+        def like(actor):
+            try:
+                barrier.wait()
+                notify.send(actor, recipient=to_user, verb='liked', target=target, coalesce=True)
+            except Exception as error:  # pylint: disable=broad-except
+                errors.append(error)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=like, args=(actor,)) for actor in actors]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        notification = to_user.notifications.get()
+        self.assertEqual(notification.data['actor_count'], len(actors))
+
+
+@skipIf(os.environ.get('SAMPLE_APP', False), 'Unread counters require the notifications app')
+@override_settings(DJANGO_NOTIFICATIONS_CONFIG={
+    'USE_UNREAD_COUNTER': True,
+})
+class UnreadCounterTest(TestCase):
+    ''' Django notifications denormalized unread counter tests '''
+    def setUp(self):
+        from notifications.models import UnreadCounter
+        self.UnreadCounter = UnreadCounter  # pylint: disable=invalid-name
+        self.from_user = User.objects.create_user(username="from", password="pwd", email="example@example.com")
+        self.to_user = User.objects.create_user(username="to", password="pwd", email="example@example.com")
+        self.other_user = User.objects.create_user(username="other", password="pwd", email="example@example.com")
+        self.to_group = Group.objects.create(name="to_counter_g")
+        self.to_group.user_set.add(self.to_user, self.other_user)
+        notify.send(self.from_user, recipient=self.to_user, verb='commented')
+        # Creates the counters
+        self.assertEqual(self.UnreadCounter.objects.unread_count(self.to_user), 1)
+        self.assertEqual(self.UnreadCounter.objects.unread_count(self.other_user), 0)
+
+    def counter(self, user):
+        return self.UnreadCounter.objects.get(user=user).unread_count
+
+    def test_created(self):
+        notify.send(self.from_user, recipient=self.to_group, verb='commented')
+        notify.send(self.from_user, recipient=[self.to_user, self.to_user], verb='commented')
+        notify.send(self.from_user, recipient=self.to_group.user_set.all(), verb='commented', insert_select=True)
+        self.assertEqual(self.counter(self.to_user), 5)
+        self.assertEqual(self.counter(self.other_user), 2)
+
+    def test_created_in_batch(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with batch_notifications():
+                notify.send(self.from_user, recipient=self.to_group, verb='commented')
+        self.assertEqual(self.counter(self.to_user), 2)
+        self.assertEqual(self.counter(self.other_user), 1)
+
+    def test_state_changes(self):
+        notification = self.to_user.notifications.get()
+        notification.mark_as_read()
+        self.assertEqual(self.counter(self.to_user), 0)
+        notification.mark_as_unread()
+        self.assertEqual(self.counter(self.to_user), 1)
+        self.to_user.notifications.mark_all_as_read()
+        self.assertEqual(self.counter(self.to_user), 0)
+        self.to_user.notifications.mark_all_as_unread()
+        self.assertEqual(self.counter(self.to_user), 1)
+        notification.delete()
+        self.assertEqual(self.counter(self.to_user), 0)
+
+    def test_queryset_delete(self):
+        notify.send(self.from_user, recipient=self.to_group, verb='commented')
+        load_model('notifications', 'Notification').objects.filter(recipient=self.to_user).delete()
+        self.assertEqual(self.counter(self.to_user), 0)
+        self.assertEqual(self.counter(self.other_user), 1)
+
+    @override_settings(DJANGO_NOTIFICATIONS_CONFIG={
+        'USE_UNREAD_COUNTER': True,
+        'SOFT_DELETE': True,
+    })
+    def test_soft_delete(self):
+        self.to_user.notifications.mark_all_as_deleted()
+        self.assertEqual(self.counter(self.to_user), 0)
+        self.to_user.notifications.mark_all_as_active()
+        self.assertEqual(self.counter(self.to_user), 1)
+
+    def test_first_read_racing_a_send(self):
+        queryset_class = type(self.from_user.notifications.unread())
+        real_count = queryset_class.count
+
+        def count(queryset):
+            result = real_count(queryset)
+            notify.send(self.to_user, recipient=self.from_user, verb='commented')
+            return result
+
+        with mock.patch.object(queryset_class, 'count', count):
+            self.assertEqual(self.UnreadCounter.objects.unread_count(self.from_user), 0)
+        self.assertEqual(self.counter(self.from_user), 1)
+
+    def test_unread_count_is_one_query(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.UnreadCounter.objects.unread_count(self.to_user), 1)
+
+    def test_live_unread_count(self):
+        self.client.force_login(self.to_user)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('notifications:live_unread_notification_count'))
+        self.assertEqual(json.loads(response.content.decode('utf-8'))['unread_count'], 1)
+        self.assertFalse(any('COUNT(' in query['sql'] for query in context.captured_queries))
+
+    def test_rebuild_command(self):
+        self.UnreadCounter.objects.filter(user=self.to_user).update(unread_count=42)
+        self.UnreadCounter.objects.filter(user=self.other_user).delete()
+        call_command('notifications_rebuild_counters', '--create', stdout=open(os.devnull, 'w'))
+        self.assertEqual(self.counter(self.to_user), 1)
+        self.assertEqual(self.counter(self.other_user), 0)
+        self.assertEqual(self.counter(self.from_user), 0)
+
+
+class UnreadCountCacheTest(TestCase):
+    ''' Django notifications unread count cache tests '''
+    def setUp(self):
+        cache.clear()
+        self.from_user = User.objects.create_user(username="from", password="pwd", email="example@example.com")
+        self.to_user = User.objects.create_user(username="to", password="pwd", email="example@example.com")
+        self.other_user = User.objects.create_user(username="other", password="pwd", email="example@example.com")
+        self.to_group = Group.objects.create(name="to_cache_g")
+        self.to_group.user_set.add(self.to_user, self.other_user)
+        notify.send(self.from_user, recipient=self.to_user, verb='commented')
+
+    def unread(self, user):
+        request = RequestFactory().get('/')
+        request.user = user
+        template = Template('{% load notifications_tags %}{% notifications_unread %}')
+        return template.render(Context({'user': user, 'request': request}))
+
+    def test_per_user(self):
+        self.assertEqual(self.unread(self.to_user), '1')
+        self.assertEqual(self.unread(self.other_user), '0')
+
+    def test_cached(self):
+        self.unread(self.to_user)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.unread(self.to_user), '1')
+
+    def test_invalidated_on_notify(self):
+        self.unread(self.to_user)
+        self.unread(self.other_user)
+        with self.captureOnCommitCallbacks(execute=True):
+            notify.send(self.from_user, recipient=self.to_user, verb='commented')
+            # Not committed yet, the other transactions still see one
+            with self.assertNumQueries(0):
+                self.assertEqual(self.unread(self.to_user), '1')
+        self.assertEqual(self.unread(self.to_user), '2')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.unread(self.other_user), '0')
+        with self.captureOnCommitCallbacks(execute=True):
+            notify.send(self.from_user, recipient=self.to_group.user_set.all(), verb='commented', insert_select=True)
+        self.assertEqual(self.unread(self.to_user), '3')
+        self.assertEqual(self.unread(self.other_user), '1')
+
+    def test_invalidated_on_state_changes(self):
+        notification = self.to_user.notifications.get()
+        self.unread(self.to_user)
+        with self.captureOnCommitCallbacks(execute=True):
+            notification.mark_as_read()
+        self.assertEqual(self.unread(self.to_user), '0')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.to_user.notifications.mark_all_as_unread()
+        self.assertEqual(self.unread(self.to_user), '1')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.to_user.notifications.all().delete()
+        self.assertEqual(self.unread(self.to_user), '0')
+
+    def test_versions_expire(self):
+        with mock.patch.object(cache, 'add', wraps=cache.add) as add:
+            self.unread(self.to_user)
+        for user_pk in ('all', self.to_user.pk):
+            add.assert_any_call(UNREAD_COUNT_VERSION_KEY % user_pk, mock.ANY, UNREAD_COUNT_VERSION_TIMEOUT)
+        version = get_notifications_version(self.to_user)
+
+        cache.delete_many([UNREAD_COUNT_VERSION_KEY % 'all', UNREAD_COUNT_VERSION_KEY % self.to_user.pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            notify.send(self.from_user, recipient=self.to_user, verb='commented')
+        self.assertEqual(self.unread(self.to_user), '2')
+        self.assertNotEqual(get_notifications_version(self.to_user), version)
+
+
+class RelatedObjectsTest(TestCase):
+    ''' Django notifications batched related objects tests '''
+    def setUp(self):
+        self.to_user = User.objects.create_user(username="to", password="pwd", email="example@example.com")
+        self.client.force_login(self.to_user)
+        ContentType.objects.get_for_models(User, Customer, TargetObject)  # warm up the content type cache
+
+    def send(self, count):
+        start = User.objects.count()
+        for index in range(start, start + count):
+            actor = User.objects.create(username="actor%d" % index, password="pwd", email="example@example.com")
+            notify.send(actor, recipient=self.to_user, verb='commented',
+                        target=Customer.objects.create(name='customer%d' % index),
+                        action_object=TargetObject.objects.create(name='object%d' % index))
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context)
+
+    def test_with_related_objects(self):
+        self.send(3)
+        notifications = list(self.to_user.notifications.with_related_objects())
+        with self.assertNumQueries(0):
+            for notification in notifications:
+                index = notification.actor.username[len('actor'):]
+                self.assertEqual(notification.target.name, 'customer' + index)
+                self.assertEqual(notification.action_object.name, 'object' + index)
+
+    def test_deleted_object(self):
+        self.send(1)
+        Customer.objects.filter(name='customer1').delete()
+        notification = self.to_user.notifications.with_related_objects().get()
+        with self.assertNumQueries(0):
+            self.assertIsNone(notification.target)
+            self.assertEqual(notification.actor.username, 'actor1')
+
+    def test_values_are_not_affected(self):
+        self.send(1)
+        self.assertEqual(len(self.to_user.notifications.with_related_objects().values('pk')), 1)
+
+    def test_constant_queries(self):
+        urls = [
+            reverse('notifications:live_unread_notification_list') + '?max=100',
+            reverse('notifications:live_all_notification_list') + '?max=100',
+            reverse('notifications:all'),
+            reverse('notifications:unread'),
+        ]
+        self.send(2)
+        queries = [self.count_queries(url) for url in urls]
+        self.send(10)
+        self.assertEqual([self.count_queries(url) for url in urls], queries)
+
+
+@override_settings(DJANGO_NOTIFICATIONS_CONFIG={'USE_ETAG': True})
+class LiveETagTest(TestCase):
+    ''' Django notifications live API conditional responses tests '''
+    def setUp(self):
+        cache.clear()
+        self.from_user = User.objects.create_user(username="from", password="pwd", email="example@example.com")
+        self.to_user = User.objects.create_user(username="to", password="pwd", email="example@example.com")
+        notify.send(self.from_user, recipient=self.to_user, verb='commented')
+        self.client.force_login(self.to_user)
+        self.url = reverse('notifications:live_unread_notification_list')
+
+    def test_not_modified(self):
+        for name in ('live_unread_notification_list', 'live_unread_notification_count',
+                     'live_all_notification_list', 'live_all_notification_count'):
+            response = self.client.get(reverse('notifications:' + name))
+            self.assertEqual(response.status_code, 200)
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(reverse('notifications:' + name), HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(response.status_code, 304)
+            self.assertFalse(any('notifications_notification' in query['sql'] for query in context.captured_queries))
+
+    def test_modified(self):
+        etag = self.client.get(self.url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            notify.send(self.from_user, recipient=self.to_user, verb='commented')
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content.decode('utf-8'))['unread_count'], 2)
+
+        etag = response['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.to_user.notifications.mark_all_as_read()
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_save(self):
+        etag = self.client.get(self.url)['ETag']
+        notification = self.to_user.notifications.get()
+        notification.unread = False
+        with self.captureOnCommitCallbacks(execute=True):
+            notification.save()
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    @override_settings(DJANGO_NOTIFICATIONS_CONFIG={})
+    def test_disabled_by_default(self):
+        self.assertFalse(self.client.get(self.url).has_header('ETag'))
+
+    def test_other_users_and_parameters(self):
+        etag = self.client.get(self.url)['ETag']
+        notify.send(self.to_user, recipient=self.from_user, verb='commented')
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.client.get(self.url + '?max=5', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_anonymous(self):
+        self.client.logout()
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('ETag'))
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}})
+    def test_without_cache(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('ETag'))
+
+
+@skipIf(os.environ.get('SAMPLE_APP', False), 'The change log requires the notifications app')
+@override_settings(DJANGO_NOTIFICATIONS_CONFIG={
+    'USE_CHANGE_LOG': True,
+    'CHANGE_LOG_LAG': 0,
+})
+class ChangeLogTest(TestCase):
+    ''' Django notifications delta sync tests '''
+    def setUp(self):
+        from notifications.models import NotificationChange
+        self.NotificationChange = NotificationChange  # pylint: disable=invalid-name
+        self.from_user = User.objects.create_user(username="from", password="pwd", email="example@example.com")
+        self.to_user = User.objects.create_user(username="to", password="pwd", email="example@example.com")
+        self.client.force_login(self.to_user)
+        notify.send(self.from_user, recipient=self.to_user, verb='commented')
+        response = self.client.get(reverse('notifications:live_unread_notification_list'))
+        self.cursor = json.loads(response.content.decode('utf-8'))['cursor']
+
+    def changes(self, cursor=None, **params):
+        params['since'] = self.cursor if cursor is None else cursor
+        response = self.client.get(reverse('notifications:live_notification_changes'), params)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content.decode('utf-8'))
+
+    def test_no_changes(self):
+        data = self.changes()
+        self.assertEqual(data['cursor'], self.cursor)
+        self.assertFalse(data['reset'])
+        self.assertEqual(data['changed'], [])
+        self.assertEqual(data['deleted'], [])
+
+    def test_changes(self):
+        notification = self.to_user.notifications.get()
+        new_notification = notify.send(self.from_user, recipient=self.to_user, verb='liked')[0][1][0]
+        notify.send(self.to_user, recipient=self.from_user, verb='liked')
+        notification.mark_as_read()
+        data = self.changes()
+        self.assertFalse(data['reset'])
+        self.assertEqual(data['unread_count'], 1)
+        self.assertEqual(
+            [(struct['slug'], struct['unread']) for struct in data['changed']],
+            [(new_notification.slug, True), (notification.slug, False)]
+        )
+
+        self.to_user.notifications.all().delete()
+        data = self.changes(data['cursor'])
+        self.assertEqual(data['changed'], [])
+        self.assertEqual(sorted(data['deleted']), sorted([notification.slug, new_notification.slug]))
+
+    @override_settings(DJANGO_NOTIFICATIONS_CONFIG={
+        'USE_CHANGE_LOG': True,
+        'CHANGE_LOG_LAG': 0,
+        'SOFT_DELETE': True,
+    })
+    def test_soft_delete(self):
+        notification = self.to_user.notifications.get()
+        self.client.get(reverse('notifications:delete', args=[notification.slug]))
+        self.assertEqual(self.changes()['deleted'], [notification.slug])
+
+    @override_settings(DJANGO_NOTIFICATIONS_CONFIG={
+        'USE_CHANGE_LOG': True,
+        'CHANGE_LOG_LAG': 60,
+    })
+    def test_lag(self):
+        self.NotificationChange.objects.update(timestamp=timezone.now() - timedelta(minutes=1))
+        notification = notify.send(self.from_user, recipient=self.to_user, verb='liked')[0][1][0]
+        # Its transaction may still be open, with an older change not committed yet
+        data = self.changes()
+        self.assertEqual((data['cursor'], data['changed']), (self.cursor, []))
+        response = self.client.get(reverse('notifications:live_unread_notification_list'))
+        self.assertEqual(json.loads(response.content.decode('utf-8'))['cursor'], self.cursor)
+
+        self.NotificationChange.objects.update(timestamp=timezone.now() - timedelta(minutes=1))
+        data = self.changes()
+        self.assertEqual([struct['slug'] for struct in data['changed']], [notification.slug])
+
+    @override_settings(DJANGO_NOTIFICATIONS_CONFIG={
+        'USE_CHANGE_LOG': True,
+        'CHANGE_LOG_LAG': 60,
+        'USE_ETAG': True,
+    })
+    def test_lag_etag(self):
+        cache.clear()
+        self.NotificationChange.objects.update(timestamp=timezone.now() - timedelta(minutes=1))
+        with self.captureOnCommitCallbacks(execute=True):
+            notification = notify.send(self.from_user, recipient=self.to_user, verb='liked')[0][1][0]
+        urls = [
+            reverse('notifications:live_notification_changes') + '?since=%s' % self.cursor,
+            reverse('notifications:live_unread_notification_list'),
+        ]
+        etags = [self.client.get(url)['ETag'] for url in urls]
+        self.assertEqual([self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code
+                          for url, etag in zip(urls, etags)], [304, 304])
+
+        self.NotificationChange.objects.update(timestamp=timezone.now() - timedelta(minutes=1))
+        responses = [self.client.get(url, HTTP_IF_NONE_MATCH=etag) for url, etag in zip(urls, etags)]
+        self.assertEqual([response.status_code for response in responses], [200, 200])
+        data = json.loads(responses[0].content.decode('utf-8'))
+        self.assertEqual([struct['slug'] for struct in data['changed']], [notification.slug])
+        self.assertEqual(json.loads(responses[1].content.decode('utf-8'))['cursor'], data['cursor'])
+
+    def test_paging(self):
+        for _ in range(3):
+            notify.send(self.from_user, recipient=self.to_user, verb='liked')
+        data = self.changes(max=2)
+        self.assertTrue(data['more'])
+        self.assertEqual(len(data['changed']), 2)
+        data = self.changes(data['cursor'], max=2)
+        self.assertFalse(data['more'])
+        self.assertEqual(len(data['changed']), 1)
+
+    def test_reset(self):
+        self.assertTrue(self.changes('')['reset'])
+        notify.send(self.from_user, recipient=User.objects.filter(pk=self.to_user.pk), verb='liked',
+                    insert_select=True)
+        data = self.changes()
+        self.assertTrue(data['reset'])
+        self.assertFalse(self.changes(data['cursor'])['reset'])
+
+    def test_pruned(self):
+        for _ in range(3):
+            notify.send(self.from_user, recipient=self.to_user, verb='liked')
+        self.NotificationChange.objects.prune(timezone.now() + timedelta(minutes=1))
+        self.assertEqual(self.NotificationChange.objects.count(), 1)
+        data = self.changes()
+        self.assertTrue(data['reset'])
+        self.assertFalse(self.changes(data['cursor'])['reset'])
+
+    def test_prune_command(self):
+        for _ in range(3):
+            notify.send(self.from_user, recipient=self.to_user, verb='liked')
+        self.NotificationChange.objects.update(timestamp=timezone.now() - timedelta(days=40))
+        notify.send(self.from_user, recipient=self.to_user, verb='liked')
+        stdout = io.StringIO()
+        call_command('notifications_prune_changes', '--dry-run', stdout=stdout)
+        self.assertEqual(stdout.getvalue(), 'Would delete 4 changes.\n')
+        call_command('notifications_prune_changes', '--days', '50', stdout=stdout)
+        self.assertEqual(self.NotificationChange.objects.count(), 5)
+        call_command('notifications_prune_changes', '--chunk-size', '3', stdout=stdout)
+        self.assertEqual(self.NotificationChange.objects.count(), 1)
+        self.assertTrue(self.changes()['reset'])
+
+    @override_settings(DJANGO_NOTIFICATIONS_CONFIG={})
+    def test_disabled(self):
+        response = self.client.get(reverse('notifications:live_notification_changes'))
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(DJANGO_NOTIFICATIONS_CONFIG={
+    'KEYSET_PAGINATION': True,
+})
+class KeysetPaginationTest(TestCase):
+    ''' Django notifications keyset pagination tests '''
+    def setUp(self):
+        self.from_user = User.objects.create_user(username="from", password="pwd", email="example@example.com")
+        self.to_user = User.objects.create_user(username="to", password="pwd", email="example@example.com")
+        self.client.force_login(self.to_user)
+        now = timezone.now()
+        for index in range(25):
+            # Pairs of notifications share a timestamp
+            notify.send(self.from_user, recipient=self.to_user, verb='commented',
+                        timestamp=now - timedelta(minutes=index // 2))
+        self.expected = list(self.to_user.notifications.order_by('-timestamp', '-id').values_list('pk', flat=True))
+
+    def walk(self, get_page):
+        pages, cursor = [], None
+        while True:
+            ids, next_cursor, previous_cursor = get_page(cursor)
+            self.assertEqual(previous_cursor is None, not pages)
+            pages.append((ids, previous_cursor))
+            if next_cursor is None:
+                break
+            cursor = next_cursor
+        self.assertEqual([pk for ids, _ in pages for pk in ids], self.expected)
+        # And back to the first page
+        for index in range(len(pages) - 1, 0, -1):
+            self.assertEqual(get_page(pages[index][1])[0], pages[index - 1][0])
+        return pages
+
+    def test_list_view(self):
+        def get_page(cursor):
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(reverse('notifications:all'), {'cursor': cursor} if cursor else {})
+            self.assertFalse(any('COUNT(' in query['sql'] for query in context.captured_queries))
+            self.assertTrue(response.context['is_paginated'])
+            return ([notification.pk for notification in response.context['notifications']],
+                    response.context['next_cursor'], response.context['previous_cursor'])
+        self.assertEqual(len(self.walk(get_page)), 2)
+
+    def test_live_list(self):
+        def get_page(cursor):
+            params = {'max': 10}
+            if cursor:
+                params['cursor'] = cursor
+            response = self.client.get(reverse('notifications:live_all_notification_list'), params)
+            data = json.loads(response.content.decode('utf-8'))
+            return ([slug2id(struct['slug']) for struct in data['all_list']],
+                    data['next_cursor'], data['previous_cursor'])
+        self.assertEqual(len(self.walk(get_page)), 3)
+        with override_settings(DJANGO_NOTIFICATIONS_CONFIG={
+                'KEYSET_PAGINATION': True, 'SERIALIZER': 'notifications.serializers.ValuesSerializer'}):
+            self.assertEqual(len(self.walk(get_page)), 3)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('notifications:all'), {'cursor': 'invalid'})
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(DJANGO_NOTIFICATIONS_CONFIG={
+    'STREAM_BACKEND': 'notifications.streaming.InProcessBackend',
+    'STREAM_HEARTBEAT': 0.05,
+    'STREAM_TIMEOUT': 5,
+})
+class StreamTest(TestCase):
+    ''' Django notifications server-sent events tests '''
+    def setUp(self):
+        self.from_user = User.objects.create_user(username="from", password="pwd", email="example@example.com")
+        self.to_user = User.objects.create_user(username="to", password="pwd", email="example@example.com")
+        notify.send(self.from_user, recipient=self.to_user, verb='commented')
+        self.client.force_login(self.to_user)
+        self.backend = get_stream_backend()
+
+    def open_stream(self):
+        response = self.client.get(reverse('notifications:live_notification_stream'))
+        self.addCleanup(self.close_stream, response)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        content = iter(response.streaming_content)
+        self.assertEqual(next(content), b'retry: 3000\n\n')
+        return content
+
+    def close_stream(self, response):
+        # Closing the response closes the connections which are not in
+        # autocommit mode, like the one of the test
+        with mock.patch.object(connection, 'close_if_unusable_or_obsolete'):
+            response.close()
+
+    def events(self, chunk):
+        events = []
+        for message in chunk.decode('utf-8').split('\n\n'):
+            if message.startswith('event: '):
+                name, data = message.split('\n')
+                events.append((name[len('event: '):], json.loads(data[len('data: '):])))
+        return events
+
+    def test_stream(self):
+        content = self.open_stream()
+        self.assertEqual(self.events(next(content)), [('unread_count', {'unread_count': 1})])
+        self.assertEqual(next(content), b': heartbeat\n\n')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            notification = notify.send(self.from_user, recipient=self.to_user, verb='liked')[0][1][0]
+        events = self.events(next(content))
+        self.assertEqual([name for name, _ in events], ['notification', 'unread_count'])
+        self.assertEqual(events[0][1]['slug'], notification.slug)
+        self.assertEqual(events[1][1], {'unread_count': 2})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.to_user.notifications.mark_all_as_read()
+        self.assertEqual(self.events(next(content)), [('unread_count', {'unread_count': 0})])
+
+    def test_other_users(self):
+        content = self.open_stream()
+        next(content)
+        with self.captureOnCommitCallbacks(execute=True):
+            notify.send(self.to_user, recipient=self.from_user, verb='liked')
+        self.assertEqual(next(content), b': heartbeat\n\n')
+
+    def test_rolled_back(self):
+        content = self.open_stream()
+        next(content)
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    notify.send(self.from_user, recipient=self.to_user, verb='liked')
+                    raise ValueError
+            except ValueError:
+                pass
+        self.assertEqual(next(content), b': heartbeat\n\n')
+
+    @override_settings(DJANGO_NOTIFICATIONS_CONFIG={
+        'STREAM_BACKEND': 'notifications.streaming.InProcessBackend',
+        'STREAM_HEARTBEAT': 0.05,
+        'STREAM_TIMEOUT': 0.1,
+    })
+    def test_timeout(self):
+        content = self.open_stream()
+        chunks = list(content)
+        self.assertTrue(chunks)
+        self.assertEqual(self.backend.subscriptions, {})
+
+    @skipIf(parse_version(get_version()) < parse_version('4.2'), 'Async streaming responses require Django >= 4.2')
+    @override_settings(DJANGO_NOTIFICATIONS_CONFIG={
+        'STREAM_BACKEND': 'notifications.streaming.InProcessBackend',
+        'STREAM_HEARTBEAT': 0.05,
+        'STREAM_TIMEOUT': 0.1,
+    })
+    def test_asgi(self):
+        self.async_client.force_login(self.to_user)
+
+        async def read():
+            response = await self.async_client.get(reverse('notifications:live_notification_stream'))
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.is_async)
+            return [chunk async for chunk in response.streaming_content]
+        chunks = async_to_sync(read)()
+        self.assertEqual(chunks[0], b'retry: 3000\n\n')
+        self.assertEqual(self.events(chunks[1]), [('unread_count', {'unread_count': 1})])
+        self.assertEqual(set(chunks[2:]), {b': heartbeat\n\n'})
+        self.assertEqual(self.backend.subscriptions, {})
+
+    @skipIf(parse_version(get_version()) >= parse_version('4.2'), 'Async streaming responses require Django >= 4.2')
+    def test_asgi_unavailable(self):
+        self.async_client.force_login(self.to_user)
+
+        async def read():
+            return await self.async_client.get(reverse('notifications:live_notification_stream'))
+        self.assertEqual(async_to_sync(read)().status_code, 404)
+
+    def test_async_subscription(self):
+        async def receive():
+            subscription = self.backend.subscribe(self.to_user.pk, asyncio.get_running_loop())
+            try:
+                await asyncio.get_running_loop().run_in_executor(
+                    None, self.backend.publish, self.to_user.pk, {'action': 'read', 'notifications': [1]})
+                return await subscription.aget(1), await subscription.aget(0.01)
+            finally:
+                subscription.close()
+        self.assertEqual(asyncio.run(receive()), ({'action': 'read', 'notifications': [1]}, None))
+
+    def test_anonymous_and_disabled(self):
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('notifications:live_notification_stream')).status_code, 403)
+        with self.settings(DJANGO_NOTIFICATIONS_CONFIG={}):
+            self.assertEqual(self.client.get(reverse('notifications:live_notification_stream')).status_code, 404)
+
+
+@skipIf(WebsocketCommunicator is None, 'Requires channels and daphne')
+@override_settings(
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+    DJANGO_NOTIFICATIONS_CONFIG={'CHANNEL_LAYER': 'default'},
+)
+class NotificationConsumerTest(TransactionTestCase):
+    ''' Django notifications Channels consumer tests '''
+    def setUp(self):
+        self.from_user = User.objects.create_user(username="from", password="pwd", email="example@example.com")
+        self.to_user = User.objects.create_user(username="to", password="pwd", email="example@example.com")
+        notify.send(self.from_user, recipient=self.to_user, verb='commented')
+
+    async def connect(self, user):
+        from notifications.consumers import NotificationConsumer
+
+        communicator = WebsocketCommunicator(NotificationConsumer.as_asgi(), '/notifications/')
+        communicator.scope['user'] = user
+        connected, _ = await communicator.connect()
+        return communicator, connected
+
+    def test_push(self):
+        async def push():
+            communicator, connected = await self.connect(self.to_user)
+            self.assertTrue(connected)
+            self.assertEqual(await communicator.receive_json_from(), {'type': 'unread_count', 'unread_count': 1})
+
+            notification = (await sync_to_async(notify.send)(
+                self.from_user, recipient=self.to_user, verb='liked'))[0][1][0]
+            message = await communicator.receive_json_from()
+            self.assertEqual(message['type'], 'notification')
+            self.assertEqual(message['notification']['slug'], notification.slug)
+            self.assertEqual(await communicator.receive_json_from(), {'type': 'unread_count', 'unread_count': 2})
+
+            await sync_to_async(self.to_user.notifications.mark_all_as_read)()
+            self.assertEqual(await communicator.receive_json_from(), {'type': 'unread_count', 'unread_count': 0})
+
+            # Notifications of other users are not pushed
+            await sync_to_async(notify.send)(self.to_user, recipient=self.from_user, verb='liked')
+            self.assertTrue(await communicator.receive_nothing())
+            await communicator.disconnect()
+        async_to_sync(push)()
+
+    def test_anonymous(self):
+        from django.contrib.auth.models import AnonymousUser
+
+        async def reject():
+            communicator, connected = await self.connect(AnonymousUser())
+            self.assertFalse(connected)
+        async_to_sync(reject)()
+
+
+class UnreadSummaryTest(TestCase):
+    ''' Django notifications grouped counts tests '''
+    def setUp(self):
+        self.from_user = User.objects.create_user(username="from", password="pwd", email="example@example.com")
+        self.to_user = User.objects.create_user(username="to", password="pwd", email="example@example.com")
+        self.other_user = User.objects.create_user(username="other", password="pwd", email="example@example.com")
+        notify.send(self.from_user, recipient=self.to_user, verb='commented')
+        notify.send(self.from_user, recipient=self.to_user, verb='commented', level='warning')
+        notify.send(self.from_user, recipient=self.to_user, verb='liked', level='warning')
+        notify.send(self.from_user, recipient=self.to_user, verb='liked', level='error')
+        notify.send(self.from_user, recipient=self.other_user, verb='liked')
+        self.to_user.notifications.filter(level='error').mark_all_as_read()
+
+    def test_unread_summary(self):
+        with self.assertNumQueries(1):
+            summary = self.to_user.notifications.unread_summary()
+        self.assertEqual(summary, {
+            'total': 3,
+            'levels': {'success': 0, 'info': 1, 'warning': 2, 'error': 0},
+            'verbs': {'commented': 2, 'liked': 1},
+        })
+
+    def test_counts_for_users(self):
+        users = [self.to_user, self.other_user, self.from_user]
+        with self.assertNumQueries(1):
+            counts = Notification.objects.unread().counts_for_users(users)
+        self.assertEqual(counts, {self.to_user.pk: 3, self.other_user.pk: 1, self.from_user.pk: 0})
+        with self.assertNumQueries(1):
+            counts = Notification.objects.counts_for_users(User.objects.exclude(pk=self.other_user.pk))
+        self.assertEqual(counts, {self.to_user.pk: 4})
+
+    def test_live_unread_summary(self):
+        self.client.force_login(self.to_user)
+        response = self.client.get(reverse('notifications:live_unread_notification_summary'))
+        data = json.loads(response.content.decode('utf-8'))
+        self.assertEqual(data['unread_count'], 3)
+        self.assertEqual(data['levels']['warning'], 2)
+        self.assertEqual(data['verbs'], {'commented': 2, 'liked': 1})
+
+        self.client.logout()
+        response = self.client.get(reverse('notifications:live_unread_notification_summary'))
+        self.assertEqual(json.loads(response.content.decode('utf-8'))['unread_count'], 0)
+
+
+class BulkChangeTest(TestCase):
+    ''' Django notifications bulk mark and delete tests '''
+    def setUp(self):
+        self.from_user = User.objects.create_user(username="from", password="pwd", email="example@example.com")
+        self.to_user = User.objects.create_user(username="to", password="pwd", email="example@example.com")
+        for _ in range(4):
+            notify.send(self.from_user, recipient=self.to_user, verb='commented')
+        notify.send(self.to_user, recipient=self.from_user, verb='commented')
+        self.client.force_login(self.to_user)
+        self.slugs = [notification.slug for notification in self.to_user.notifications.all()[:3]]
+        self.other_slug = self.from_user.notifications.get().slug
+
+    def post(self, name, **kwargs):
+        return self.client.post(reverse('notifications:' + name), **kwargs)
+
+    def test_mark_as_read(self):
+        response = self.post('bulk_mark_as_read', data={'slug': self.slugs + [self.other_slug]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content.decode('utf-8')), {'count': 3})
+        self.assertEqual(self.to_user.notifications.unread().count(), 1)
+        self.assertTrue(self.from_user.notifications.get().unread)
+
+        response = self.post('bulk_mark_as_unread', data=json.dumps({'slugs': self.slugs[:2]}),
+                             content_type='application/json', HTTP_ACCEPT='text/html')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.to_user.notifications.unread().count(), 3)
+
+    def test_single_statement(self):
+        with CaptureQueriesContext(connection) as context:
+            self.post('bulk_mark_as_read', data={'slug': self.slugs})
+        self.assertEqual(len([query for query in context.captured_queries if 'UPDATE' in query['sql']]), 1)
+
+    def test_delete(self):
+        response = self.post('bulk_delete', data={'slug': self.slugs + [self.other_slug]})
+        self.assertEqual(json.loads(response.content.decode('utf-8')), {'count': 3})
+        self.assertEqual(self.to_user.notifications.count(), 1)
+        self.assertEqual(self.from_user.notifications.count(), 1)
+
+    @override_settings(DJANGO_NOTIFICATIONS_CONFIG={
+        'SOFT_DELETE': True,
+    })
+    def test_soft_delete(self):
+        self.post('bulk_delete', data={'slug': self.slugs})
+        self.assertEqual(self.to_user.notifications.deleted().count(), 3)
+        self.assertEqual(self.to_user.notifications.count(), 4)
+
+    def test_invalid(self):
+        self.assertEqual(self.client.get(reverse('notifications:bulk_mark_as_read')).status_code, 405)
+        self.assertEqual(self.post('bulk_mark_as_read', data={'slug': ['abc']}).status_code, 400)
+        self.assertEqual(json.loads(self.post('bulk_mark_as_read').content.decode('utf-8')), {'count': 0})
+        self.client.logout()
+        self.assertEqual(self.post('bulk_mark_as_read', data={'slug': self.slugs}).status_code, 403)
+
+    def test_mark_as_read_updates_only_unread(self):
+        notification = self.to_user.notifications.first()
+        with CaptureQueriesContext(connection) as context:
+            notification.mark_as_read()
+        update = [query['sql'] for query in context.captured_queries if 'UPDATE' in query['sql']]
+        self.assertEqual(len(update), 1)
+        self.assertNotIn('"verb"', update[0])
+
+    def test_rows_not_locked(self):
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(self.to_user.notifications.mark_all_as_read(), 4)
+            self.assertEqual(self.to_user.notifications.all().delete()[0], 4)
+        queries = [query['sql'] for query in context.captured_queries]
+        self.assertFalse([sql for sql in queries if 'FOR UPDATE' in sql or 'SAVEPOINT' in sql])
+        self.assertEqual(len([sql for sql in queries if sql.startswith('SELECT DISTINCT')]), 2)
+
+    @override_settings(DJANGO_NOTIFICATIONS_CONFIG={'USE_CHANGE_LOG': True})
+    def test_rows_listed_for_change_log(self):
+        changes = []
+
+        def receiver(sender, notifications, **kwargs):  # pylint: disable=unused-argument
+            changes.append(notifications)
+
+        notifications_changed.connect(receiver)
+        try:
+            self.to_user.notifications.mark_all_as_read()
+            Notification.objects.filter(recipient=self.from_user).delete()
+        finally:
+            notifications_changed.disconnect(receiver)
+        self.assertEqual(sorted(changes[0]), sorted(self.to_user.notifications.values_list('pk', flat=True)))
+        self.assertEqual(len(changes[1]), 1)
+
+    def test_live_list_mark_as_read(self):
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(reverse('notifications:live_unread_notification_list'), {'mark_as_read': 'true'})
+        self.assertEqual(len([query for query in context.captured_queries if 'UPDATE' in query['sql']]), 1)
+        self.assertEqual(self.to_user.notifications.unread().count(), 0)
+
+
+class SerializerTest(TestCase):
+    ''' Django notifications live API serializer tests '''
+    def setUp(self):
+        self.from_user = User.objects.create_user(username="from", password="pwd", email="example@example.com")
+        self.to_user = User.objects.create_user(username="to", password="pwd", email="example@example.com")
+        self.client.force_login(self.to_user)
+        targets = [TargetObject.objects.create(name='target %d' % index) for index in range(3)]
+        customer = Customer.objects.create(name='customer')
+        for index in range(100):
+            notify.send(self.from_user, recipient=self.to_user, verb='commented', target=targets[index % 3],
+                        action_object=customer if index % 2 else None, url='/%d/' % index)
+        self.to_user.notifications.filter(pk__in=self.to_user.notifications.all()[:10]).mark_all_as_read()
+
+    def get(self, name, **params):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('notifications:' + name), params)
+        return json.loads(response.content.decode('utf-8')), len(context.captured_queries)
+
+    @override_settings(DJANGO_NOTIFICATIONS_CONFIG={'USE_JSONFIELD': True})
+    def test_same_output(self):
+        for name in ('live_all_notification_list', 'live_unread_notification_list'):
+            expected, _ = self.get(name, max=100)
+            with override_settings(DJANGO_NOTIFICATIONS_CONFIG={
+                    'USE_JSONFIELD': True, 'SERIALIZER': 'notifications.serializers.ValuesSerializer'}):
+                data, _ = self.get(name, max=100)
+            self.assertEqual(data, expected)
+        self.assertEqual(expected['unread_count'], 90)
+        self.assertEqual(len(expected['unread_list']), 90)
+        self.assertEqual(expected['unread_list'][0]['data'], {'url': '/89/'})
+        self.assertTrue(expected['unread_list'][0]['target_url'].startswith('bar/'))
+
+    @skipIf(not connection.features.supports_over_clause, 'Window functions not supported')
+    def test_queries(self):
+        # Session, user, the list with its count, then the actors, targets and action objects
+        _, model_queries = self.get('live_all_notification_list', max=100)
+        with override_settings(DJANGO_NOTIFICATIONS_CONFIG={
+                'SERIALIZER': 'notifications.serializers.ValuesSerializer'}):
+            data, queries = self.get('live_all_notification_list', max=100)
+            self.assertEqual(queries, 6)
+            self.assertEqual(queries, model_queries - 1)
+            self.assertEqual(data['all_count'], 100)
+            self.assertEqual(self.get('live_all_notification_list', max=10)[1], queries)
+
+    def test_empty(self):
+        with override_settings(DJANGO_NOTIFICATIONS_CONFIG={
+                'SERIALIZER': 'notifications.serializers.ValuesSerializer'}):
+            self.to_user.notifications.all().delete()
+            data, _ = self.get('live_unread_notification_list')
+        self.assertEqual(data, {'unread_count': 0, 'unread_list': []})
+
+
+class FieldSelectionTest(TestCase):
+    ''' Django notifications live API fields and encodings tests '''
+    def setUp(self):
+        self.from_user = User.objects.create_user(username="from", password="pwd", email="example@example.com")
+        self.to_user = User.objects.create_user(username="to", password="pwd", email="example@example.com")
+        self.client.force_login(self.to_user)
+        for index in range(3):
+            notify.send(self.from_user, recipient=self.to_user, verb='commented', description='long text %d' % index)
+        self.notification = self.to_user.notifications.first()
+
+    def get(self, name='live_unread_notification_list', **kwargs):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('notifications:' + name), **kwargs)
+        queries = [query['sql'] for query in context.captured_queries if 'notifications_notification' in query['sql']]
+        return response, json.loads(response.content.decode('utf-8')), queries
+
+    def test_fields(self):
+        for serializer in ('ModelSerializer', 'ValuesSerializer'):
+            with override_settings(DJANGO_NOTIFICATIONS_CONFIG={
+                    'SERIALIZER': 'notifications.serializers.' + serializer}):
+                _, data, queries = self.get(data={'fields': 'slug,verb,actor,timestamp,unknown', 'max': 2})
+            self.assertEqual(len(data['unread_list']), 2)
+            struct = data['unread_list'][0]
+            self.assertEqual(list(struct), ['slug', 'verb', 'actor', 'timestamp'])
+            self.assertEqual(struct['slug'], self.notification.slug)
+            self.assertEqual(struct['actor'], 'from')
+            self.assertFalse(any('"description"' in query for query in queries))
+            # No deferred field loaded one by one: the list and its count
+            self.assertLessEqual(len(queries), 2)
+
+        _, data, _ = self.get('live_all_notification_list', data={'fields': 'unknown'})
+        self.assertIn('description', data['all_list'][0])
+
+    def test_mark_as_read(self):
+        _, data, _ = self.get(data={'fields': 'verb', 'mark_as_read': 'true'})
+        self.assertEqual(data['unread_list'], [{'verb': 'commented'}] * 3)
+        self.assertEqual(self.to_user.notifications.unread().count(), 0)
+
+    def test_compact(self):
+        response, data, _ = self.get(data={'fields': 'slug,verb'},
+                                     HTTP_ACCEPT='application/vnd.django-notifications.compact+json')
+        self.assertEqual(response['Content-Type'], 'application/vnd.django-notifications.compact+json')
+        self.assertIn('Accept', response['Vary'])
+        self.assertEqual(data['unread_list'][0], {'s': self.notification.slug, 'v': 'commented'})
+        self.assertEqual(data['unread_count'], 3)
+
+    def test_rows(self):
+        response, data, _ = self.get(data={'fields': 'verb,slug'},
+                                     HTTP_ACCEPT='application/vnd.django-notifications.rows+json, */*')
+        self.assertEqual(response['Content-Type'], 'application/vnd.django-notifications.rows+json')
+        self.assertEqual(data['columns'], ['verb', 'slug'])
+        self.assertEqual(data['unread_list'][0], ['commented', self.notification.slug])
+
+        response, data, _ = self.get(HTTP_ACCEPT='*/*')
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertNotIn('columns', data)
+
+
+class IndexTest(TestCase):
+    ''' Django notifications index tests '''
+    def setUp(self):
+        self.from_user = User.objects.create_user(username="from", password="pwd", email="example@example.com")
+        self.to_user = User.objects.create_user(username="to", password="pwd", email="example@example.com")
+        for _ in range(3):
+            notify.send(self.from_user, recipient=self.to_user, verb='commented')
+        self.Notification = load_model('notifications', 'Notification')
+        self.recipient_index, self.unread_index = [index.name for index in self.Notification._meta.indexes[:2]]
+
+    def get_indexes(self):
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, self.Notification._meta.db_table)
+        return {name: constraint['columns'] for name, constraint in constraints.items()
+                if constraint['index'] and not constraint['primary_key']}
+
+    def test_no_boolean_indexes(self):
+        # Fewer indexes to update on every insert
+        indexes = self.get_indexes()
+        for column in ('unread', 'public', 'deleted', 'emailed'):
+            self.assertNotIn([column], indexes.values())
+        self.assertNotIn(['recipient_id'], indexes.values())
+        self.assertEqual(indexes[self.unread_index], ['recipient_id', 'timestamp'])
+
+    def test_names_per_model(self):
+        names = {index.name for index in BigIntegerIdNotification._meta.indexes}
+        self.assertIn('test_model_biginteger_unread', names)
+        self.assertFalse(names & {self.recipient_index, self.unread_index})
+
+    @skipIf(connection.vendor != 'sqlite', 'SQLite query plans')
+    def test_query_plans(self):
+        self.assertIn(self.unread_index, self.to_user.notifications.unread().explain())
+        self.assertIn(self.unread_index, self.to_user.notifications.unread().order_by().values('pk').explain())
+        self.assertIn(self.recipient_index, self.to_user.notifications.all()[:10].explain())
+
+
+@skipIf(os.environ.get('SAMPLE_APP', False), 'Management commands require the notifications app')
+class PurgeCommandTest(TestCase):
+    ''' Django notifications purge command tests '''
+    def setUp(self):
+        self.from_user = User.objects.create_user(username="from", password="pwd", email="example@example.com")
+        self.to_user = User.objects.create_user(username="to", password="pwd", email="example@example.com")
+        old = timezone.now() - timedelta(days=40)
+        for index in range(7):
+            notify.send(self.from_user, recipient=self.to_user, verb='commented', timestamp=old,
+                        level='error' if index == 0 else 'info')
+        notify.send(self.from_user, recipient=self.to_user, verb='commented')
+        self.to_user.notifications.filter(pk__in=self.to_user.notifications.order_by('pk')[:3]).mark_all_as_read()
+
+    def purge(self, *args):
+        stdout = io.StringIO()
+        call_command('notifications_purge', '--days', '30', *args, stdout=stdout)
+        return stdout.getvalue()
+
+    def test_dry_run(self):
+        self.assertEqual(self.purge('--dry-run'), 'Would delete 7 notifications.\n')
+        self.assertEqual(self.purge('--dry-run', '--read'), 'Would delete 3 notifications.\n')
+        self.assertEqual(self.purge('--dry-run', '--level', 'error', '--level', 'warning'),
+                         'Would delete 1 notifications.\n')
+        self.assertEqual(self.purge('--dry-run', '--deleted'), 'Would delete 0 notifications.\n')
+        self.assertEqual(self.to_user.notifications.count(), 8)
+
+    def test_chunks(self):
+        with CaptureQueriesContext(connection) as context:
+            output = self.purge('--chunk-size', '2')
+        self.assertTrue(output.startswith('Deleted 7 notifications in '))
+        deletes = [query['sql'] for query in context.captured_queries if query['sql'].startswith('DELETE')]
+        self.assertEqual(len(deletes), 4)
+        self.assertFalse([query for query in context.captured_queries if 'FOR UPDATE' in query['sql']])
+        self.assertEqual(self.to_user.notifications.count(), 1)
+        self.assertEqual(self.to_user.notifications.get().unread, True)
+
+    def test_read(self):
+        self.purge('--read')
+        self.assertEqual(self.to_user.notifications.count(), 5)
+        self.assertEqual(self.to_user.notifications.read().count(), 0)
+
+    def test_unread_counts(self):
+        cache.clear()
+        receiver = mock.Mock()
+        notifications_changed.connect(receiver, weak=False, dispatch_uid='test_purge')
+        self.addCleanup(notifications_changed.disconnect, dispatch_uid='test_purge')
+        self.assertEqual(get_cached_unread_count(self.to_user), 5)
+        with mock.patch('notifications.management.commands.notifications_purge.invalidate_unread_count') as invalidate:
+            self.purge('--read')
+        invalidate.assert_not_called()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.purge('--chunk-size', '2')
+        self.assertEqual(get_cached_unread_count(self.to_user), 1)
+        receiver.assert_not_called()
+
+    @override_settings(DJANGO_NOTIFICATIONS_CONFIG={'USE_ETAG': True})
+    def test_etag(self):
+        with mock.patch('notifications.management.commands.notifications_purge.invalidate_unread_count') as invalidate:
+            self.purge('--read')
+        invalidate.assert_called_once_with({self.to_user.pk})
+
+
+@skipIf(os.environ.get('SAMPLE_APP', False), 'The archive requires the notifications app')
+class ArchiveTest(TestCase):
+    ''' Django notifications archive tests '''
+    def setUp(self):
+        cache.clear()
+        self.from_user = User.objects.create_user(username="from", password="pwd", email="example@example.com")
+        self.to_user = User.objects.create_user(username="to", password="pwd", email="example@example.com")
+        self.client.force_login(self.to_user)
+        now = timezone.now()
+        for days in range(25):
+            notify.send(self.from_user, recipient=self.to_user, verb='commented', timestamp=now - timedelta(days=days))
+        notify.send(self.to_user, recipient=self.from_user, verb='commented', timestamp=now - timedelta(days=30))
+        # All the notifications older than 10 days are read, but one
+        Notification.objects.filter(timestamp__lt=now - timedelta(days=10)).exclude(
+            timestamp__lt=now - timedelta(days=19), timestamp__gt=now - timedelta(days=21)).mark_all_as_read()
+        self.expected = list(self.to_user.notifications.order_by('-timestamp', '-id').values_list('pk', flat=True))
+        self.ArchivedNotification = load_model('notifications', 'ArchivedNotification')
+        call_command('notifications_archive', '--days', '10', '--chunk-size', '4', stdout=open(os.devnull, 'w'))
+
+    def test_archive_command(self):
+        self.assertEqual(self.ArchivedNotification.objects.count(), 14)
+        self.assertEqual(self.to_user.notifications.count(), 12)
+        self.assertEqual(self.to_user.archived_notifications.count(), 13)
+        self.assertEqual(self.to_user.notifications.unread().count(), 12)
+        archived = self.to_user.archived_notifications.first()
+        self.assertEqual(archived.actor, self.from_user)
+        self.assertIn(archived.pk, self.expected)
+        stdout = io.StringIO()
+        call_command('notifications_archive', '--days', '10', '--dry-run', stdout=stdout)
+        self.assertEqual(stdout.getvalue(), 'Would archive 0 notifications.\n')
+
+    @override_settings(DJANGO_NOTIFICATIONS_CONFIG={'USE_ARCHIVE': True})
+    def test_page_numbers(self):
+        pks = []
+        for page in (1, 2):
+            response = self.client.get(reverse('notifications:all'), {'page': page})
+            self.assertEqual(response.context['paginator'].count, 25)
+            pks += [notification.pk for notification in response.context['notifications']]
+        self.assertEqual(pks, self.expected)
+
+    @override_settings(DJANGO_NOTIFICATIONS_CONFIG={'USE_ARCHIVE': True})
+    def test_slices(self):
+        notifications = NotificationArchiveList(
+            self.to_user.notifications.all(), self.to_user.archived_notifications.all())
+        for start in range(0, 25, 3):
+            self.assertEqual([notification.pk for notification in notifications[start:start + 3]],
+                             self.expected[start:start + 3])
+        with CaptureQueriesContext(connection) as context:
+            notifications[21:24]  # pylint: disable=pointless-statement
+        merges = [query['sql'] for query in context.captured_queries if 'UNION' in query['sql']]
+        self.assertEqual(len(merges), 1)
+        self.assertIn('LIMIT', merges[0])
+
+    @override_settings(DJANGO_NOTIFICATIONS_CONFIG={'USE_ARCHIVE': True, 'KEYSET_PAGINATION': True})
+    def test_keyset(self):
+        pks, cursor = [], None
+        while True:
+            response = self.client.get(reverse('notifications:live_all_notification_list'),
+                                       {'max': 7, 'cursor': cursor} if cursor else {'max': 7})
+            data = json.loads(response.content.decode('utf-8'))
+            pks += [slug2id(struct['slug']) for struct in data['all_list']]
+            cursor = data['next_cursor']
+            if cursor is None:
+                break
+        self.assertEqual(pks, self.expected)
+        previous = self.client.get(reverse('notifications:live_all_notification_list'),
+                                   {'max': 7, 'cursor': data['previous_cursor']})
+        previous = json.loads(previous.content.decode('utf-8'))
+        self.assertEqual([slug2id(struct['slug']) for struct in previous['all_list']], self.expected[14:21])
+
+        response = self.client.get(reverse('notifications:all'))
+        self.assertEqual([notification.pk for notification in response.context['notifications']], self.expected[:20])
+
+    @override_settings(DJANGO_NOTIFICATIONS_CONFIG={'USE_ARCHIVE': True})
+    def test_hot_window(self):
+        self.client.get(reverse('notifications:live_all_notification_list'), {'max': 5})
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('notifications:live_all_notification_list'), {'max': 5})
+        self.assertFalse(any('archivednotification' in query['sql'] for query in context.captured_queries))
+        data = json.loads(response.content.decode('utf-8'))
+        self.assertEqual([slug2id(struct['slug']) for struct in data['all_list']], self.expected[:5])
+
+        response = self.client.get(reverse('notifications:live_all_notification_list'), {'max': 100})
+        data = json.loads(response.content.decode('utf-8'))
+        self.assertEqual([slug2id(struct['slug']) for struct in data['all_list']], self.expected)
+        self.assertEqual(data['all_count'], 12)
+
+    def test_disabled(self):
+        response = self.client.get(reverse('notifications:live_all_notification_list'), {'max': 100})
+        self.assertEqual(len(json.loads(response.content.decode('utf-8'))['all_list']), 12)
+
+
+class BigIntegerIdTest(TestCase):
+    ''' Django notifications integer object ids tests '''
+    def setUp(self):
+        self.user = User.objects.create_user(username="to", password="pwd", email="example@example.com")
+        self.customers = [Customer.objects.create(name='customer %d' % index) for index in range(3)]
+        user_type = ContentType.objects.get_for_model(User)
+        customer_type = ContentType.objects.get_for_model(Customer)
+        for customer in self.customers * 2:
+            BigIntegerIdNotification.objects.create(
+                recipient=self.user, verb='ordered', actor_content_type=user_type, actor_object_id=self.user.pk,
+                target_content_type=customer_type, target_object_id=customer.pk,
+                legacy_target_object_id=str(customer.pk))
+
+    def test_related_objects(self):
+        with self.assertNumQueries(3):
+            notifications = list(BigIntegerIdNotification.objects.with_related_objects())
+            self.assertEqual({notification.target for notification in notifications}, set(self.customers))
+            self.assertEqual({notification.actor for notification in notifications}, {self.user})
+
+    def test_lookups(self):
+        # Integers compared with integers, without casts
+        targets = BigIntegerIdNotification.objects.filter(target_object_id=self.customers[0].pk)
+        self.assertEqual(targets.count(), 2)
+        customers = Customer.objects.filter(pk__in=BigIntegerIdNotification.objects.values('target_object_id'))
+        self.assertNotIn('CAST', str(customers.query).upper())
+        self.assertEqual(set(customers), set(self.customers))
+
+    @skipIf(os.environ.get('SAMPLE_APP', False), 'Broadcasts require the notifications app')
+    def test_insert_select_casts(self):
+        Broadcast = load_model('notifications', 'Broadcast')
+        Broadcast.objects.create(actor_content_type=ContentType.objects.get_for_model(Customer),
+                                 actor_object_id=str(self.customers[1].pk), verb='opened')
+        copied = {name: name for name in ('actor_content_type', 'actor_object_id', 'verb', 'timestamp')}
+        _insert_select(BigIntegerIdNotification, Broadcast.objects.all(), copied,
+                       BigIntegerIdNotification(recipient=self.user))
+        self.assertEqual(BigIntegerIdNotification.objects.get(verb='opened').actor, self.customers[1])
+
+    def test_copy_object_ids(self):
+        BigIntegerIdNotification.objects.update(target_object_id=None)
+        BigIntegerIdNotification.objects.filter(pk=BigIntegerIdNotification.objects.first().pk).update(
+            legacy_target_object_id='not-an-integer')
+        copy = copy_object_ids('test_models.BigIntegerIdNotification',
+                               {'legacy_target_object_id': 'target_object_id'}, chunk_size=4)
+        with CaptureQueriesContext(connection) as context:
+            copy(apps, connection.schema_editor())
+        self.assertEqual(len([query for query in context.captured_queries if query['sql'].startswith('UPDATE')]), 2)
+        self.assertEqual(BigIntegerIdNotification.objects.filter(target_object_id__isnull=True).count(), 1)
+        for notification in BigIntegerIdNotification.objects.exclude(target_object_id=None):
+            self.assertEqual(notification.target_object_id, int(notification.legacy_target_object_id))
+
+
+class DataQueryTest(TestCase):
+    ''' Django notifications data key queries tests '''
+    def setUp(self):
+        self.from_user = User.objects.create_user(username="from", password="pwd", email="example@example.com")
+        self.to_user = User.objects.create_user(username="to", password="pwd", email="example@example.com")
+        for thread_id in (1, 2, 2, 3):
+            notify.send(self.from_user, recipient=self.to_user, verb='replied', thread_id=thread_id,
+                        sent=timezone.now())
+        notify.send(self.from_user, recipient=self.to_user, verb='liked')
+
+    @override_settings(DJANGO_NOTIFICATIONS_CONFIG={'USE_JSONFIELD': True})
+    def test_filter_data(self):
+        notifications = self.to_user.notifications
+        self.assertEqual(notifications.filter_data(thread_id=2).count(), 2)
+        self.assertEqual(notifications.filter_data(thread_id__in=[1, 3]).count(), 2)
+        self.assertEqual(notifications.filter_data(thread_id__gt=1).unread().count(), 3)
+        self.assertEqual(notifications.filter_data(thread_id=2, verb='replied').count(), 0)
+        self.assertEqual(notifications.filter_data(thread_id=4).count(), 0)
+        self.assertIsInstance(notifications.filter_data(thread_id=1).get().data['sent'], str)
+
+    def test_expression_index(self):
+        user_type = ContentType.objects.get_for_model(User)
+        for thread_id in range(20):
+            BigIntegerIdNotification.objects.create(
+                recipient=self.to_user, verb='replied', actor_content_type=user_type,
+                actor_object_id=self.from_user.pk, data={'thread_id': thread_id})
+        threads = BigIntegerIdNotification.objects.filter_data(thread_id=7)
+        self.assertEqual(threads.get().data, {'thread_id': 7})
+        if connection.vendor == 'sqlite':
+            self.assertIn('test_models_thread_idx', threads.explain())
+
+
+class ReadReplicaTest(TransactionTestCase):
+    ''' Django notifications read replica routing tests '''
+    # The replica mirrors the default database, the tests check where the reads go
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        cache.clear()
+        self.from_user = User.objects.create_user(username="from", password="pwd", email="example@example.com")
+        self.to_user = User.objects.create_user(username="to", password="pwd", email="example@example.com")
+        notify.send(self.from_user, recipient=self.to_user, verb='commented')
+        notify.send(self.from_user, recipient=self.to_user, verb='liked')
+        # The pins of the notify.send calls expire
+        cache.clear()
+        self.client.force_login(self.to_user)
+
+    def get_unread_count(self):
+        response = self.client.get(reverse('notifications:live_unread_notification_count'))
+        return json.loads(response.content.decode('utf-8'))['unread_count']
+
+    @override_settings(DJANGO_NOTIFICATIONS_CONFIG={'READ_DATABASE': 'replica'})
+    def test_reads_from_replica(self):
+        with CaptureQueriesContext(connections['replica']) as context:
+            self.assertEqual(self.get_unread_count(), 2)
+            response = self.client.get(reverse('notifications:live_all_notification_list'))
+        data = json.loads(response.content.decode('utf-8'))
+        self.assertEqual(data['all_count'], 2)
+        self.assertEqual(data['all_list'][0]['actor'], 'from')
+        self.assertTrue(context.captured_queries)
+
+    def test_without_replica(self):
+        with CaptureQueriesContext(connections['replica']) as context:
+            self.assertEqual(self.get_unread_count(), 2)
+        self.assertFalse(context.captured_queries)
+        self.assertIsNone(get_read_database(self.to_user))
+
+    @override_settings(DJANGO_NOTIFICATIONS_CONFIG={'READ_DATABASE': 'replica'})
+    def test_read_your_writes(self):
+        notification = self.to_user.notifications.get(verb='liked')
+        self.client.get(reverse('notifications:mark_as_read', args=[id2slug(notification.id)]))
+        self.assertIsNone(get_read_database(self.to_user))
+        self.assertEqual(get_read_database(self.from_user), 'replica')
+        with CaptureQueriesContext(connections['replica']) as context:
+            self.assertEqual(self.get_unread_count(), 1)
+        self.assertFalse(context.captured_queries)
+
+        # Back to the replica once the window is over
+        cache.delete(PRIMARY_KEY % self.to_user.pk)
+        with CaptureQueriesContext(connections['replica']) as context:
+            self.get_unread_count()
+        self.assertTrue(context.captured_queries)
+
+    @override_settings(DJANGO_NOTIFICATIONS_CONFIG={'READ_DATABASE': 'replica'})
+    def test_write_in_block(self):
+        response = self.client.get(reverse('notifications:live_unread_notification_list'), {'mark_as_read': 'true'})
+        data = json.loads(response.content.decode('utf-8'))
+        self.assertEqual(len(data['unread_list']), 2)
+        self.assertEqual(data['unread_count'], 0)
+
+        with CaptureQueriesContext(connections['replica']) as context:
+            with read_from_replica(self.to_user):
+                self.assertEqual(self.to_user.notifications.unread().count(), 0)
+        self.assertFalse(context.captured_queries)
+
+    @override_settings(DJANGO_NOTIFICATIONS_CONFIG={'READ_DATABASE': 'replica', 'READ_YOUR_WRITES_WINDOW': 0})
+    def test_no_window(self):
+        self.to_user.notifications.mark_all_as_read()
+        with CaptureQueriesContext(connections['replica']) as context:
+            with read_from_replica(self.to_user):
+                self.to_user.notifications.unread().count()
+        self.assertTrue(context.captured_queries)
+
+
 class NotificationTestPages(TestCase):
     ''' Django notifications automated page tests '''
     def setUp(self):
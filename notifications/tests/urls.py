@@ -9,13 +9,14 @@ from packaging.version import (
 from notifications.tests.views import (
     live_tester,  # pylint: disable=no-name-in-module,import-error
 )
-from notifications.tests.views import make_notification
+from notifications.tests.views import make_notification, make_notification_async
 
 if parse_version(get_version()) >= parse_version('2.1'):
     from django.contrib.auth.views import LoginView
     from django.urls import include, path  # noqa
     urlpatterns = [
         path('test_make/', make_notification),
+        path('test_make_async/', make_notification_async),
         path('test/', live_tester),
         path('login/', LoginView.as_view(), name='login'),  # reverse for django login is not working
         path('admin/', admin.site.urls),
@@ -26,6 +27,7 @@ elif parse_version(get_version()) >= parse_version('2.0') and parse_version(get_
     from django.urls import include, path  # noqa
     urlpatterns = [
         path('test_make/', make_notification),
+        path('test_make_async/', make_notification_async),
         path('test/', live_tester),
         path('login/', login, name='login'),  # reverse for django login is not working
         path('admin/', admin.site.urls),
@@ -37,6 +39,7 @@ else:
     urlpatterns = [
         url(r'^login/$', login, name='login'),  # reverse for django login is not working
         url(r'^test_make/', make_notification),
+        url(r'^test_make_async/', make_notification_async),
         url(r'^test/', live_tester),
         url(r'^', include('notifications.urls', namespace='notifications')),
         url(r'^admin/', admin.site.urls),
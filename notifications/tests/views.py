@@ -2,8 +2,12 @@
 # -*- coding: utf-8 -*-
 import random
 
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user
 from django.contrib.auth.decorators import login_required
+from django.http import JsonResponse
 from django.shortcuts import render
+from notifications.base.models import anotify
 from notifications.signals import notify
 
 
@@ -29,3 +33,9 @@ def make_notification(request):
 
     notify.send(sender=request.user, recipient=request.user,
                 verb='you asked for a notification - you are ' + the_notification)
+
+
+async def make_notification_async(request):
+    user = await sync_to_async(get_user)(request)
+    notifications = await anotify(user, recipient=user, verb='you asked for an async notification')
+    return JsonResponse({'created': len(notifications)})
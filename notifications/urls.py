@@ -20,10 +20,17 @@ urlpatterns = [
     pattern(r'^mark-as-read/(?P<slug>\d+)/$', views.mark_as_read, name='mark_as_read'),
     pattern(r'^mark-as-unread/(?P<slug>\d+)/$', views.mark_as_unread, name='mark_as_unread'),
     pattern(r'^delete/(?P<slug>\d+)/$', views.delete, name='delete'),
+    pattern(r'^api/mark_as_read/$', views.bulk_mark_as_read, name='bulk_mark_as_read'),
+    pattern(r'^api/mark_as_unread/$', views.bulk_mark_as_unread, name='bulk_mark_as_unread'),
+    pattern(r'^api/delete/$', views.bulk_delete, name='bulk_delete'),
     pattern(r'^api/unread_count/$', views.live_unread_notification_count, name='live_unread_notification_count'),
     pattern(r'^api/all_count/$', views.live_all_notification_count, name='live_all_notification_count'),
     pattern(r'^api/unread_list/$', views.live_unread_notification_list, name='live_unread_notification_list'),
     pattern(r'^api/all_list/', views.live_all_notification_list, name='live_all_notification_list'),
+    pattern(r'^api/unread_summary/$', views.live_unread_notification_summary,
+            name='live_unread_notification_summary'),
+    pattern(r'^api/changes/$', views.live_notification_changes, name='live_notification_changes'),
+    pattern(r'^api/stream/$', views.live_notification_stream, name='live_notification_stream'),
 ]
 
 app_name = 'notifications'
@@ -1,11 +1,18 @@
 '''' Django notifications utils file '''
 # -*- coding: utf-8 -*-
+import base64
 import sys
 
+from django.db.models import BigIntegerField, Case, Max, Min, Value, When
+from django.db.models.functions import Cast
+from django.utils.dateparse import parse_datetime
+
 
 if sys.version > '3':
     long = int  # pylint: disable=invalid-name
 
+OBJECT_ID_FIELDS = ('actor_object_id', 'target_object_id', 'action_object_object_id')
+
 
 def slug2id(slug):
     return long(slug) - 110909
@@ -13,3 +20,61 @@ def slug2id(slug):
 
 def id2slug(notification_id):
     return notification_id + 110909
+
+
+def encode_cursor(timestamp, notification_id, direction):
+    """
+    Return the opaque keyset pagination cursor of the page after (``'n'``)
+    or before (``'p'``) the notification with ``timestamp`` and ``id``.
+    """
+    value = '%s|%s|%s' % (direction, timestamp.isoformat(), notification_id)
+    return base64.urlsafe_b64encode(value.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Return the ``(direction, timestamp, id)`` of a cursor from
+    ``encode_cursor``, or raise ``ValueError``.
+    """
+    try:
+        value = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8')
+        direction, timestamp, notification_id = value.split('|')
+        timestamp = parse_datetime(timestamp)
+    except (TypeError, UnicodeDecodeError, ValueError) as error:
+        raise ValueError('Invalid cursor %r' % cursor) from error
+    if direction not in ('n', 'p') or timestamp is None:
+        raise ValueError('Invalid cursor %r' % cursor)
+    return direction, timestamp, long(notification_id)
+
+
+def copy_object_ids(model, fields=None, chunk_size=10000):
+    """
+    Return a ``RunPython`` function copying the text object ids of
+    ``model``, an ``'app_label.ModelName'`` label, to integer fields, by
+    chunks of ``chunk_size`` primary keys. ``fields`` maps the text fields
+    to the integer ones, by default each object id field to the same name
+    suffixed with ``_int``. The ids which are not integers are left empty.
+
+    Run it in a migration with ``atomic = False``, so that each chunk is
+    committed on its own.
+    """
+    if fields is None:
+        fields = {name: name + '_int' for name in OBJECT_ID_FIELDS}
+
+    def copy(apps, schema_editor):
+        manager = apps.get_model(model)._base_manager.db_manager(schema_editor.connection.alias)
+        values = {
+            target: Case(
+                When(**{source + '__regex': r'^-?[0-9]+$', 'then': Cast(source, BigIntegerField())}),
+                default=Value(None),
+                output_field=BigIntegerField(),
+            )
+            for source, target in fields.items()
+        }
+        start = manager.aggregate(first=Min('pk'))['first']
+        # The maximum is read again, to copy the rows created meanwhile
+        while start is not None and start <= manager.aggregate(last=Max('pk'))['last']:
+            manager.filter(pk__gte=start, pk__lt=start + chunk_size).update(**values)
+            start += chunk_size
+
+    return copy
@@ -1,13 +1,25 @@
 # -*- coding: utf-8 -*-
 ''' Django Notifications example views '''
+import asyncio
+import hashlib
+import json
+import time
+
+from asgiref.sync import sync_to_async
 from django import get_version
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.shortcuts import get_object_or_404, redirect
+from django.core.exceptions import PermissionDenied
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, StreamingHttpResponse
+from django.shortcuts import redirect
 from django.utils.decorators import method_decorator
+from django.utils.cache import patch_vary_headers
 from django.utils.encoding import iri_to_uri
 from django.utils.http import url_has_allowed_host_and_scheme
 from django.views.decorators.cache import never_cache
+from django.views.decorators.http import condition, require_POST
 from django.views.generic import ListView
 from packaging.version import (
     parse as parse_version,  # pylint: disable=no-name-in-module,import-error
@@ -15,7 +27,21 @@ from packaging.version import (
 from swapper import load_model
 
 from notifications import settings as notification_settings
-from notifications.helpers import get_notification_list
+from notifications.base.models import deliver_broadcasts
+from notifications.helpers import (
+    NotificationArchiveList,
+    get_archived_notifications,
+    get_change_log_cursor,
+    get_notification_changes,
+    get_notification_dict,
+    get_notification_page,
+    get_notifications_version,
+    get_unread_count,
+    paginate_by_keyset,
+)
+from notifications.routers import read_from_replica
+from notifications.serializers import encode_notification_list, get_list_media_type
+from notifications.streaming import RETRY, get_stream_backend
 from notifications.utils import slug2id
 
 Notification = load_model('notifications', 'Notification')
@@ -24,10 +50,6 @@ if parse_version(get_version()) >= parse_version('1.7.0'):
     from django.http import JsonResponse  # noqa
 else:
     # Django 1.6 doesn't have a proper JsonResponse
-    import json
-
-    from django.http import HttpResponse  # noqa
-
     def date_handler(obj):
         return obj.isoformat() if hasattr(obj, 'isoformat') else obj
 
@@ -47,6 +69,31 @@ class NotificationViewList(ListView):
         return super(NotificationViewList, self).dispatch(
             request, *args, **kwargs)
 
+    def get_archive(self):
+        """Return the archived notifications listed after the queryset, or ``None``."""
+        return None
+
+    def paginate_queryset(self, queryset, page_size):
+        archive = self.get_archive()
+        if not notification_settings.get_config()['KEYSET_PAGINATION']:
+            if archive is not None:
+                queryset = NotificationArchiveList(queryset, archive)
+            return super(NotificationViewList, self).paginate_queryset(queryset, page_size)
+        try:
+            notifications, self.next_cursor, self.previous_cursor = paginate_by_keyset(
+                queryset, self.request.GET.get('cursor'), page_size, archive=archive)
+        except ValueError as error:
+            raise Http404(str(error)) from error
+        is_paginated = bool(self.next_cursor or self.previous_cursor)
+        return (None, None, notifications, is_paginated)
+
+    def get_context_data(self, **kwargs):
+        context = super(NotificationViewList, self).get_context_data(**kwargs)
+        if notification_settings.get_config()['KEYSET_PAGINATION']:
+            context['next_cursor'] = getattr(self, 'next_cursor', None)
+            context['previous_cursor'] = getattr(self, 'previous_cursor', None)
+        return context
+
 
 class AllNotificationsList(NotificationViewList):
     """
@@ -54,17 +101,76 @@ class AllNotificationsList(NotificationViewList):
     """
 
     def get_queryset(self):
+        deliver_broadcasts(self.request.user)
         if notification_settings.get_config()['SOFT_DELETE']:
             qset = self.request.user.notifications.active()
         else:
             qset = self.request.user.notifications.all()
-        return qset
+        return qset.with_related_objects()
+
+    def get_archive(self):
+        archive = get_archived_notifications(
+            self.request.user, active=notification_settings.get_config()['SOFT_DELETE'])
+        return archive.with_related_objects() if archive is not None else None
 
 
 class UnreadNotificationsList(NotificationViewList):
 
     def get_queryset(self):
-        return self.request.user.notifications.unread()
+        deliver_broadcasts(self.request.user)
+        return self.request.user.notifications.unread().with_related_objects()
+
+
+def _delete_notifications(notifications):
+    if notification_settings.get_config()['SOFT_DELETE']:
+        return notifications.mark_all_as_deleted()
+    return notifications.delete()[0]
+
+
+def _get_notification_ids(request):
+    if request.content_type == 'application/json':
+        slugs = json.loads(request.body or '{}').get('slugs', [])
+    else:
+        slugs = request.POST.getlist('slug')
+    return [slug2id(slug) for slug in slugs]
+
+
+def _bulk_change(request, change):
+    try:
+        user_is_authenticated = request.user.is_authenticated()
+    except TypeError:  # Django >= 1.11
+        user_is_authenticated = request.user.is_authenticated
+
+    if not user_is_authenticated:
+        raise PermissionDenied
+    try:
+        notification_ids = _get_notification_ids(request)
+    except (AttributeError, TypeError, ValueError):
+        return HttpResponseBadRequest('Expected a list of notification slugs.')
+
+    # A single UPDATE (or DELETE) of the notifications of the user
+    count = change(request.user.notifications.filter(id__in=notification_ids)) if notification_ids else 0
+    if not request.accepts('application/json'):
+        return HttpResponse(status=204)
+    return JsonResponse({'count': count})
+
+
+@require_POST
+def bulk_mark_as_read(request):
+    ''' Mark the notifications with the posted slugs as read '''
+    return _bulk_change(request, lambda notifications: notifications.mark_all_as_read())
+
+
+@require_POST
+def bulk_mark_as_unread(request):
+    ''' Mark the notifications with the posted slugs as unread '''
+    return _bulk_change(request, lambda notifications: notifications.mark_all_as_unread())
+
+
+@require_POST
+def bulk_delete(request):
+    ''' Delete the notifications with the posted slugs '''
+    return _bulk_change(request, _delete_notifications)
 
 
 @login_required
@@ -82,9 +188,9 @@ def mark_all_as_read(request):
 def mark_as_read(request, slug=None):
     notification_id = slug2id(slug)
 
-    notification = get_object_or_404(
-        Notification, recipient=request.user, id=notification_id)
-    notification.mark_as_read()
+    notifications = request.user.notifications.filter(id=notification_id)
+    if not notifications.mark_all_as_read() and not notifications.exists():
+        raise Http404('No notification matches the given query.')
 
     _next = request.GET.get('next')
 
@@ -98,9 +204,9 @@ def mark_as_read(request, slug=None):
 def mark_as_unread(request, slug=None):
     notification_id = slug2id(slug)
 
-    notification = get_object_or_404(
-        Notification, recipient=request.user, id=notification_id)
-    notification.mark_as_unread()
+    notifications = request.user.notifications.filter(id=notification_id)
+    if not notifications.mark_all_as_unread() and not notifications.exists():
+        raise Http404('No notification matches the given query.')
 
     _next = request.GET.get('next')
 
@@ -114,14 +220,9 @@ def mark_as_unread(request, slug=None):
 def delete(request, slug=None):
     notification_id = slug2id(slug)
 
-    notification = get_object_or_404(
-        Notification, recipient=request.user, id=notification_id)
-
-    if notification_settings.get_config()['SOFT_DELETE']:
-        notification.deleted = True
-        notification.save()
-    else:
-        notification.delete()
+    notifications = request.user.notifications.filter(id=notification_id)
+    if not _delete_notifications(notifications) and not notifications.exists():
+        raise Http404('No notification matches the given query.')
 
     _next = request.GET.get('next')
 
@@ -131,7 +232,36 @@ def delete(request, slug=None):
     return redirect('notifications:all')
 
 
+def live_etag(request, *args, **kwargs):  # pylint: disable=unused-argument
+    '''
+    Return the ETag of the live API responses when USE_ETAG is on, which
+    changes whenever the notifications of the user change, so that polls
+    answer 304 when nothing did without querying the notifications.
+    '''
+    if not notification_settings.get_config()['USE_ETAG']:
+        return None
+    try:
+        user_is_authenticated = request.user.is_authenticated()
+    except TypeError:  # Django >= 1.11
+        user_is_authenticated = request.user.is_authenticated
+
+    if not user_is_authenticated:
+        return None
+    # Sending a broadcast changes the version of every user, the views
+    # deliver it
+    version = get_notifications_version(request.user)
+    if version is None:
+        return None
+    # The version changes on commit, the change log cursor CHANGE_LOG_LAG
+    # seconds later: the changes and cursors sent in between must not be
+    # answered with 304 afterwards
+    return hashlib.md5(('%s:%s:%s:%s' % (
+        version, get_change_log_cursor(), request.get_full_path(), get_list_media_type(request),
+    )).encode('utf-8')).hexdigest()
+
+
 @never_cache
+@condition(etag_func=live_etag)
 def live_unread_notification_count(request):
     try:
         user_is_authenticated = request.user.is_authenticated()
@@ -143,13 +273,16 @@ def live_unread_notification_count(request):
             'unread_count': 0
         }
     else:
-        data = {
-            'unread_count': request.user.notifications.unread().count(),
-        }
+        deliver_broadcasts(request.user)
+        with read_from_replica(request.user):
+            data = {
+                'unread_count': get_unread_count(request.user),
+            }
     return JsonResponse(data)
 
 
 @never_cache
+@condition(etag_func=live_etag)
 def live_unread_notification_list(request):
     ''' Return a json with a unread notification list '''
     try:
@@ -164,16 +297,34 @@ def live_unread_notification_list(request):
         }
         return JsonResponse(data)
 
-    unread_list = get_notification_list(request, 'unread')
+    deliver_broadcasts(request.user)
+    with read_from_replica(request.user):
+        cursor = get_change_log_cursor()
+        unread_list, next_cursor, previous_cursor, unread_count = get_notification_page(request, 'unread')
+        if unread_count is None:
+            unread_count = get_unread_count(request.user)
+
+    media_type = get_list_media_type(request)
+    unread_list, columns = encode_notification_list(unread_list, media_type)
 
     data = {
-        'unread_count': request.user.notifications.unread().count(),
+        'unread_count': unread_count,
         'unread_list': unread_list
     }
-    return JsonResponse(data)
+    if columns is not None:
+        data['columns'] = columns
+    if cursor is not None:
+        data['cursor'] = cursor
+    if notification_settings.get_config()['KEYSET_PAGINATION']:
+        data['next_cursor'] = next_cursor
+        data['previous_cursor'] = previous_cursor
+    response = JsonResponse(data, content_type=media_type)
+    patch_vary_headers(response, ('Accept',))
+    return response
 
 
 @never_cache
+@condition(etag_func=live_etag)
 def live_all_notification_list(request):
     ''' Return a json with a unread notification list '''
     try:
@@ -188,15 +339,33 @@ def live_all_notification_list(request):
         }
         return JsonResponse(data)
 
-    all_list = get_notification_list(request)
+    deliver_broadcasts(request.user)
+    with read_from_replica(request.user):
+        cursor = get_change_log_cursor()
+        all_list, next_cursor, previous_cursor, all_count = get_notification_page(request)
+        if all_count is None:
+            all_count = request.user.notifications.count()
+
+    media_type = get_list_media_type(request)
+    all_list, columns = encode_notification_list(all_list, media_type)
 
     data = {
-        'all_count': request.user.notifications.count(),
+        'all_count': all_count,
         'all_list': all_list
     }
-    return JsonResponse(data)
-
-
+    if columns is not None:
+        data['columns'] = columns
+    if cursor is not None:
+        data['cursor'] = cursor
+    if notification_settings.get_config()['KEYSET_PAGINATION']:
+        data['next_cursor'] = next_cursor
+        data['previous_cursor'] = previous_cursor
+    response = JsonResponse(data, content_type=media_type)
+    patch_vary_headers(response, ('Accept',))
+    return response
+
+
+@condition(etag_func=live_etag)
 def live_all_notification_count(request):
     try:
         user_is_authenticated = request.user.is_authenticated()
@@ -208,7 +377,144 @@ def live_all_notification_count(request):
             'all_count': 0
         }
     else:
+        deliver_broadcasts(request.user)
+        with read_from_replica(request.user):
+            data = {
+                'all_count': request.user.notifications.count(),
+            }
+    return JsonResponse(data)
+
+
+@never_cache
+@condition(etag_func=live_etag)
+def live_unread_notification_summary(request):
+    ''' Return a json with the unread count per level and per verb '''
+    try:
+        user_is_authenticated = request.user.is_authenticated()
+    except TypeError:  # Django >= 1.11
+        user_is_authenticated = request.user.is_authenticated
+
+    if not user_is_authenticated:
+        summary = Notification.objects.none().summary()
+    else:
+        deliver_broadcasts(request.user)
+        with read_from_replica(request.user):
+            summary = request.user.notifications.unread_summary()
+
+    data = {
+        'unread_count': summary['total'],
+        'levels': summary['levels'],
+        'verbs': summary['verbs'],
+    }
+    return JsonResponse(data)
+
+
+@never_cache
+@condition(etag_func=live_etag)
+def live_notification_changes(request):
+    ''' Return a json with the changes of the notifications since a cursor '''
+    try:
+        user_is_authenticated = request.user.is_authenticated()
+    except TypeError:  # Django >= 1.11
+        user_is_authenticated = request.user.is_authenticated
+
+    if not notification_settings.get_config()['USE_CHANGE_LOG']:
+        raise Http404('The change log is not enabled.')
+
+    if not user_is_authenticated:
         data = {
-            'all_count': request.user.notifications.count(),
+            'cursor': 0,
+            'reset': True,
+            'changed': [],
+            'deleted': []
         }
+        return JsonResponse(data)
+
+    deliver_broadcasts(request.user)
+    data = get_notification_changes(request)
+    data['unread_count'] = get_unread_count(request.user)
     return JsonResponse(data)
+
+
+def _sse(event, data):
+    return 'event: %s\ndata: %s\n\n' % (event, json.dumps(data, cls=DjangoJSONEncoder))
+
+
+def _get_stream_user(request):
+    try:
+        user_is_authenticated = request.user.is_authenticated()
+    except TypeError:  # Django >= 1.11
+        user_is_authenticated = request.user.is_authenticated
+    return request.user if user_is_authenticated else None
+
+
+def _stream_snapshot(user):
+    deliver_broadcasts(user)
+    return _sse('unread_count', {'unread_count': get_unread_count(user)})
+
+
+def _stream_event(request, user, event):
+    chunks = []
+    if event['action'] in ('created', 'updated') and event['notifications']:
+        notifications = user.notifications.filter(pk__in=event['notifications']).with_related_objects()
+        for notification in notifications:
+            chunks.append(_sse('notification', get_notification_dict(notification, request)))
+    chunks.append(_sse('unread_count', {'unread_count': get_unread_count(user)}))
+    return ''.join(chunks)
+
+
+def _stream(request, user, backend):
+    config = notification_settings.get_config()
+    # Subscribe first not to miss the changes made while sending the count
+    subscription = backend.subscribe(user.pk)
+    try:
+        yield 'retry: %d\n\n' % RETRY
+        yield _stream_snapshot(user)
+        deadline = time.monotonic() + config['STREAM_TIMEOUT']
+        while time.monotonic() < deadline:
+            event = subscription.get(min(config['STREAM_HEARTBEAT'], deadline - time.monotonic()))
+            yield ': heartbeat\n\n' if event is None else _stream_event(request, user, event)
+    finally:
+        subscription.close()
+
+
+async def _astream(request, user, backend):
+    config = notification_settings.get_config()
+    subscription = backend.subscribe(user.pk, asyncio.get_running_loop())
+    try:
+        yield 'retry: %d\n\n' % RETRY
+        yield await sync_to_async(_stream_snapshot)(user)
+        deadline = time.monotonic() + config['STREAM_TIMEOUT']
+        while time.monotonic() < deadline:
+            event = await subscription.aget(min(config['STREAM_HEARTBEAT'], deadline - time.monotonic()))
+            if event is None:
+                yield ': heartbeat\n\n'
+            else:
+                yield await sync_to_async(_stream_event)(request, user, event)
+    finally:
+        subscription.close()
+
+
+async def live_notification_stream(request):
+    '''
+    Stream the unread count, and the new notifications, of the user as
+    server-sent events, until ``STREAM_TIMEOUT`` after which browsers
+    reconnect. Requires ``STREAM_BACKEND``, and Django 4.2 under ASGI.
+    '''
+    backend = get_stream_backend()
+    if backend is None:
+        raise Http404('No stream backend is configured.')
+    asgi = isinstance(request, ASGIRequest)
+    if asgi and parse_version(get_version()) < parse_version('4.2'):
+        # StreamingHttpResponse would iterate the stream on the event loop
+        raise Http404('Streaming under ASGI requires Django 4.2.')
+    user = await sync_to_async(_get_stream_user)(request)
+    if user is None:
+        raise PermissionDenied
+
+    # Under WSGI, the response is iterated by the worker thread
+    content = _astream(request, user, backend) if asgi else _stream(request, user, backend)
+    response = StreamingHttpResponse(content, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -34,6 +34,9 @@ setup(
         'swapper',
         "packaging"
     ],
+    extras_require={
+        'channels': ['channels>=3.0'],
+    },
     test_requires=[
         'django>=3.2',
         'django-model-utils>=3.1.0',
@@ -45,6 +48,8 @@ setup(
         'notifications.base',
         'notifications.templatetags',
         'notifications.migrations',
+        'notifications.management',
+        'notifications.management.commands',
     ],
     include_package_data=True,
     classifiers=[
@@ -58,6 +63,7 @@ setup(
         'Framework :: Django :: 3.2',
         'Framework :: Django :: 4.0',
         'Framework :: Django :: 4.1',
+        'Framework :: Django :: 4.2',
         # Specify the Python versions you support here. In particular, ensure
         # that you indicate whether you support Python 2, Python 3 or both.
         'Programming Language :: Python',